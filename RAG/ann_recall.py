@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Rapport recall@k de l'index IVF face à la recherche exacte (backend numpy).
+
+Pour chaque nprobe testé: recall@k moyen, latence p50/p95 par requête et accélération
+par rapport à la recherche exacte. Les requêtes sont des citations du corpus (hors
+elles-mêmes) pour refléter la distribution réelle des embeddings.
+La référence exacte est toujours en float32; --dtype mesure l'IVF sur vecteurs compressés.
+
+Usage:
+  python ann_recall.py --dataset ../2000_citations_hasard.json --nprobe 1 2 4 8 16 32
+  python ann_recall.py --datasets ... --nlist 1024 --json recall.json
+  python ann_recall.py --datasets ... --dtype int8
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+from corpus import Corpus, compile_quotes
+from indexer import CITATIONS_PATH, EMBEDDER_MODEL, load_citations
+from vector_store import VECTOR_DTYPE, VECTOR_DTYPES, IvfStore, NumpyStore
+
+
+def load_encoder():
+    cache = EmbeddingCache(EMBEDDER_MODEL)
+    embedder = None
+
+    def encode_missing(texts):
+        nonlocal embedder
+        if embedder is None:
+            from sentence_transformers import SentenceTransformer
+            embedder = SentenceTransformer(EMBEDDER_MODEL)
+        return embedder.encode(texts, show_progress_bar=False)
+
+    return lambda texts: cache.encode(texts, encode_missing)
+
+
+def timed_search(store, queries: np.ndarray, top_k: int, excluded: List[set]):
+    results, latencies = [], []
+    for i in range(len(queries)):
+        t0 = time.perf_counter()
+        results.extend(store.search(queries[i:i + 1], top_k, [excluded[i]]))
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return results, latencies
+
+
+def evaluate(citations: Corpus, encode, nlist: int, nprobes: List[int], top_k: int,
+             n_queries: int, seed: int, dtype: str = VECTOR_DTYPE) -> List[Dict]:
+    exact = NumpyStore(dtype="float32")
+    exact.sync(citations, encode)
+
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(exact), min(n_queries, len(exact)), replace=False)
+    state = exact._state
+    queries = state["matrix"][picks]
+    # La citation source est exclue: sinon elle serait trivialement en tête
+    excluded = [{state["ids"][i]} for i in picks]
+
+    truth, exact_latencies = timed_search(exact, queries, top_k, excluded)
+    exact_p50 = float(np.percentile(exact_latencies, 50))
+
+    ivf = IvfStore(nlist=nlist, index_dir=None, seed=seed, dtype=dtype)
+    t0 = time.perf_counter()
+    ivf.sync(citations, encode)
+    build_seconds = time.perf_counter() - t0
+
+    rows = []
+    for nprobe in nprobes:
+        ivf.nprobe = nprobe
+        approx, latencies = timed_search(ivf, queries, top_k, excluded)
+        recall = np.mean([
+            len({h[0] for h in a} & {h[0] for h in t}) / max(1, len(t))
+            for a, t in zip(approx, truth)
+        ])
+        p50 = float(np.percentile(latencies, 50))
+        rows.append({
+            "citations": len(exact),
+            "dtype": dtype,
+            "nlist": len(ivf._state["centroids"]),
+            "nprobe": nprobe,
+            f"recall@{top_k}": round(float(recall), 4),
+            "p50_ms": round(p50, 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "exact_p50_ms": round(exact_p50, 3),
+            "speedup": round(exact_p50 / p50, 2) if p50 else 0.0,
+            "build_seconds": round(build_seconds, 2),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k IVF vs recherche exacte")
+    parser.add_argument("--datasets", nargs="*", default=[str(CITATIONS_PATH)])
+    parser.add_argument("--nlist", type=int, default=0, help="0 = auto (4·√n)")
+    parser.add_argument("--nprobe", type=int, nargs="*", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--dtype", default=VECTOR_DTYPE, choices=VECTOR_DTYPES, help="Stockage des vecteurs de l'IVF")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Écrit les résultats dans ce fichier")
+    args = parser.parse_args()
+
+    # Plusieurs datasets = un seul index fusionné (cas cible: 100k+ citations)
+    quotes: List[Dict] = []
+    for path in args.datasets:
+        corpus, _ = load_citations(Path(path))
+        quotes.extend({**quote, "id": f"{Path(path).stem}:{quote['id']}"} for quote in corpus)
+    citations = compile_quotes(quotes)
+    print(f"🔄 {len(citations)} citations, encodage via le cache...", file=sys.stderr)
+
+    rows = evaluate(citations, load_encoder(), args.nlist, args.nprobe, args.top_k, args.queries, args.seed,
+                    args.dtype)
+
+    recall_key = f"recall@{args.top_k}"
+    header = f"{'n':>8} {'nlist':>6} {'nprobe':>6} {recall_key:>10} {'p50 ms':>8} {'p95 ms':>8} {'exact ms':>9} {'speedup':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['citations']:>8} {r['nlist']:>6} {r['nprobe']:>6} {r[recall_key]:>10} "
+              f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['exact_p50_ms']:>9} {r['speedup']:>8}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
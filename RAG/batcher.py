@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Micro-batching des requêtes d'encodage concurrentes.
+
+Les requêtes arrivant dans une fenêtre de quelques millisecondes (ou jusqu'à
+max_batch éléments) sont encodées en un seul appel, puis chaque appelant
+récupère sa ligne. Un seul thread exécute l'encodeur.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+# Bornes supérieures des classes de l'histogramme des tailles de lots
+HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class MicroBatcher:
+    """Regroupe les appels concurrents à submit() en lots pour encode_fn."""
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_wait_ms: float = 5.0,
+        max_batch: int = 32
+    ):
+        self.encode_fn = encode_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.batches = 0
+        self.items = 0
+        self.histogram = {str(b): 0 for b in HISTOGRAM_BUCKETS}
+        self.histogram["+Inf"] = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+
+    def _ensure_worker(self):
+        # Les threads ne survivent pas à un fork: (re)démarrer le worker dans chaque processus
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._worker.start()
+
+    def submit(self, text: str) -> np.ndarray:
+        """Encode un texte via le prochain lot et attend le résultat."""
+        if self.max_wait <= 0 and self.max_batch == 1:
+            return self.encode_fn([text])[0]
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Dédoublonner les textes identiques au sein d'un même lot
+            unique: Dict[str, int] = {}
+            for text, _ in batch:
+                unique.setdefault(text, len(unique))
+            try:
+                embeddings = self.encode_fn(list(unique))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self._record(len(batch))
+            for text, future in batch:
+                future.set_result(embeddings[unique[text]])
+
+    def _record(self, size: int):
+        with self._lock:
+            self.batches += 1
+            self.items += size
+            for bound in HISTOGRAM_BUCKETS:
+                if size <= bound:
+                    self.histogram[str(bound)] += 1
+                    break
+            else:
+                self.histogram["+Inf"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_wait_ms": self.max_wait * 1000.0,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "batch_size_histogram": dict(self.histogram),
+            }
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Benchmark des backends vectoriels (chroma, numpy, ivf) sur les datasets du repo.
+
+Pour chaque (dataset, backend), un sous-processus dédié mesure:
+- le temps d'import + construction de l'index
+- la RSS ajoutée par le backend (hors modèle: les embeddings viennent du cache disque)
+  et, pour numpy / ivf, par format de stockage des vecteurs (--dtypes float32 float16 int8)
+- la latence par requête (p50/p95, avec 30 IDs exclus comme rag.js) et en lot
+
+Usage:
+  python bench_vector_store.py
+  python bench_vector_store.py --backends numpy --queries 500 --json bench.json
+  python bench_vector_store.py --backends chroma numpy ivf --dtypes float32 float16 int8
+"""
+
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from corpus import Corpus
+from embedding_cache import EmbeddingCache
+from indexer import CITATIONS_PATH, EMBEDDER_MODEL, load_citations
+
+RAG_DIR = Path(__file__).resolve().parent
+DATASETS = [
+    CITATIONS_PATH,
+    RAG_DIR / "gpt_quotes_rag.json",
+    RAG_DIR / "quotekg_citations.json",
+]
+EXCLUDED_PER_QUERY = 30  # Historique "déjà vues" envoyé par rag.js
+
+
+def current_rss_mb() -> float:
+    """RSS courante (Linux: /proc), sinon pic de RSS."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values: List[float], p: float) -> float:
+    return float(np.percentile(values, p)) if values else 0.0
+
+
+def sample_queries(citations: Corpus, n: int, seed: int) -> List[str]:
+    """Requêtes de test: textes originaux de citations tirées au hasard."""
+    rng = random.Random(seed)
+    texts = [t for t in citations.strings("text") if t]
+    return [rng.choice(texts) for _ in range(n)]
+
+
+def prepare(dataset: Path, n_queries: int, seed: int):
+    """Encode corpus + requêtes une fois (dans le cache) pour que les sous-processus n'aient pas à charger le modèle."""
+    citations, _ = load_citations(dataset)
+    enriched_texts = citations.enriched_texts()
+    queries = sample_queries(citations, n_queries, seed)
+
+    cache = EmbeddingCache(EMBEDDER_MODEL)
+    embedder = None
+
+    def encode(texts):
+        nonlocal embedder
+        if embedder is None:
+            from sentence_transformers import SentenceTransformer
+            embedder = SentenceTransformer(EMBEDDER_MODEL)
+        return embedder.encode(texts, show_progress_bar=False)
+
+    cache.encode(enriched_texts, encode)
+    cache.encode(queries, encode)
+
+
+def run_child(backend: str, dataset: Path, n_queries: int, top_k: int, seed: int, dtype: str) -> Dict:
+    """Mesures pour un backend, dans un processus neuf."""
+    citations, corpus_hash = load_citations(dataset)
+    queries = sample_queries(citations, n_queries, seed)
+    cache = EmbeddingCache(EMBEDDER_MODEL)
+
+    def cached_only(texts):
+        raise RuntimeError(f"{len(texts)} textes absents du cache: lancer sans --child d'abord")
+
+    query_embeddings = cache.encode(queries, cached_only)
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    from vector_store import ChromaStore, IvfStore, NumpyStore
+    if backend == "chroma":
+        store = ChromaStore(persist=False)
+    elif backend == "ivf":
+        store = IvfStore(index_dir=None, dtype=dtype)
+    else:
+        store = NumpyStore(dtype=dtype)
+    store.sync(citations, lambda texts: cache.encode(texts, cached_only), corpus_hash)
+    build_seconds = time.perf_counter() - start
+    rss_after = current_rss_mb()
+
+    rng = random.Random(seed)
+    all_ids = sorted(store.ids)
+    excluded = [set(rng.sample(all_ids, min(EXCLUDED_PER_QUERY, len(all_ids)))) for _ in queries]
+
+    latencies = []
+    for i in range(len(queries)):
+        t0 = time.perf_counter()
+        store.search(query_embeddings[i:i + 1], top_k, [excluded[i]])
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    store.search(query_embeddings, top_k, excluded)
+    batch_ms = (time.perf_counter() - t0) * 1000
+
+    return {
+        "dataset": dataset.name,
+        "backend": backend,
+        "dtype": dtype if backend != "chroma" else "float32",
+        "citations": len(store),
+        "build_seconds": round(build_seconds, 3),
+        "rss_mb": round(rss_after - rss_before, 1),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "batch_ms_per_query": round(batch_ms / max(1, len(queries)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chroma / numpy / ivf")
+    parser.add_argument("--datasets", nargs="*", default=[str(p) for p in DATASETS])
+    parser.add_argument("--backends", nargs="*", default=["chroma", "numpy"])
+    parser.add_argument("--dtypes", nargs="*", default=["float32"], choices=["float32", "float16", "int8"],
+                        help="Formats de stockage des vecteurs testés pour numpy / ivf")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Écrit les résultats dans ce fichier")
+    parser.add_argument("--child", nargs=3, metavar=("BACKEND", "DATASET", "DTYPE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        backend, dataset, dtype = args.child
+        print(json.dumps(run_child(backend, Path(dataset), args.queries, args.top_k, args.seed, dtype)))
+        return
+
+    rows = []
+    for dataset in map(Path, args.datasets):
+        if not dataset.exists():
+            print(f"⚠️  Dataset absent, ignoré: {dataset}", file=sys.stderr)
+            continue
+        print(f"🔄 Préparation des embeddings: {dataset.name}", file=sys.stderr)
+        prepare(dataset, args.queries, args.seed)
+        runs = [(b, d) for b in args.backends for d in (["float32"] if b == "chroma" else args.dtypes)]
+        for backend, dtype in runs:
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", backend, str(dataset), dtype,
+                 "--queries", str(args.queries), "--top-k", str(args.top_k), "--seed", str(args.seed)],
+                check=True, capture_output=True, text=True, cwd=RAG_DIR
+            )
+            rows.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    header = f"{'dataset':<28} {'backend':<8} {'dtype':<8} {'n':>6} {'build s':>8} {'RSS MB':>8} {'p50 ms':>8} {'p95 ms':>8} {'batch ms/q':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['dataset']:<28} {r['backend']:<8} {r['dtype']:<8} {r['citations']:>6} {r['build_seconds']:>8} "
+              f"{r['rss_mb']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['batch_ms_per_query']:>10}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Benchmark hors ligne de la recherche: qualité (recall@k, MRR, nDCG@k) et performance
+(latence p50/p95/p99, débit), sans interaction. Remplace l'évaluation manuelle de test_rag.py.
+
+Chaque requête suit exactement le chemin de POST /search: rag_server.init() (modèle, corpus,
+index persistant), parse_search_spec, embed_query (cache + micro-batcher) puis run_search
+(backend vectoriel, filtres, reranking si RAG_RERANK=1). La configuration se règle donc avec
+les mêmes variables d'environnement que le serveur (RAG_VECTOR_BACKEND, RAG_VECTOR_DTYPE,
+RAG_EMBEDDER_BACKEND, RAG_RERANK...). L'index est construit dans un répertoire privé
+(temporaire, ou --index-dir pour le garder entre deux runs), jamais dans celui du serveur:
+init() synchronise l'index persistant sur le corpus du benchmark.
+
+Requêtes: test_queries.json, liste d'objets
+  {"query": "...", "relevant": {"<id>": 3, "<id>": 1}, "filters": {...}, "exclude_ids": [...]}
+"relevant" donne la pertinence graduée de chaque citation (0 = non pertinente); une liste d'IDs
+vaut pertinence 1. Les requêtes sans "relevant" ne comptent que pour la latence.
+Les métriques de qualité ne viennent que de ce fichier annoté: il est obligatoire, sauf --known-items.
+
+--known-items N ajoute N requêtes "citation connue" tirées du corpus (le contexte d'une citation,
+qui doit la retrouver). Ce contexte fait partie du texte indexé: c'est une auto-recherche, utile
+comme contrôle de fumée (index cassé, filtres, latence) mais pas comme mesure de qualité. Ses
+scores sont rapportés à part ("smoke"), jamais mêlés aux métriques des requêtes annotées.
+
+Les requêtes sont jouées sans cache de requêtes (latence à froid), sauf --warm-cache.
+Les résultats (configuration, métriques globales, détail par requête) sont écrits avec --json;
+--compare affiche l'écart avec un run précédent.
+
+Usage:
+  python benchmark.py --known-items 200
+  python benchmark.py --queries-file test_queries.json --k 1 5 10 --json run.json
+  RAG_VECTOR_DTYPE=int8 python benchmark.py --concurrency 8 --json int8.json --compare run.json
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+QUERIES_FILE = Path(__file__).resolve().parent / "test_queries.json"
+WARMUP_QUERIES = 5
+
+
+def load_labeled_queries(path: Path) -> List[Dict]:
+    """Requêtes de test normalisées: relevant = {id: pertinence} (None si non annotée)."""
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    queries = []
+    for item in items:
+        if not item.get("query"):
+            continue
+        relevant = item.get("relevant")
+        if isinstance(relevant, list):
+            relevant = {str(qid): 1 for qid in relevant}
+        elif isinstance(relevant, dict):
+            relevant = {str(qid): float(grade) for qid, grade in relevant.items()}
+        queries.append({
+            "query": item["query"],
+            "relevant": relevant or None,
+            "filters": item.get("filters"),
+            "exclude_ids": item.get("exclude_ids", []),
+            "synthetic": False,
+        })
+    return queries
+
+
+def known_item_queries(corpus, n: int, seed: int) -> List[Dict]:
+    """Requêtes "citation connue": le contexte d'une citation, qui doit la retrouver (contrôle de fumée)."""
+    candidates = [i for i in range(len(corpus)) if corpus.string("context", i)]
+    rng = random.Random(seed)
+    picks = rng.sample(candidates, min(n, len(candidates)))
+    return [
+        {"query": corpus.string("context", i), "relevant": {corpus.ids[i]: 1}, "filters": None, "exclude_ids": [],
+         "synthetic": True}
+        for i in picks
+    ]
+
+
+def dcg(grades: List[float]) -> float:
+    return sum((2 ** g - 1) / math.log2(rank + 2) for rank, g in enumerate(grades))
+
+
+def quality(ranked_ids: List[str], relevant: Dict[str, float], ks: List[int]) -> Dict[str, float]:
+    """recall@k, nDCG@k (gain 2^g - 1) et reciprocal rank d'une requête."""
+    positives = {qid for qid, grade in relevant.items() if grade > 0}
+    ideal = sorted(relevant.values(), reverse=True)
+    first = next((rank for rank, qid in enumerate(ranked_ids) if qid in positives), None)
+    out = {"rr": 0.0 if first is None else 1.0 / (first + 1)}
+    for k in ks:
+        top = ranked_ids[:k]
+        out[f"recall@{k}"] = len(positives & set(top)) / max(1, len(positives))
+        ideal_dcg = dcg(ideal[:k])
+        out[f"ndcg@{k}"] = dcg([relevant.get(qid, 0.0) for qid in top]) / ideal_dcg if ideal_dcg > 0 else 0.0
+    return out
+
+
+def run(rag_server, queries: List[Dict], top_k: int, concurrency: int) -> List[Dict]:
+    """Joue les requêtes comme POST /search; latence mesurée par requête, de bout en bout."""
+    def one(item: Dict) -> Dict:
+        spec = rag_server.parse_search_spec({**item, "top_k": top_k})
+        t0 = time.perf_counter()
+        results = rag_server.run_search([rag_server.embed_query(spec[0])], [spec])[0][0]
+        return {"latency_ms": (time.perf_counter() - t0) * 1000, "ids": [r["id"] for r in results]}
+
+    if concurrency <= 1:
+        return [one(item) for item in queries]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, queries))
+
+
+def summarize(queries: List[Dict], outcomes: List[Dict], ks: List[int], wall_seconds: float) -> Dict:
+    """Qualité sur la première passe (les suivantes renvoient les mêmes résultats), latence sur toutes."""
+    latencies = [o["latency_ms"] for o in outcomes]
+    per_query = []
+    for item, outcome in zip(queries, outcomes[:len(queries)]):
+        row = {"query": item["query"], "latency_ms": round(outcome["latency_ms"], 3), "ids": outcome["ids"]}
+        if item["synthetic"]:
+            row["synthetic"] = True
+        if item["relevant"]:
+            row.update({key: round(value, 4) for key, value in quality(outcome["ids"], item["relevant"], ks).items()})
+        per_query.append(row)
+
+    labeled = [row for row in per_query if "rr" in row and not row.get("synthetic")]
+    smoke = [row for row in per_query if "rr" in row and row.get("synthetic")]
+    metrics = {"labeled_queries": len(labeled), **mean_quality(labeled, ks)}
+    performance = {
+        "queries": len(outcomes),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "mean_ms": round(float(np.mean(latencies)), 3),
+        "throughput_qps": round(len(outcomes) / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+    }
+    report = {"metrics": metrics, "performance": performance, "per_query": per_query}
+    if smoke:
+        report["smoke"] = {"queries": len(smoke), **mean_quality(smoke, ks)}
+    return report
+
+
+def mean_quality(rows: List[Dict], ks: List[int]) -> Dict[str, float]:
+    """MRR, recall@k et nDCG@k moyens d'un ensemble de requêtes."""
+    if not rows:
+        return {}
+    out = {"mrr": round(float(np.mean([row["rr"] for row in rows])), 4)}
+    for k in ks:
+        out[f"recall@{k}"] = round(float(np.mean([row[f"recall@{k}"] for row in rows])), 4)
+        out[f"ndcg@{k}"] = round(float(np.mean([row[f"ndcg@{k}"] for row in rows])), 4)
+    return out
+
+
+def print_report(report: Dict, baseline: Optional[Dict] = None):
+    """Tableau des métriques, avec l'écart au run de référence s'il est fourni."""
+    print(f"\n{report['config']['queries']} requêtes ({report['metrics']['labeled_queries']} annotées), "
+          f"corpus {report['config']['dataset']} ({report['config']['citations']} citations)")
+    rows = [*report["metrics"].items(), *report["performance"].items()]
+    for key, value in rows:
+        if key in ("labeled_queries", "queries"):
+            continue
+        line = f"  {key:<16} {value:>10}"
+        previous = baseline and {**baseline.get("metrics", {}), **baseline.get("performance", {})}.get(key)
+        if isinstance(previous, (int, float)):
+            line += f"   ({value - previous:+.4g} vs {previous})"
+        print(line)
+    if "smoke" in report:
+        print(f"\n  Contrôle de fumée, {report['smoke']['queries']} requêtes \"citation connue\" "
+              f"(auto-recherche, pas une mesure de qualité):")
+        print("  " + ", ".join(f"{key} {value}" for key, value in report["smoke"].items() if key != "queries"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne qualité + latence du chemin de recherche")
+    parser.add_argument("--queries-file", default=str(QUERIES_FILE), help="Requêtes annotées (JSON)")
+    parser.add_argument("--known-items", type=int, default=0,
+                        help="Ajoute N requêtes tirées du corpus (contrôle de fumée, pas une mesure de qualité)")
+    parser.add_argument("--dataset", help="Corpus à indexer (défaut: celui du serveur)")
+    parser.add_argument("--index-dir",
+                        help="Index persistant propre au benchmark (défaut: répertoire temporaire supprimé en fin de run)")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10], help="Valeurs de k pour recall / nDCG")
+    parser.add_argument("--repeat", type=int, default=1, help="Passes de mesure (latences cumulées)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requêtes simultanées (threads)")
+    parser.add_argument("--warm-cache", action="store_true", help="Garde le cache des embeddings de requêtes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Écrit les résultats dans ce fichier")
+    parser.add_argument("--compare", help="Résultats JSON d'un run précédent à comparer")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Avant l'import de rag_server (INDEX_DIR est lu à l'import): l'index du serveur n'est pas touché
+    index_dir = args.index_dir or tempfile.mkdtemp(prefix="rag-benchmark-")
+    os.environ["RAG_INDEX_DIR"] = index_dir
+    try:
+        benchmark(args)
+    finally:
+        if not args.index_dir:
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+
+def benchmark(args):
+    import rag_server
+    from query_cache import TTLCache
+
+    if args.dataset:
+        rag_server.CITATIONS_PATH = Path(args.dataset)
+    rag_server.init()
+
+    queries_file = Path(args.queries_file)
+    queries = load_labeled_queries(queries_file) if queries_file.exists() else []
+    if not queries and not args.known_items:
+        print(f"❌ Aucune requête annotée ({queries_file}); --known-items N pour un simple contrôle de fumée",
+              file=sys.stderr)
+        sys.exit(1)
+    if args.known_items:
+        print("⚠️  Requêtes \"citation connue\": leur contexte fait partie du texte indexé, "
+              "scores rapportés à part (contrôle de fumée)", file=sys.stderr)
+    queries += known_item_queries(rag_server.citations, args.known_items, args.seed)
+    if not queries:
+        print("❌ Aucune requête (corpus sans contexte)", file=sys.stderr)
+        sys.exit(1)
+    ks = sorted(set(args.k))
+
+    print(f"🔄 {len(queries)} requêtes, échauffement...", file=sys.stderr)
+    run(rag_server, queries[:WARMUP_QUERIES], max(ks), 1)
+
+    outcomes, wall_seconds = [], 0.0
+    for _ in range(max(1, args.repeat)):
+        if not args.warm_cache:
+            rag_server.query_cache = TTLCache(max_size=0)
+        t0 = time.perf_counter()
+        outcomes += run(rag_server, queries, max(ks), args.concurrency)
+        wall_seconds += time.perf_counter() - t0
+
+    report = {
+        "config": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "dataset": Path(rag_server.CITATIONS_PATH).name,
+            "citations": len(rag_server.citations),
+            "queries": len(queries),
+            "known_items": args.known_items,
+            "k": ks,
+            "repeat": max(1, args.repeat),
+            "concurrency": args.concurrency,
+            "warm_cache": args.warm_cache,
+            "vector_backend": rag_server.store.name,
+            "vector_dtype": getattr(rag_server.store, "dtype", "float32"),
+            "embedder_backend": rag_server.EMBEDDER_BACKEND,
+            "rerank": rag_server.reranker is not None,
+        },
+        **summarize(queries, outcomes, ks, wall_seconds),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Résultats: {args.json}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+"""
+Corpus de citations unifié, partagé par rag_server.py (via indexer.py) et test_rag.py.
+
+Formats acceptés:
+- liste JSON (2000_citations_hasard.json: Citation / Auteur / need / mood / tone / energy ...)
+- objet JSON avec une clé "quotes" ou "citations" (gpt_quotes_rag.json, quotekg_citations.json: text / author)
+- NDJSON, une citation par ligne (.ndjson / .jsonl, sortie de extract_quotekg_final.py)
+
+Chaque citation est normalisée une seule fois (normalize_quote, IDs uniques) puis compilée
+en colonnes:
+- textes (id, citation, contexte, source, texte enrichi): un blob UTF-8 + offsets par colonne
+- auteurs, tags et attributs catégoriels internés: codes entiers + vocabulaire
+- énergie, flags et intensité émotionnelle en tableaux NumPy (-1 / NaN = inconnu)
+
+Le résultat est écrit en instantané (fichiers .npy + meta.json) dans CORPUS_DIR, clé: hash
+du fichier source. Les démarrages suivants le rouvrent par mmap: ni parsing JSON ni dict
+par citation; les dicts (citation normalisée, métadonnées d'index) sont construits à la demande.
+
+Usage:
+  python corpus.py ../2000_citations_hasard.json   # compile l'instantané et affiche un résumé
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Instantanés compilés (un sous-dossier par fichier source et par contenu)
+CORPUS_DIR = Path(os.environ.get("RAG_CORPUS_DIR", Path(__file__).resolve().parent / ".rag_corpus"))
+USE_SNAPSHOT = os.environ.get("RAG_CORPUS_SNAPSHOT", "1") != "0"
+# À incrémenter à chaque modification du format de l'instantané ou de normalize_quote
+SNAPSHOT_VERSION = 1
+# À incrémenter à chaque modification de create_enriched_text (force la réindexation)
+ENRICHED_TEXT_VERSION = 1
+
+# Colonnes texte (blob + offsets), colonnes internées, drapeaux
+STRING_FIELDS = ("id", "text", "context", "source", "enriched")
+INTERNED_FIELDS = ("author", "year", "need", "mood", "tone", "length", "language", "emotion_category")
+FLAG_FIELDS = ("is_injunctive", "is_guilt_inducing", "is_toxic_positive")
+
+# Noms des champs selon le dataset: la première valeur non vide l'emporte
+FIELD_ALIASES = {
+    "text": ("Citation", "text", "citation"),
+    "author": ("Auteur", "author", "auteur"),
+    "year": ("year", "annee"),
+    "context": ("context", "contexte"),
+}
+
+
+def _first(quote: Dict, field: str):
+    for key in FIELD_ALIASES.get(field, (field,)):
+        value = quote.get(key)
+        if value or value == 0:
+            return value
+    return None
+
+
+def _text(quote: Dict, field: str) -> str:
+    value = _first(quote, field)
+    return "" if value is None else str(value).strip()
+
+
+def _tags(quote: Dict) -> List[str]:
+    tags = quote.get("tags") or []
+    if isinstance(tags, str):
+        tags = [tags]
+    if not isinstance(tags, list):
+        tags = []
+    return [str(t).strip() for t in tags if str(t).strip()]
+
+
+def normalize_quote(quote: Dict, idx: int) -> Dict:
+    """
+    Citation brute (n'importe quel schéma) -> dict canonique:
+    id, text, author, year, source, context, tags (liste), need, mood, tone, length, language,
+    energy (int ou None), flags (bool ou None), emotion_category, emotion_intensity (float ou None).
+    L'ID retenu est id, sinon uri, sinon cit_{idx} (l'unicité est garantie par compile_quotes).
+    """
+    qid = quote.get("id")
+    if qid in (None, ""):
+        qid = quote.get("uri") or f"cit_{idx}"
+
+    energy = quote.get("energy")
+    try:
+        energy = None if energy in (None, "") else int(energy)
+    except (TypeError, ValueError):
+        energy = None
+
+    intensity = quote.get("emotion_intensity")
+    try:
+        intensity = None if intensity in (None, "") else float(intensity)
+    except (TypeError, ValueError):
+        intensity = None
+
+    record = {
+        "id": str(qid),
+        "text": _text(quote, "text"),
+        "author": _text(quote, "author"),
+        "year": _text(quote, "year"),
+        "source": _text(quote, "source"),
+        "context": _text(quote, "context"),
+        "tags": _tags(quote),
+    }
+    for field in ("need", "mood", "tone", "length", "language", "emotion_category"):
+        record[field] = _text(quote, field)
+    record["energy"] = energy
+    for flag in FLAG_FIELDS:
+        value = quote.get(flag)
+        record[flag] = None if value is None else bool(value)
+    record["emotion_intensity"] = intensity
+    return record
+
+
+# Fonction d'enrichissement avec tags + contexte pour optimiser la similitude
+def create_enriched_text(quote: Dict) -> str:
+    """Enrichit le texte avec priorité: contexte > tags > text > author pour matching émotionnel."""
+    text = _text(quote, "text")
+    author = _text(quote, "author")
+    context = _text(quote, "context")
+    tags_norm = [t.lower() for t in _tags(quote)]
+
+    # Ordre optimisé pour requêtes émotionnelles/narratives
+    parts = []
+    if context:
+        parts.append(f"Contexte: {context}")
+    if tags_norm:
+        parts.append(f"Tags: {', '.join(tags_norm)}")
+    if text:
+        parts.append(text)
+    if author:
+        parts.append(f"Auteur: {author}")
+
+    return "\n".join(parts)
+
+
+def text_hash(text: str) -> str:
+    """Hash d'un texte enrichi (détecte les citations modifiées)."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def file_hash(path: Path) -> str:
+    """sha256 du fichier source, lu par blocs."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_quotes(path: Path) -> Iterator[Dict]:
+    """Citations brutes du fichier, quel que soit son format (voir l'en-tête du module)."""
+    path = Path(path)
+    if path.suffix in (".ndjson", ".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        quotes = data
+    elif isinstance(data, dict):
+        quotes = data.get("quotes") or data.get("citations") or []
+    else:
+        raise TypeError(f"Format JSON inattendu: {type(data)}")
+    if not isinstance(quotes, list):
+        raise TypeError(f"La clé 'quotes' doit être une liste, reçu: {type(quotes)}")
+    yield from quotes
+
+
+class RowView(Sequence):
+    """Séquence paresseuse: l'élément i est construit à la demande par getter(rows[i])."""
+
+    def __init__(self, getter: Callable[[int], Dict], rows: np.ndarray):
+        self.getter = getter
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.getter(int(r)) for r in self.rows[i]]
+        return self.getter(int(self.rows[i]))
+
+    def take(self, order: np.ndarray) -> "RowView":
+        """Même vue, lignes réordonnées (sans construire les éléments)."""
+        return RowView(self.getter, self.rows[order])
+
+
+class Corpus:
+    """
+    Corpus compilé: colonnes NumPy (en mémoire ou mappées depuis un instantané).
+    Se comporte comme une liste de citations normalisées (len, corpus[i], itération),
+    mais les accès colonne par colonne (ids, enriched_texts, category_masks...) ne
+    construisent aucun dict.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], vocab: Dict[str, List[str]], source_hash: str = ""):
+        self.columns = columns
+        self.vocab = vocab
+        self.source_hash = source_hash
+        self._ids: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.columns["energy"])
+
+    def __getitem__(self, i: int) -> Dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.record(i)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self.record(i)
+
+    # Accès par colonne
+    def string(self, field: str, i: int) -> str:
+        offsets = self.columns[f"{field}_offsets"]
+        return bytes(self.columns[field][offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+    def strings(self, field: str) -> List[str]:
+        """Colonne texte entière, décodée en un passage."""
+        blob = self.columns[field].tobytes()
+        offsets = self.columns[f"{field}_offsets"].tolist()
+        return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(self))]
+
+    @property
+    def ids(self) -> List[str]:
+        if self._ids is None:
+            self._ids = self.strings("id")
+        return self._ids
+
+    def enriched_texts(self) -> List[str]:
+        return self.strings("enriched")
+
+    def content_hashes(self) -> List[str]:
+        return [h.decode("ascii") for h in self.columns["content_hash"].tolist()]
+
+    def category(self, field: str, i: int) -> str:
+        return self.vocab[field][self.columns[field][i]]
+
+    def category_masks(self, field: str) -> Dict[str, np.ndarray]:
+        """Un masque booléen par valeur d'un champ interné."""
+        codes = self.columns[field]
+        return {value: codes == code for code, value in enumerate(self.vocab[field])}
+
+    def tags(self, i: int) -> List[str]:
+        offsets = self.columns["tags_offsets"]
+        vocab = self.vocab["tags"]
+        return [vocab[code] for code in self.columns["tags"][offsets[i]:offsets[i + 1]].tolist()]
+
+    def energy(self, i: int) -> Optional[int]:
+        value = int(self.columns["energy"][i])
+        return None if value < 0 else value
+
+    def flag(self, field: str, i: int) -> Optional[bool]:
+        value = int(self.columns[field][i])
+        return None if value < 0 else bool(value)
+
+    # Vues dict (construites à la demande)
+    def record(self, i: int) -> Dict:
+        """Citation normalisée (mêmes clés que normalize_quote)."""
+        intensity = float(self.columns["emotion_intensity"][i])
+        record = {
+            "id": self.ids[i],
+            "text": self.string("text", i),
+            "author": self.category("author", i),
+            "year": self.category("year", i),
+            "source": self.string("source", i),
+            "context": self.string("context", i),
+            "tags": self.tags(i),
+        }
+        for field in ("need", "mood", "tone", "length", "language", "emotion_category"):
+            record[field] = self.category(field, i)
+        record["energy"] = self.energy(i)
+        for flag in FLAG_FIELDS:
+            record[flag] = self.flag(flag, i)
+        record["emotion_intensity"] = None if np.isnan(intensity) else intensity
+        return record
+
+    def metadata(self, i: int) -> Dict:
+        """Métadonnées d'index (ChromaDB: dict plat de scalaires str/int/float/bool)."""
+        energy = self.energy(i)
+        return {
+            "qid": self.ids[i],  # Permet d'exclure des IDs directement dans la requête vectorielle
+            "author": self.category("author", i),
+            # ChromaDB ne supporte pas les listes en métadonnées
+            "tags": ", ".join(self.tags(i)),
+            "context": self.string("context", i),
+            "original_text": self.string("text", i),
+            # Attributs filtrables (pré-filtre de /search, mêmes règles que safetyFilter dans app.js)
+            "need": self.category("need", i),
+            "mood": self.category("mood", i),
+            "tone": self.category("tone", i),
+            "energy": -1 if energy is None else energy,
+            **{flag: bool(self.flag(flag, i)) for flag in FLAG_FIELDS},
+            "content_hash": self.columns["content_hash"][i].decode("ascii"),
+        }
+
+    def metadatas(self) -> RowView:
+        return RowView(self.metadata, np.arange(len(self)))
+
+
+def _blob(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def compile_quotes(quotes: Iterable[Dict], source_hash: str = "") -> Corpus:
+    """Normalise les citations (IDs uniques: suffixe __dupN) et les compile en colonnes."""
+    strings: Dict[str, List[str]] = {field: [] for field in STRING_FIELDS}
+    tables: Dict[str, Dict[str, int]] = {field: {} for field in (*INTERNED_FIELDS, "tags")}
+    codes: Dict[str, List[int]] = {field: [] for field in INTERNED_FIELDS}
+    tag_codes: List[int] = []
+    tag_offsets = [0]
+    energy: List[int] = []
+    flags: Dict[str, List[int]] = {flag: [] for flag in FLAG_FIELDS}
+    intensity: List[float] = []
+    hashes: List[str] = []
+
+    seen_ids: Dict[str, int] = {}
+    for idx, raw in enumerate(quotes):
+        if not isinstance(raw, dict):
+            raise TypeError(f"Citation invalide à l'index {idx}: {type(raw)}")
+        quote = normalize_quote(raw, idx)
+
+        dup_index = seen_ids.get(quote["id"], 0)
+        seen_ids[quote["id"]] = dup_index + 1
+        if dup_index:
+            quote["id"] = f"{quote['id']}__dup{dup_index}"
+
+        enriched = create_enriched_text(quote)
+        for field in STRING_FIELDS:
+            strings[field].append(enriched if field == "enriched" else quote[field])
+        for field in INTERNED_FIELDS:
+            table = tables[field]
+            codes[field].append(table.setdefault(quote[field], len(table)))
+        for tag in quote["tags"]:
+            tag_codes.append(tables["tags"].setdefault(tag, len(tables["tags"])))
+        tag_offsets.append(len(tag_codes))
+        energy.append(-1 if quote["energy"] is None else quote["energy"])
+        for flag in FLAG_FIELDS:
+            flags[flag].append(-1 if quote[flag] is None else int(quote[flag]))
+        intensity.append(np.nan if quote["emotion_intensity"] is None else quote["emotion_intensity"])
+        hashes.append(text_hash(enriched))
+
+    columns: Dict[str, np.ndarray] = {}
+    for field in STRING_FIELDS:
+        columns[field], columns[f"{field}_offsets"] = _blob(strings[field])
+    for field in INTERNED_FIELDS:
+        columns[field] = np.array(codes[field], dtype=np.int32)
+    columns["tags"] = np.array(tag_codes, dtype=np.int32)
+    columns["tags_offsets"] = np.array(tag_offsets, dtype=np.int64)
+    columns["energy"] = np.clip(np.array(energy, dtype=np.int64), -1, 127).astype(np.int8)
+    for flag in FLAG_FIELDS:
+        columns[flag] = np.array(flags[flag], dtype=np.int8)
+    columns["emotion_intensity"] = np.array(intensity, dtype=np.float64)
+    columns["content_hash"] = np.array(hashes, dtype="S64")
+
+    vocab = {field: list(table) for field, table in tables.items()}
+    return Corpus(columns, vocab, source_hash)
+
+
+def as_corpus(citations: Union[Corpus, Iterable[Dict]]) -> Corpus:
+    """Corpus tel quel, ou liste de citations (brutes ou normalisées) compilée à la volée."""
+    return citations if isinstance(citations, Corpus) else compile_quotes(citations)
+
+
+def _snapshot_meta(source_hash: str) -> Dict:
+    return {
+        "version": SNAPSHOT_VERSION,
+        "enriched_text_version": ENRICHED_TEXT_VERSION,
+        "source_hash": source_hash,
+    }
+
+
+def write_snapshot(corpus: Corpus, directory: Path):
+    """Écrit l'instantané (un .npy par colonne + meta.json); remplacement atomique du dossier."""
+    directory = Path(directory)
+    tmp_dir = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    for name, column in corpus.columns.items():
+        np.save(tmp_dir / f"{name}.npy", np.asarray(column))
+    with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({**_snapshot_meta(corpus.source_hash), "vocab": corpus.vocab}, f, ensure_ascii=False)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+
+
+def open_snapshot(directory: Path, source_hash: str) -> Optional[Corpus]:
+    """Rouvre un instantané par mmap; None s'il est absent, incomplet ou périmé."""
+    directory = Path(directory)
+    try:
+        with open(directory / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    vocab = meta.pop("vocab", None)
+    if meta != _snapshot_meta(source_hash) or vocab is None:
+        return None
+
+    columns = {}
+    for path in directory.glob("*.npy"):
+        try:
+            columns[path.stem] = np.load(path, mmap_mode="r")
+        except ValueError:
+            # Colonne vide: rien à mapper
+            columns[path.stem] = np.load(path)
+    return Corpus(columns, vocab, source_hash)
+
+
+def snapshot_path(path: Path, source_hash: str, snapshot_dir: Path = CORPUS_DIR) -> Path:
+    return Path(snapshot_dir) / f"{Path(path).stem}-{source_hash[:16]}"
+
+
+def load_corpus(path: Path, snapshot_dir: Optional[Path] = CORPUS_DIR if USE_SNAPSHOT else None) -> Tuple[Corpus, str]:
+    """
+    Charge le corpus depuis son instantané s'il est à jour, sinon compile le fichier source
+    et écrit l'instantané (les instantanés périmés du même fichier sont supprimés).
+    Retourne (corpus, hash du fichier source).
+    """
+    path = Path(path)
+    source_hash = file_hash(path)
+    target = None
+    if snapshot_dir is not None:
+        target = snapshot_path(path, source_hash, snapshot_dir)
+        corpus = open_snapshot(target, source_hash)
+        if corpus is not None:
+            return corpus, source_hash
+
+    corpus = compile_quotes(read_quotes(path), source_hash)
+    if target is not None:
+        try:
+            for stale in Path(snapshot_dir).glob(f"{path.stem}-*"):
+                if stale != target:
+                    shutil.rmtree(stale, ignore_errors=True)
+            write_snapshot(corpus, target)
+        except OSError as e:
+            print(f"⚠️  Instantané du corpus non écrit ({e})", file=sys.stderr)
+    return corpus, source_hash
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile un corpus de citations en instantané colonnaire.")
+    parser.add_argument("corpus", help="Fichier JSON / NDJSON des citations")
+    parser.add_argument("--snapshot-dir", default=str(CORPUS_DIR), help="Dossier des instantanés")
+    args = parser.parse_args()
+
+    corpus, source_hash = load_corpus(Path(args.corpus), Path(args.snapshot_dir))
+    target = snapshot_path(Path(args.corpus), source_hash, Path(args.snapshot_dir))
+    size = sum(p.stat().st_size for p in target.glob("*")) if target.exists() else 0
+    print(f"✅ {len(corpus)} citations, {len(corpus.vocab['author'])} auteurs, "
+          f"{len(corpus.vocab['tags'])} tags distincts -> {target} ({size / 2**20:.1f} Mo)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Backends d'inférence de l'encodeur de requêtes (RAG_EMBEDDER_BACKEND):
+
+- torch      : SentenceTransformer de référence (float32)
+- torch-int8 : mêmes poids, couches Linear quantifiées dynamiquement en int8 (CPU)
+- onnx       : export ONNX exécuté par onnxruntime
+- onnx-int8  : variante ONNX quantifiée int8 publiée avec le modèle (RAG_ONNX_FILE)
+
+Les backends ONNX demandent optimum[onnxruntime]: pip install -r requirements-onnx.txt.
+
+Le corpus reste encodé par le modèle de référence (le cache d'embeddings est indexé par modèle,
+pas par backend): seules les requêtes passent par le backend choisi. L'écart de qualité se
+mesure avec parity_embedders.py.
+"""
+
+import os
+from typing import Optional
+
+from indexer import EMBEDDER_MODEL
+
+EMBEDDER_BACKEND = os.environ.get("RAG_EMBEDDER_BACKEND", "torch")
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+# Fichier quantifié du dépôt du modèle (avx2 = portable x86; avx512 / avx512_vnni / arm64 selon le CPU)
+ONNX_INT8_FILE = os.environ.get("RAG_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+
+
+def load_embedder(backend: str = EMBEDDER_BACKEND, model_name: str = EMBEDDER_MODEL, onnx_file: Optional[str] = None):
+    """SentenceTransformer (même interface encode()) pour le backend demandé."""
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+
+    if backend == "torch-int8":
+        import torch
+        from torch.ao.quantization import quantize_dynamic
+
+        # Quantification dynamique: poids int8, activations quantifiées à la volée (CPU uniquement)
+        model = SentenceTransformer(model_name, device="cpu")
+        return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    if backend in ("onnx", "onnx-int8"):
+        model_kwargs = {"file_name": onnx_file or ONNX_INT8_FILE} if backend == "onnx-int8" else None
+        try:
+            return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+        except TypeError:
+            raise RuntimeError("Backend ONNX: sentence-transformers >= 3.2 requis")
+
+    raise ValueError(f"Backend d'encodage inconnu: {backend} (attendu: {', '.join(BACKENDS)})")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Cache disque des embeddings, adressé par contenu: clé = (modèle, sha256 du texte).
+
+Un répertoire par modèle contient:
+- vectors.f32 : matrice float32 contiguë (une ligne par texte), lue en memmap
+- index.json  : {"model", "dim", "keys": [sha256, ...]} (ligne i <-> keys[i])
+
+Partagé par rag_server.py (via indexer.py) et test_rag.py: un texte déjà encodé
+avec le même modèle ne repasse jamais par l'encodeur.
+"""
+
+import hashlib
+import json
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: pas de verrou inter-processus
+    fcntl = None
+
+EMBEDDING_CACHE_DIR = Path(os.environ.get(
+    "RAG_EMBEDDING_CACHE_DIR", Path(__file__).resolve().parent / ".embedding_cache"
+))
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Cache append-only des embeddings d'un modèle."""
+
+    def __init__(self, model_id: str, cache_dir: Path = EMBEDDING_CACHE_DIR):
+        self.model_id = model_id
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_id)
+        self.dir = Path(cache_dir) / slug
+        self.vectors_path = self.dir / "vectors.f32"
+        self.index_path = self.dir / "index.json"
+        self.lock_path = self.dir / ".lock"
+        self.dim = 0
+        self.keys: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.vectors = None
+        self._index_stamp = None
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self, force: bool = False):
+        """
+        (Re)lit l'index et mappe la matrice; ignore une éventuelle fin de fichier orpheline.
+        Sans force, l'index n'est relu que si (inode, taille, mtime) a changé: deux publications
+        dans le même tick d'horloge peuvent garder la même mtime, d'où force=True sous le verrou.
+        """
+        if not self.index_path.exists():
+            return
+        st = self.index_path.stat()
+        stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if not force and stamp == self._index_stamp:
+            return
+
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("model") != self.model_id:
+            return
+
+        self.dim = int(index["dim"])
+        self.keys = list(index["keys"])
+        self.rows = {k: i for i, k in enumerate(self.keys)}
+        self._index_stamp = stamp
+        self.vectors = (
+            np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.keys), self.dim))
+            if self.keys else None
+        )
+
+    def _append(self, keys: List[str], vectors: np.ndarray):
+        """Ajoute des lignes à la matrice puis publie le nouvel index (écriture atomique)."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not self.dim:
+            self.dim = int(vectors.shape[1])
+
+        # Tronquer une écriture interrompue (lignes sans entrée dans l'index)
+        expected = len(self.keys) * self.dim * 4
+        with open(self.vectors_path, "ab") as f:
+            if f.tell() != expected:
+                f.truncate(expected)
+                f.seek(expected)
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.keys.extend(keys)
+        tmp_path = self.index_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_id, "dim": self.dim, "keys": self.keys}, f)
+        os.replace(tmp_path, self.index_path)
+        self._load(force=True)
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Retourne les embeddings (float32, une ligne par texte) en n'appelant encode_fn
+        que pour les textes absents du cache.
+        """
+        keys = [text_key(t) for t in texts]
+        self._load()
+
+        missing = [i for i, k in enumerate(keys) if k not in self.rows]
+        if missing:
+            with self._locked():
+                # Un autre processus a pu encoder ces textes entre-temps: toujours relire l'index,
+                # _append() tronque la matrice à la taille qu'il décrit
+                self._load(force=True)
+                todo: Dict[str, str] = {}
+                for i in missing:
+                    if keys[i] not in self.rows:
+                        todo.setdefault(keys[i], texts[i])
+                if todo:
+                    new_vectors = np.asarray(encode_fn(list(todo.values())), dtype=np.float32)
+                    self._append(list(todo), new_vectors)
+
+        if not keys:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.asarray(self.vectors[[self.rows[k] for k in keys]], dtype=np.float32)
@@ -1,17 +1,42 @@
 #!/usr/bin/env python3
 """
 QuoteKG French Quotes Extractor
-Extrait 500 citations françaises avec métadonnées complètes du SPARQL endpoint QuoteKG.
+Extrait les citations françaises avec métadonnées complètes du SPARQL endpoint QuoteKG.
 
-Endpoint: https://quotekg.l3s.uni-hannover.de/sparql
+- Plusieurs pages (fenêtres OFFSET) en vol en parallèle, nombre borné (--concurrency),
+  ou pagination par curseur (--pagination keyset: ORDER BY ?quotation + FILTER > dernière
+  URI), séquentielle mais à latence constante quelle que soit la profondeur
+- Sortie NDJSON en flux (une citation par ligne), écrite au fil des pages
+- Les lignes SPARQL d'une même ?quotation (jointures OPTIONAL émotion/contexte) sont
+  fusionnées en une seule citation (listes emotions / contexts); mémoire bornée: fenêtre
+  de fusion de quelques pages + ensemble borné des URIs déjà écrites
+- Toutes les --checkpoint-every pages, la fenêtre est écrite et <sortie>.checkpoint.json
+  enregistré: une extraction interrompue reprend là où elle s'était arrêtée
+- Export optionnel au format JSON historique ({"metadata", "quotes"}), lui aussi en flux
+
+Endpoint: https://quotekg.l3s.uni-hannover.de/sparql (--endpoint ou QUOTEKG_ENDPOINT
+pour viser un autre serveur, ex: un stub SPARQL local renvoyant des bindings JSON)
 Documentation: https://quotekg.l3s.uni-hannover.de/
+
+Usage:
+  python extract_quotekg_final.py [--limit 20000] [--page-size 100] [--concurrency 4]
+  python extract_quotekg_final.py --output quotekg.ndjson --json-output ""   # NDJSON seul
+  python extract_quotekg_final.py --pagination keyset --page-size 500
 """
 
+import argparse
+import hashlib
 import json
+import os
+import textwrap
+import threading
 import time
 import logging
-from typing import Optional
-from dataclasses import dataclass, asdict
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional
+from dataclasses import dataclass, asdict, field
+from itertools import islice
 from SPARQLWrapper import SPARQLWrapper, JSON, POST
 from SPARQLWrapper.SPARQLExceptions import QueryBadFormed, EndPointNotFound
 
@@ -20,8 +45,14 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 # Configuration du endpoint
-QUOTEKG_ENDPOINT = "https://quotekg.l3s.uni-hannover.de/sparql"
+QUOTEKG_ENDPOINT = os.environ.get("QUOTEKG_ENDPOINT", "https://quotekg.l3s.uni-hannover.de/sparql")
 DEFAULT_TIMEOUT = 60
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_CONCURRENCY = 4
+DEFAULT_CHECKPOINT_EVERY = 10     # pages entre deux écritures de la fenêtre de fusion
+DEFAULT_SEEN_SIZE = 500_000       # URIs déjà écrites mémorisées (empreintes 64 bits)
+OUTPUT_PATH = "quotekg_citations.ndjson"
+JSON_OUTPUT_PATH = "quotekg_citations.json"
 MAX_RETRIES = 3
 RETRY_DELAY = 5
 
@@ -39,10 +70,29 @@ class FrenchQuote:
     emotion_intensity: Optional[float] = None
     context: Optional[str] = None
     source: Optional[str] = None
+    # Toutes les émotions / contextes trouvés pour cette URI (lignes SPARQL fusionnées)
+    emotions: List[Dict] = field(default_factory=list)
+    contexts: List[Dict] = field(default_factory=list)
+
 
+def sparql_string(value: str) -> str:
+    """Littéral chaîne SPARQL échappé."""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
 
-def build_sparql_query(limit: int = 500, offset: int = 0) -> str:
-    """Construit la requête SPARQL pour extraire des citations françaises."""
+
+def build_sparql_query(
+    limit: int = 500,
+    offset: int = 0,
+    after: Optional[str] = None,
+    keyset: bool = False
+) -> str:
+    """
+    Construit la requête SPARQL pour extraire des citations françaises.
+    keyset=True: résultats triés par ?quotation, à partir de l'URI strictement après `after`
+    (pagination par curseur, sans OFFSET).
+    """
+    cursor_filter = f"FILTER(STR(?quotation) > {sparql_string(after)})" if keyset and after else ""
+    paging = f"ORDER BY ?quotation\n    LIMIT {limit}" if keyset else f"LIMIT {limit}\n    OFFSET {offset}"
     return f"""
     PREFIX qkg: <https://quotekg.l3s.uni-hannover.de/resource/>
     PREFIX so: <https://schema.org/>
@@ -63,6 +113,7 @@ def build_sparql_query(limit: int = 500, offset: int = 0) -> str:
       ?mention so:text ?text .
       
       FILTER(LANG(?text) = "fr")
+      {cursor_filter}
       
       OPTIONAL {{ ?quotation so:dateCreated ?date }}
       OPTIONAL {{ ?quotation dbo:year ?year }}
@@ -81,8 +132,7 @@ def build_sparql_query(limit: int = 500, offset: int = 0) -> str:
         OPTIONAL {{ ?context dcterms:source ?source }}
       }}
     }}
-    LIMIT {limit}
-    OFFSET {offset}
+    {paging}
     """
 
 
@@ -110,6 +160,10 @@ def parse_binding(binding: dict) -> FrenchQuote:
     intensity_raw = get_value("emotionIntensity")
     emotion_intensity = float(intensity_raw) if intensity_raw else None
     
+    emotion_category = parse_emotion_category(get_value("emotionCategory"))
+    context = get_value("contextText")
+    source = get_value("source")
+    
     return FrenchQuote(
         uri=get_value("quotation") or "",
         text=get_value("text") or "",
@@ -117,112 +171,371 @@ def parse_binding(binding: dict) -> FrenchQuote:
         date=get_value("date"),
         year=get_value("year"),
         is_misattributed=is_misattributed,
-        emotion_category=parse_emotion_category(get_value("emotionCategory")),
+        emotion_category=emotion_category,
         emotion_intensity=emotion_intensity,
-        context=get_value("contextText"),
-        source=get_value("source")
+        context=context,
+        source=source,
+        emotions=[{"category": emotion_category, "intensity": emotion_intensity}] if emotion_category else [],
+        contexts=[{"text": context, "source": source}] if context else []
     )
 
 
+def merge_quote(quote: FrenchQuote, other: FrenchQuote):
+    """Fusionne dans quote une autre ligne SPARQL de la même URI."""
+    for emotion in other.emotions:
+        if emotion not in quote.emotions:
+            quote.emotions.append(emotion)
+    for context in other.contexts:
+        if context not in quote.contexts:
+            quote.contexts.append(context)
+    quote.date = quote.date or other.date
+    quote.year = quote.year or other.year
+    quote.is_misattributed = quote.is_misattributed or other.is_misattributed
+
+    # Champs simples: émotion la plus intense, premier contexte
+    if quote.emotions:
+        strongest = max(quote.emotions, key=lambda e: e["intensity"] or 0.0)
+        quote.emotion_category = strongest["category"]
+        quote.emotion_intensity = strongest["intensity"]
+    if quote.contexts:
+        quote.context = quote.contexts[0]["text"]
+        quote.source = quote.contexts[0]["source"]
+
+
+_local = threading.local()
+
+
+def get_client(endpoint: str, timeout: int) -> SPARQLWrapper:
+    """Un client SPARQLWrapper par thread (l'objet n'est pas thread-safe)."""
+    sparql = getattr(_local, "sparql", None)
+    if sparql is None or sparql.endpoint != endpoint:
+        sparql = SPARQLWrapper(endpoint)
+        sparql.setReturnFormat(JSON)
+        sparql.setMethod(POST)
+        sparql.setTimeout(timeout)
+        _local.sparql = sparql
+    return sparql
+
+
+def fetch_page(
+    endpoint: str,
+    offset: int,
+    limit: int,
+    timeout: int = DEFAULT_TIMEOUT,
+    after: Optional[str] = None,
+    keyset: bool = False
+) -> List[FrenchQuote]:
+    """Une page de résultats (avec retries et backoff exponentiel)."""
+    query = build_sparql_query(limit=limit, offset=offset, after=after, keyset=keyset)
+    for attempt in range(MAX_RETRIES):
+        try:
+            sparql = get_client(endpoint, timeout)
+            sparql.setQuery(query)
+            results = sparql.query().convert()
+            bindings = results.get("results", {}).get("bindings", [])
+            return [parse_binding(b) for b in bindings]
+        except QueryBadFormed as e:
+            logger.error(f"❌ Erreur de syntaxe SPARQL: {e}")
+            raise
+        except EndPointNotFound as e:
+            logger.error(f"❌ Endpoint non disponible: {e}")
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️  offset={offset}: erreur tentative {attempt + 1}: {e}")
+            if attempt < MAX_RETRIES - 1:
+                delay = RETRY_DELAY * 2 ** attempt
+                logger.info(f"   Nouvelle tentative dans {delay}s...")
+                time.sleep(delay)
+            else:
+                raise RuntimeError(f"Échec après {MAX_RETRIES} tentatives (offset={offset}): {e}")
+    raise RuntimeError("unreachable")
+
+
+def uri_fingerprint(uri: str) -> int:
+    """Empreinte 64 bits d'une URI (l'ensemble des URIs vues reste compact)."""
+    return int.from_bytes(hashlib.blake2b(uri.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class BoundedSeenSet:
+    """Ensemble FIFO borné: au-delà de max_size, les plus anciennes entrées sont oubliées."""
+
+    def __init__(self, max_size: int = DEFAULT_SEEN_SIZE):
+        self.max_size = max(1, max_size)
+        self._items = set()
+        self._order = deque()
+
+    def __contains__(self, item) -> bool:
+        return item in self._items
+
+    def add(self, item):
+        if item in self._items:
+            return
+        self._items.add(item)
+        self._order.append(item)
+        if len(self._order) > self.max_size:
+            self._items.discard(self._order.popleft())
+
+
+class QuoteWriter:
+    """
+    Écriture NDJSON avec fusion des doublons d'URI.
+
+    Les citations restent dans une fenêtre (dict ordonné par URI) jusqu'au prochain
+    flush(): les lignes SPARQL de la même URI arrivées entre-temps y sont fusionnées.
+    Après écriture, seule l'empreinte de l'URI est gardée (ensemble borné); une ligne
+    arrivant plus tard pour une URI déjà écrite est ignorée et comptée (late_duplicates).
+    """
+
+    def __init__(self, out, seen_size: int = DEFAULT_SEEN_SIZE):
+        self.out = out
+        self.window: "OrderedDict[str, FrenchQuote]" = OrderedDict()
+        self.seen = BoundedSeenSet(seen_size)
+        self.written = 0
+        self.merged = 0
+        self.late_duplicates = 0
+
+    def add(self, quote: FrenchQuote):
+        pending = self.window.get(quote.uri)
+        if pending is not None:
+            merge_quote(pending, quote)
+            self.merged += 1
+        elif uri_fingerprint(quote.uri) in self.seen:
+            self.late_duplicates += 1
+        else:
+            self.window[quote.uri] = quote
+
+    def flush(self) -> int:
+        """Écrit la fenêtre, synchronise le fichier et retourne sa taille."""
+        for uri, quote in self.window.items():
+            self.out.write((json.dumps(asdict(quote), ensure_ascii=False) + "\n").encode("utf-8"))
+            self.seen.add(uri_fingerprint(uri))
+            self.written += 1
+        self.window.clear()
+        self.out.flush()
+        os.fsync(self.out.fileno())
+        return self.out.tell()
+
+
+def load_checkpoint(path: str, params: Dict) -> Optional[Dict]:
+    """État de reprise s'il correspond aux mêmes paramètres d'extraction."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return state if state.get("params") == params else None
+
+
+def save_checkpoint(path: str, state: Dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
 def fetch_french_quotes(
-    limit: int = 500,
-    batch_size: int = 100,
-    timeout: int = DEFAULT_TIMEOUT
-) -> list:
-    """Récupère des citations françaises depuis QuoteKG avec pagination automatique."""
-    sparql = SPARQLWrapper(QUOTEKG_ENDPOINT)
-    sparql.setReturnFormat(JSON)
-    sparql.setMethod(POST)
-    sparql.setTimeout(timeout)
-    
-    all_quotes = []
-    offset = 0
-    
-    logger.info(f"🔍 Début de l'extraction de {limit} citations françaises...")
-    logger.info(f"📡 Endpoint: {QUOTEKG_ENDPOINT}\n")
-    
-    while len(all_quotes) < limit:
-        current_limit = min(batch_size, limit - len(all_quotes))
-        query = build_sparql_query(limit=current_limit, offset=offset)
-        
-        for attempt in range(MAX_RETRIES):
-            try:
-                sparql.setQuery(query)
-                logger.info(f"⏳ Requête batch: offset={offset}, limit={current_limit} (tentative {attempt + 1})")
-                
-                results = sparql.query().convert()
-                bindings = results.get("results", {}).get("bindings", [])
-                
-                if not bindings:
-                    logger.info("✓ Plus de résultats disponibles")
-                    return all_quotes
-                
-                batch_quotes = [parse_binding(b) for b in bindings]
-                all_quotes.extend(batch_quotes)
-                
-                logger.info(f"✓ Récupéré {len(batch_quotes)} citations (total: {len(all_quotes)})\n")
-                offset += current_limit
-                
-                time.sleep(0.5)
-                break
-                
-            except QueryBadFormed as e:
-                logger.error(f"❌ Erreur de syntaxe SPARQL: {e}")
-                raise
-            except EndPointNotFound as e:
-                logger.error(f"❌ Endpoint non disponible: {e}")
-                raise
-            except Exception as e:
-                logger.warning(f"⚠️  Erreur tentative {attempt + 1}: {e}")
-                if attempt < MAX_RETRIES - 1:
-                    logger.info(f"   Nouvelle tentative dans {RETRY_DELAY}s...")
-                    time.sleep(RETRY_DELAY)
-                else:
-                    raise RuntimeError(f"Échec après {MAX_RETRIES} tentatives: {e}")
-    
-    return all_quotes[:limit]
-
-
-def export_to_json(quotes: list, filepath: str = "quotekg_citations.json"):
-    """Exporte les citations en JSON."""
-    data = {
-        "metadata": {
-            "source": "QuoteKG SPARQL Endpoint",
-            "endpoint": QUOTEKG_ENDPOINT,
-            "total_quotes": len(quotes),
-            "language": "fr",
-            "extraction_date": time.strftime("%Y-%m-%d %H:%M:%S")
-        },
-        "quotes": [asdict(q) for q in quotes]
+    output_path: str = OUTPUT_PATH,
+    limit: Optional[int] = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    endpoint: str = QUOTEKG_ENDPOINT,
+    timeout: int = DEFAULT_TIMEOUT,
+    restart: bool = False,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+    seen_size: int = DEFAULT_SEEN_SIZE,
+    pagination: str = "offset"
+) -> Dict:
+    """
+    Récupère les citations françaises page par page et les écrit au fil de l'eau en NDJSON
+    dans output_path (doublons d'URI fusionnés). Reprend depuis le checkpoint s'il existe.
+
+    pagination="offset": fenêtres LIMIT/OFFSET, plusieurs pages en vol en parallèle.
+    pagination="keyset": pages triées par ?quotation, chacune commençant après la dernière
+    URI reçue; séquentiel, mais latence constante quelle que soit la profondeur et pages
+    stables (chaque citation exactement une fois).
+    Retourne les compteurs de l'extraction.
+    """
+    keyset = pagination == "keyset"
+    checkpoint_path = f"{output_path}.checkpoint.json"
+    params = {
+        "endpoint": endpoint,
+        "limit": limit,
+        "page_size": page_size,
+        "pagination": pagination,
+        "query": hashlib.sha256(build_sparql_query(page_size, 0, keyset=keyset).encode("utf-8")).hexdigest(),
     }
-    
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    
-    logger.info(f"💾 Exporté {len(quotes)} citations vers {filepath}")
 
+    state = None if restart else load_checkpoint(checkpoint_path, params)
+    if state is None:
+        state = {"params": params, "done": [], "bytes": 0, "rows": 0, "end": None, "cursor": None}
+    else:
+        logger.info(f"♻️  Reprise: {len(state['done'])} pages, {state['rows']} lignes déjà extraites")
 
-def print_statistics(quotes: list):
-    """Affiche des statistiques sur les citations extraites."""
-    total = len(quotes)
-    with_sentiment = sum(1 for q in quotes if q.emotion_category)
-    with_context = sum(1 for q in quotes if q.context)
-    misattributed = sum(1 for q in quotes if q.is_misattributed)
-    with_date = sum(1 for q in quotes if q.date or q.year)
-    
+    # Les citations écrites après le dernier checkpoint sont abandonnées (pages refaites)
+    with open(output_path, "ab") as f:
+        f.truncate(state["bytes"])
+
+    done = set(state["done"])
+
+    def page_limit(offset: int) -> int:
+        return page_size if limit is None else min(page_size, limit - offset)
+
+    def remaining_offsets() -> Iterator[int]:
+        offset = 0
+        # state["end"] est fixé dès qu'une page revient incomplète (fin des résultats)
+        while (limit is None or offset < limit) and (state["end"] is None or offset < state["end"]):
+            if offset not in done:
+                yield offset
+            offset += page_size
+
+    logger.info(f"🔍 Début de l'extraction ({'sans limite' if limit is None else f'{limit} lignes max'}), "
+                f"pages de {page_size}, " + ("pagination par curseur" if keyset else f"{concurrency} en parallèle"))
+    logger.info(f"📡 Endpoint: {endpoint}\n")
+
+    offsets = remaining_offsets()
+    pool = ThreadPoolExecutor(max_workers=1 if keyset else max(1, concurrency))
+    pending = {}
+    unsaved = []  # Pages reçues mais encore dans la fenêtre de fusion: (offset, lignes)
+    cursor = state["cursor"]
+
+    def fill():
+        while len(pending) < max(1, concurrency):
+            offset = next(offsets, None)
+            if offset is None:
+                return
+            pending[pool.submit(fetch_page, endpoint, offset, page_limit(offset), timeout)] = offset
+
+    try:
+        with open(output_path, "ab") as out:
+            writer = QuoteWriter(out, seen_size)
+            # Reprise: les URIs déjà écrites ne doivent pas réapparaître
+            for quote in iter_ndjson(output_path):
+                writer.seen.add(uri_fingerprint(quote["uri"]))
+
+            def checkpoint():
+                state["bytes"] = writer.flush()
+                state["done"].extend(offset for offset, _ in unsaved)
+                state["rows"] += sum(rows for _, rows in unsaved)
+                state["cursor"] = cursor
+                unsaved.clear()
+                save_checkpoint(checkpoint_path, state)
+
+            def page_received(offset: int, quotes: List[FrenchQuote]):
+                for quote in quotes:
+                    writer.add(quote)
+                unsaved.append((offset, len(quotes)))
+                if len(unsaved) >= checkpoint_every:
+                    checkpoint()
+                    logger.info(f"💾 Checkpoint: {writer.written} citations écrites")
+
+            if keyset:
+                while limit is None or state["rows"] + sum(rows for _, rows in unsaved) < limit:
+                    received = state["rows"] + sum(rows for _, rows in unsaved)
+                    size = page_size if limit is None else min(page_size, limit - received)
+                    quotes = fetch_page(endpoint, received, size, timeout, after=cursor, keyset=True)
+                    last_page = len(quotes) < size
+                    if not last_page:
+                        # La dernière URI peut avoir d'autres lignes dans la page suivante:
+                        # elle est laissée pour la page suivante (le curseur s'arrête avant)
+                        complete = [q for q in quotes if q.uri != quotes[-1].uri]
+                        if complete:
+                            quotes = complete
+                        else:
+                            logger.warning(f"⚠️  {quotes[-1].uri}: plus de {size} lignes, page acceptée telle quelle")
+                    if quotes:
+                        cursor = quotes[-1].uri
+                    logger.info(f"✓ après {cursor}: {len(quotes)} lignes")
+                    page_received(received, quotes)
+                    if last_page:
+                        break
+            else:
+                fill()
+                while pending:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        offset = pending.pop(future)
+                        quotes = future.result()
+                        if len(quotes) < page_limit(offset):
+                            end = offset + len(quotes)
+                            state["end"] = end if state["end"] is None else min(state["end"], end)
+                        logger.info(f"✓ offset={offset}: {len(quotes)} lignes")
+                        page_received(offset, quotes)
+                    fill()
+            checkpoint()
+    finally:
+        # En cas d'erreur, ne pas attendre les pages en vol: elles seront refaites à la reprise
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    stats = {
+        "rows": state["rows"],
+        "written": writer.written,
+        "merged": writer.merged,
+        "late_duplicates": writer.late_duplicates,
+    }
+    logger.info(f"✓ Plus de résultats à extraire ({state['rows']} lignes SPARQL, "
+                f"{writer.merged} doublons fusionnés, {writer.late_duplicates} doublons tardifs ignorés)")
+    return stats
+
+
+def iter_ndjson(path: str) -> Iterator[Dict]:
+    """Relit un fichier NDJSON ligne par ligne."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def export_to_json(ndjson_path: str, filepath: str = JSON_OUTPUT_PATH, endpoint: str = QUOTEKG_ENDPOINT) -> int:
+    """Exporte les citations en JSON (écriture en flux depuis le NDJSON, puis remplacement atomique)."""
+    total = sum(1 for _ in iter_ndjson(ndjson_path))
+    metadata = {
+        "source": "QuoteKG SPARQL Endpoint",
+        "endpoint": endpoint,
+        "total_quotes": total,
+        "language": "fr",
+        "extraction_date": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        # Même mise en forme que json.dump(..., indent=2) sur tout le document
+        f.write('{\n  "metadata": ')
+        f.write(textwrap.indent(json.dumps(metadata, ensure_ascii=False, indent=2), "  ").lstrip())
+        f.write(',\n  "quotes": [')
+        for i, quote in enumerate(iter_ndjson(ndjson_path)):
+            f.write(",\n" if i else "\n")
+            f.write(textwrap.indent(json.dumps(quote, ensure_ascii=False, indent=2), "    "))
+        f.write("\n  ]\n}" if total else "]\n}")
+    os.replace(tmp_path, filepath)
+
+    logger.info(f"💾 Exporté {total} citations vers {filepath}")
+    return total
+
+
+def print_statistics(quotes: Iterable[Dict]):
+    """Affiche des statistiques sur les citations extraites (une seule passe, en flux)."""
+    total = with_sentiment = with_context = misattributed = with_date = 0
     emotions = {}
     for q in quotes:
-        if q.emotion_category:
-            emotions[q.emotion_category] = emotions.get(q.emotion_category, 0) + 1
-    
+        total += 1
+        with_sentiment += bool(q.get("emotion_category"))
+        with_context += bool(q.get("context"))
+        misattributed += bool(q.get("is_misattributed"))
+        with_date += bool(q.get("date") or q.get("year"))
+        if q.get("emotion_category"):
+            emotions[q["emotion_category"]] = emotions.get(q["emotion_category"], 0) + 1
+    pct = lambda n: 100 * n / max(1, total)
+
     print("\n" + "="*60)
     print("📊 STATISTIQUES DES CITATIONS FRANÇAISES QUOTEKG")
     print("="*60)
     print(f"Total citations extraites:    {total}")
-    print(f"Avec sentiment analysé:       {with_sentiment} ({100*with_sentiment/total:.1f}%)")
-    print(f"Avec contexte:                {with_context} ({100*with_context/total:.1f}%)")
-    print(f"Avec date/année:              {with_date} ({100*with_date/total:.1f}%)")
-    print(f"Marquées misattribuées:       {misattributed} ({100*misattributed/total:.1f}%)")
+    print(f"Avec sentiment analysé:       {with_sentiment} ({pct(with_sentiment):.1f}%)")
+    print(f"Avec contexte:                {with_context} ({pct(with_context):.1f}%)")
+    print(f"Avec date/année:              {with_date} ({pct(with_date):.1f}%)")
+    print(f"Marquées misattribuées:       {misattributed} ({pct(misattributed):.1f}%)")
     
     if emotions:
         print("\nRépartition des sentiments:")
@@ -231,32 +544,72 @@ def print_statistics(quotes: list):
     print("="*60 + "\n")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extraction des citations françaises de QuoteKG")
+    parser.add_argument("--endpoint", default=QUOTEKG_ENDPOINT, help="URL du endpoint SPARQL")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="Fichier NDJSON de sortie")
+    parser.add_argument("--json-output", default=JSON_OUTPUT_PATH,
+                        help="Export JSON {metadata, quotes} en fin d'extraction (\"\" pour ne pas l'écrire)")
+    parser.add_argument("--limit", type=int, default=None, help="Nombre max de lignes (défaut: tout)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Lignes par requête SPARQL")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Pages en vol en parallèle")
+    parser.add_argument("--pagination", choices=["offset", "keyset"], default="offset",
+                        help="offset: pages LIMIT/OFFSET parallèles; keyset: curseur sur ?quotation "
+                             "(séquentiel, latence constante en profondeur, pages stables)")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT, help="Timeout par requête (s)")
+    parser.add_argument("--restart", action="store_true", help="Ignore le checkpoint et repart de zéro")
+    parser.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                        help="Pages fusionnées entre deux écritures + checkpoint")
+    parser.add_argument("--seen-size", type=int, default=DEFAULT_SEEN_SIZE,
+                        help="Nombre max d'URIs déjà écrites gardées en mémoire pour le dédoublonnage")
+    return parser.parse_args()
+
+
 def main():
     """Point d'entrée principal."""
+    args = parse_args()
     try:
-        # Extraction des citations
-        quotes = fetch_french_quotes(limit=500, batch_size=100)
+        # Extraction des citations (reprise automatique depuis le checkpoint)
+        fetch_french_quotes(
+            output_path=args.output,
+            limit=args.limit,
+            page_size=args.page_size,
+            concurrency=args.concurrency,
+            endpoint=args.endpoint,
+            timeout=args.timeout,
+            restart=args.restart,
+            checkpoint_every=args.checkpoint_every,
+            seen_size=args.seen_size,
+            pagination=args.pagination
+        )
+        os.remove(f"{args.output}.checkpoint.json")
         
-        if not quotes:
+        preview = list(islice(iter_ndjson(args.output), 5))
+        if not preview:
             logger.error("❌ Aucune citation récupérée!")
             return
         
         # Affichage des statistiques
-        print_statistics(quotes)
+        print_statistics(iter_ndjson(args.output))
         
-        # Export JSON
-        export_to_json(quotes, "quotekg_citations.json")
+        # Export JSON historique (lu par test_rag.py / indexer.py)
+        if args.json_output:
+            export_to_json(args.output, args.json_output, args.endpoint)
         
         # Aperçu des premières citations
         print("\n📋 APERÇU DES 5 PREMIÈRES CITATIONS\n")
-        for i, quote in enumerate(quotes[:5], 1):
-            text_preview = quote.text[:100] + "..." if len(quote.text) > 100 else quote.text
+        for i, quote in enumerate(preview, 1):
+            text = quote["text"]
+            text_preview = text[:100] + "..." if len(text) > 100 else text
             print(f"{i}. \"{text_preview}\"")
-            print(f"   — {quote.author}")
-            if quote.emotion_category:
-                intensity_str = f"{quote.emotion_intensity:.2f}" if quote.emotion_intensity else "N/A"
-                print(f"   Sentiment: {quote.emotion_category} (intensité: {intensity_str})")
-            if quote.is_misattributed:
+            print(f"   — {quote['author']}")
+            if quote.get("emotion_category"):
+                intensity = quote.get("emotion_intensity")
+                intensity_str = f"{intensity:.2f}" if intensity else "N/A"
+                others = len(quote.get("emotions") or []) - 1
+                suffix = f", +{others} autre(s)" if others > 0 else ""
+                print(f"   Sentiment: {quote['emotion_category']} (intensité: {intensity_str}{suffix})")
+            if quote.get("is_misattributed"):
                 print("   ⚠️  CITATION MISATTRIBUÉE")
             print()
         
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Indexation des citations dans ChromaDB (utilisé par rag_server.py et en ligne de commande).
+
+La réindexation est incrémentale: chaque citation porte le hash de son texte enrichi,
+seules les citations ajoutées, modifiées ou supprimées sont (ré)encodées.
+En ligne de commande, l'index synchronisé est celui du backend RAG_VECTOR_BACKEND
+(chroma, ou matrice numpy / ivf persistée dans INDEX_DIR, voir vector_store.py).
+
+Usage:
+  python indexer.py            # synchronise l'index persistant avec le corpus
+  python indexer.py --full     # reconstruit tout l'index
+  RAG_VECTOR_BACKEND=numpy python indexer.py
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+# Normalisation et texte enrichi: corpus.py
+from corpus import ENRICHED_TEXT_VERSION, Corpus, as_corpus, load_corpus
+from embedding_cache import EmbeddingCache
+
+# Configuration
+EMBEDDER_MODEL = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+COLLECTION_NAME = "citations_mvp"
+CITATIONS_PATH = Path(__file__).resolve().parents[1] / "2000_citations_hasard.json"
+
+# Index persistant: réutilisé au redémarrage tant que corpus/modèle/enrichissement sont inchangés
+PERSIST_INDEX = os.environ.get("RAG_PERSIST_INDEX", "1") != "0"
+INDEX_DIR = Path(os.environ.get("RAG_INDEX_DIR", Path(__file__).resolve().parent / ".rag_index"))
+# À incrémenter à chaque modification des métadonnées stockées (force la réindexation)
+INDEX_SCHEMA_VERSION = 3
+# Taille des lots envoyés à ChromaDB (limite interne de SQLite)
+CHROMA_BATCH_SIZE = 1000
+
+Encoder = Callable[[List[str]], Any]
+# Corpus compilé (load_citations) ou liste de citations, compilée à la volée
+Citations = Union[Corpus, Iterable[Dict]]
+
+
+def load_citations(path: Path = CITATIONS_PATH) -> Tuple[Corpus, str]:
+    """Charge le corpus (instantané compilé si à jour, voir corpus.py). Retourne (citations, hash du fichier)."""
+    return load_corpus(Path(path))
+
+
+def index_fingerprint() -> str:
+    """Empreinte des paramètres d'encodage: si elle change, tout l'index doit être reconstruit."""
+    return f"{EMBEDDER_MODEL}@{ENRICHED_TEXT_VERSION}.{INDEX_SCHEMA_VERSION}"
+
+
+def open_client(persist: bool = PERSIST_INDEX):
+    """Client ChromaDB persistant (INDEX_DIR) ou en mémoire."""
+    # Import tardif: le backend NumPy n'a pas besoin de ChromaDB
+    import chromadb
+
+    if persist:
+        INDEX_DIR.mkdir(parents=True, exist_ok=True)
+        return chromadb.PersistentClient(path=str(INDEX_DIR))
+    return chromadb.Client()
+
+
+def open_collection(client, full: bool = False):
+    """Ouvre la collection; la recrée si elle n'existe pas, si full=True ou si l'empreinte a changé."""
+    fingerprint = index_fingerprint()
+    existing = None
+    if not full:
+        try:
+            existing = client.get_collection(name=COLLECTION_NAME)
+        except:
+            existing = None
+
+    if existing is not None:
+        if (existing.metadata or {}).get("fingerprint") == fingerprint:
+            return existing
+        print("🔁 Modèle ou enrichissement modifié: reconstruction de l'index", file=sys.stderr)
+
+    try:
+        client.delete_collection(name=COLLECTION_NAME)
+    except:
+        pass
+
+    return client.create_collection(
+        name=COLLECTION_NAME,
+        metadata={
+            "description": "Citations MVP avec recherche sémantique (tags + contexte)",
+            "fingerprint": fingerprint,
+            "corpus_hash": "",
+        }
+    )
+
+
+def sync_collection(collection, citations: Citations, encode: Encoder, corpus_hash: str = "") -> Dict[str, int]:
+    """
+    Synchronise la collection avec le corpus: n'encode que les citations ajoutées ou modifiées
+    et supprime celles qui ont disparu. Retourne le nombre de lignes par catégorie.
+    """
+    corpus = as_corpus(citations)
+    metadata = dict(collection.metadata or {})
+    if corpus_hash and metadata.get("corpus_hash") == corpus_hash and collection.count() == len(corpus):
+        return {"added": 0, "updated": 0, "removed": 0, "unchanged": len(corpus)}
+
+    ids = corpus.ids
+    hashes = corpus.content_hashes()
+
+    stored = collection.get(include=["metadatas"])
+    stored_hashes = {
+        sid: (meta or {}).get("content_hash")
+        for sid, meta in zip(stored["ids"], stored["metadatas"])
+    }
+
+    changed = []
+    added = updated = 0
+    for i, qid in enumerate(ids):
+        previous = stored_hashes.get(qid)
+        if previous is None:
+            added += 1
+        elif previous != hashes[i]:
+            updated += 1
+        else:
+            continue
+        changed.append(i)
+
+    removed_ids = list(set(stored_hashes) - set(ids))
+    for start in range(0, len(removed_ids), CHROMA_BATCH_SIZE):
+        collection.delete(ids=removed_ids[start:start + CHROMA_BATCH_SIZE])
+
+    if changed:
+        # Encoder uniquement les textes ENRICHIS qui ont changé
+        enriched_texts = [corpus.string("enriched", i) for i in changed]
+        embeddings = encode(enriched_texts)
+        for start in range(0, len(changed), CHROMA_BATCH_SIZE):
+            chunk = changed[start:start + CHROMA_BATCH_SIZE]
+            collection.upsert(
+                ids=[ids[i] for i in chunk],
+                embeddings=[embeddings[start + j].tolist() for j in range(len(chunk))],
+                documents=enriched_texts[start:start + len(chunk)],  # ✅ Textes enrichis pour cohérence sémantique
+                metadatas=[corpus.metadata(i) for i in chunk]
+            )
+
+    if corpus_hash:
+        metadata["corpus_hash"] = corpus_hash
+        collection.modify(metadata=metadata)
+
+    return {
+        "added": added,
+        "updated": updated,
+        "removed": len(removed_ids),
+        "unchanged": len(ids) - len(changed),
+    }
+
+
+def format_stats(stats: Dict[str, int]) -> str:
+    return (
+        f"+{stats['added']} ajoutées, ~{stats['updated']} modifiées, "
+        f"-{stats['removed']} supprimées, ={stats['unchanged']} inchangées"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synchronise l'index vectoriel des citations.")
+    parser.add_argument("--corpus", default=str(CITATIONS_PATH), help="Fichier JSON / NDJSON des citations")
+    parser.add_argument("--full", action="store_true", help="Reconstruit tout l'index")
+    args = parser.parse_args()
+
+    # Import tardif: vector_store importe ce module
+    from vector_store import VECTOR_BACKEND, create_store
+
+    if not PERSIST_INDEX:
+        print("❌ RAG_PERSIST_INDEX=0: aucun index persistant à synchroniser", file=sys.stderr)
+        sys.exit(1)
+
+    citations, corpus_hash = load_citations(Path(args.corpus))
+    store = create_store(VECTOR_BACKEND)
+    # Index existant rouvert d'abord: le diff part de son contenu
+    if store.restore(citations, corpus_hash) and not args.full:
+        print(f"✅ Index {VECTOR_BACKEND} déjà à jour ({INDEX_DIR}): {len(citations)} citations", file=sys.stderr)
+        return
+
+    cache = EmbeddingCache(EMBEDDER_MODEL)
+    embedder = None
+
+    def encode_missing(texts: List[str]):
+        # Le modèle n'est chargé que s'il y a effectivement des textes absents du cache
+        nonlocal embedder
+        if embedder is None:
+            from sentence_transformers import SentenceTransformer
+            print("🔄 Chargement du modèle...", file=sys.stderr)
+            embedder = SentenceTransformer(EMBEDDER_MODEL)
+        print(f"🔄 Encodage de {len(texts)} citations...", file=sys.stderr)
+        return embedder.encode(texts, show_progress_bar=False)
+
+    def encode(texts: List[str]):
+        return cache.encode(texts, encode_missing)
+
+    stats = store.sync(citations, encode, corpus_hash, full=args.full)
+    print(f"✅ Index {VECTOR_BACKEND} synchronisé ({INDEX_DIR}): {format_stats(stats)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
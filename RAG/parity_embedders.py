@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Parité des backends d'encodage (embedders.py) avec le SentenceTransformer de référence.
+
+Requêtes: test_queries.json (champ "query") s'il existe, complété par des citations du corpus
+tirées au hasard. Pour chaque backend:
+- cosinus entre l'embedding de référence et celui du backend (moyenne, minimum)
+- recouvrement du top-k: recherche exacte (NumpyStore, comme le serveur) dans le corpus encodé
+  par la référence, requêtes encodées par la référence puis par le backend
+- temps CPU et latence par requête, une requête par appel (cas de /search)
+
+Usage:
+  python parity_embedders.py
+  python parity_embedders.py --backends torch-int8 onnx-int8 --queries 300 --top-k 10 --json parity.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from corpus import Corpus
+from embedders import BACKENDS, load_embedder
+from embedding_cache import EmbeddingCache
+from indexer import CITATIONS_PATH, EMBEDDER_MODEL, load_citations
+from vector_store import NumpyStore
+
+QUERIES_FILE = Path(__file__).resolve().parent / "test_queries.json"
+WARMUP_QUERIES = 5
+
+
+def load_queries(corpus: Corpus, queries_file: Path, n: int, seed: int) -> List[str]:
+    """Requêtes de test, complétées jusqu'à n par des textes du corpus."""
+    queries: List[str] = []
+    if queries_file.exists():
+        with open(queries_file, "r", encoding="utf-8") as f:
+            queries = [q["query"] for q in json.load(f) if q.get("query")]
+    texts = [t for t in corpus.strings("text") if t]
+    rng = random.Random(seed)
+    queries += rng.sample(texts, max(0, min(n - len(queries), len(texts))))
+    return queries[:n]
+
+
+def measure(model, queries: List[str]) -> Dict:
+    """Embeddings + temps par requête (encode d'une seule requête, après échauffement)."""
+    for query in queries[:WARMUP_QUERIES]:
+        model.encode([query], show_progress_bar=False)
+
+    embeddings, cpu_ms, wall_ms = [], [], []
+    for query in queries:
+        c0, t0 = time.process_time(), time.perf_counter()
+        embeddings.append(np.asarray(model.encode([query], show_progress_bar=False), dtype=np.float32)[0])
+        # process_time compte tous les threads: c'est le coût CPU réel de la requête
+        cpu_ms.append((time.process_time() - c0) * 1000)
+        wall_ms.append((time.perf_counter() - t0) * 1000)
+    return {
+        "embeddings": np.stack(embeddings),
+        "cpu_ms": float(np.mean(cpu_ms)),
+        "p50_ms": float(np.percentile(wall_ms, 50)),
+        "p95_ms": float(np.percentile(wall_ms, 95)),
+    }
+
+
+def cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.einsum("ij,ij->i", a, b) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12)
+
+
+def top_ids(store: NumpyStore, embeddings: np.ndarray, top_k: int) -> List[set]:
+    hits = store.search(embeddings, top_k, [set() for _ in range(len(embeddings))])
+    return [{h[0] for h in query_hits} for query_hits in hits]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parité des backends d'encodage avec la référence torch")
+    parser.add_argument("--backends", nargs="*", default=[b for b in BACKENDS if b != "torch"], choices=BACKENDS)
+    parser.add_argument("--dataset", default=str(CITATIONS_PATH), help="Corpus de référence")
+    parser.add_argument("--queries-file", default=str(QUERIES_FILE))
+    parser.add_argument("--queries", type=int, default=200, help="Nombre de requêtes")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Écrit les résultats dans ce fichier")
+    args = parser.parse_args()
+
+    corpus, _ = load_citations(Path(args.dataset))
+    queries = load_queries(corpus, Path(args.queries_file), args.queries, args.seed)
+
+    print("🔄 Modèle de référence (torch)...", file=sys.stderr)
+    t0 = time.perf_counter()
+    reference = load_embedder("torch")
+    reference_load = time.perf_counter() - t0
+
+    # Corpus encodé une fois par la référence (cache disque partagé avec le serveur)
+    cache = EmbeddingCache(EMBEDDER_MODEL)
+    store = NumpyStore()
+    store.sync(corpus, lambda texts: cache.encode(texts, lambda todo: reference.encode(todo, show_progress_bar=False)))
+
+    ref = measure(reference, queries)
+    ref_top = top_ids(store, ref["embeddings"], args.top_k)
+    rows = [{
+        "backend": "torch", "load_seconds": round(reference_load, 2), "cosine_mean": 1.0, "cosine_min": 1.0,
+        f"overlap@{args.top_k}": 1.0, "cpu_ms_per_query": round(ref["cpu_ms"], 2),
+        "p50_ms": round(ref["p50_ms"], 2), "p95_ms": round(ref["p95_ms"], 2), "cpu_speedup": 1.0,
+    }]
+
+    for backend in args.backends:
+        print(f"🔄 Backend {backend}...", file=sys.stderr)
+        try:
+            t0 = time.perf_counter()
+            model = load_embedder(backend)
+            load_seconds = time.perf_counter() - t0
+        except Exception as e:
+            print(f"⚠️  {backend} indisponible: {e}", file=sys.stderr)
+            continue
+
+        result = measure(model, queries)
+        cosines = cosine(ref["embeddings"], result["embeddings"])
+        overlap = np.mean([
+            len(a & b) / max(1, len(a)) for a, b in zip(ref_top, top_ids(store, result["embeddings"], args.top_k))
+        ])
+        rows.append({
+            "backend": backend,
+            "load_seconds": round(load_seconds, 2),
+            "cosine_mean": round(float(cosines.mean()), 5),
+            "cosine_min": round(float(cosines.min()), 5),
+            f"overlap@{args.top_k}": round(float(overlap), 4),
+            "cpu_ms_per_query": round(result["cpu_ms"], 2),
+            "p50_ms": round(result["p50_ms"], 2),
+            "p95_ms": round(result["p95_ms"], 2),
+            "cpu_speedup": round(ref["cpu_ms"] / result["cpu_ms"], 2) if result["cpu_ms"] else 0.0,
+        })
+
+    overlap_key = f"overlap@{args.top_k}"
+    print(f"\n{len(queries)} requêtes, corpus {Path(args.dataset).name} ({len(corpus)} citations)")
+    header = (f"{'backend':<11} {'load s':>7} {'cos moy':>8} {'cos min':>8} {overlap_key:>11} "
+              f"{'CPU ms/q':>9} {'p50 ms':>7} {'p95 ms':>7} {'gain CPU':>9}")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['backend']:<11} {r['load_seconds']:>7} {r['cosine_mean']:>8} {r['cosine_min']:>8} "
+              f"{r[overlap_key]:>11} {r['cpu_ms_per_query']:>9} {r['p50_ms']:>7} {r['p95_ms']:>7} "
+              f"{r['cpu_speedup']:>8}x")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"dataset": Path(args.dataset).name, "queries": len(queries), "rows": rows},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,197 +2,303 @@
 """
 Serveur RAG minimaliste pour la recherche sémantique de citations.
 Expose une API /search qui prend une query et retourne le top-N citations.
+
+Le port est ouvert immédiatement: modèles et index sont chargés en arrière-plan (init),
+l'avancement est exposé par GET /health/live et GET /health/ready.
 """
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from sentence_transformers import SentenceTransformer
-import chromadb
-import json
-from pathlib import Path
-from typing import List, Dict, Tuple
+import numpy as np
+import hmac
+import os
+import threading
+from typing import Callable, List, Dict, Optional, Tuple
 import sys
+import time
+
+from batcher import MicroBatcher
+from embedders import EMBEDDER_BACKEND, load_embedder
+from embedding_cache import EmbeddingCache
+from indexer import (
+    CITATIONS_PATH,
+    EMBEDDER_MODEL,
+    INDEX_DIR,
+    PERSIST_INDEX,
+    format_stats,
+    load_citations,
+)
+from query_cache import TTLCache, normalize_query
+from reranker import Reranker
+from vector_store import VECTOR_BACKEND, create_store, parse_filters
 
 app = Flask(__name__)
 CORS(app)  # Permet les requêtes cross-origin depuis le front
 
 # Configuration
-EMBEDDER_MODEL = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
-COLLECTION_NAME = "citations_mvp"
-TOP_K_RETRIEVAL = 5  # Simplifié: pas de reranking
 TOP_K_FINAL = 5
+# Jeton requis par POST /reindex (en-tête X-Admin-Token); vide = endpoint désactivé
+# (CORS ouvert et serve.py exposable sur 0.0.0.0: pas de reconstruction sans authentification)
+ADMIN_TOKEN = os.environ.get("RAG_ADMIN_TOKEN", "")
+# POST /reindex ne met à jour que le processus qui le reçoit: désactivé par serve.py en multi-workers
+REINDEX_ENABLED = os.environ.get("RAG_REINDEX", "1") != "0"
+# Cache des embeddings de requêtes (les requêtes du front sont très répétitives)
+QUERY_CACHE_SIZE = int(os.environ.get("RAG_QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.environ.get("RAG_QUERY_CACHE_TTL", "3600"))
+# Micro-batching: les requêtes concurrentes sont encodées ensemble (fenêtre en ms, taille max)
+BATCH_WAIT_MS = float(os.environ.get("RAG_BATCH_WAIT_MS", "5"))
+BATCH_MAX_SIZE = int(os.environ.get("RAG_BATCH_MAX_SIZE", "32"))
+# Nombre maximal de requêtes acceptées par POST /search/batch
+MAX_BATCH_QUERIES = int(os.environ.get("RAG_MAX_BATCH_QUERIES", "256"))
+# Reranking CrossEncoder (optionnel): nombre de candidats et budget de latence par requête
+# (multiplié par le nombre de requêtes d'un appel /search/batch)
+RERANK = os.environ.get("RAG_RERANK", "0") == "1"
+TOP_K_RETRIEVAL = int(os.environ.get("RAG_RERANK_CANDIDATES", "20"))
+RERANK_BUDGET_MS = float(os.environ.get("RAG_RERANK_BUDGET_MS", "150"))
 
-# Chargement global (au démarrage du serveur)
-print("🔄 Chargement des modèles...", file=sys.stderr)
-embedder = SentenceTransformer(EMBEDDER_MODEL)
-print("✅ Modèles chargés", file=sys.stderr)
-
-# Initialisation ChromaDB + indexation
-print("🔄 Indexation des citations...", file=sys.stderr)
-# Utiliser le dataset demandé par l'utilisateur
-citations_path = Path(__file__).resolve().parents[1] / "2000_citations_hasard.json"
-print(f"📂 Fichier: {citations_path}", file=sys.stderr)
-with open(citations_path, 'r', encoding='utf-8') as f:
-    data = json.load(f)
-    citations = data if isinstance(data, list) else data.get("quotes", [])
-
-# Garantir IDs uniques
-seen_ids = {}
-for idx, quote in enumerate(citations):
-    base_id = quote.get("id")
-    if base_id in (None, ""):
-        base_id = f"cit_{idx}"
-    
-    dup_index = seen_ids.get(base_id, 0)
-    seen_ids[base_id] = dup_index + 1
-    
-    quote_id = base_id if dup_index == 0 else f"{base_id}__dup{dup_index}"
-    quote["id"] = quote_id
-
-# Fonction d'enrichissement avec tags + contexte pour optimiser la similitude
-def create_enriched_text(quote: Dict) -> str:
-    """Enrichit le texte avec priorité: contexte > tags > text > author pour matching émotionnel."""
-    text = (quote.get("Citation") or quote.get("text") or "").strip()
-    author = (quote.get("Auteur") or quote.get("author") or "").strip()
-    context = (quote.get("context") or quote.get("contexte") or "").strip()
-
-    tags = quote.get("tags") or []
-    if isinstance(tags, str):
-        tags = [tags]
-    if not isinstance(tags, list):
-        tags = []
-    tags_norm = [str(t).strip().lower() for t in tags if str(t).strip()]
-
-    # Ordre optimisé pour requêtes émotionnelles/narratives
-    parts = []
-    if context:
-        parts.append(f"Contexte: {context}")
-    if tags_norm:
-        parts.append(f"Tags: {', '.join(tags_norm)}")
-    if text:
-        parts.append(text)
-    if author:
-        parts.append(f"Auteur: {author}")
-
-    return "\n".join(parts)
-
-# Indexation
-client = chromadb.Client()
-try:
-    client.delete_collection(name=COLLECTION_NAME)
-except:
-    pass
-
-collection = client.create_collection(
-    name=COLLECTION_NAME,
-    metadata={"description": "Citations MVP avec recherche sémantique (tags + contexte)"}
-)
+# Taille des lots encodés pendant l'indexation (granularité de la progression /health/ready)
+INDEX_ENCODE_CHUNK = int(os.environ.get("RAG_INDEX_ENCODE_CHUNK", "256"))
 
-ids = []
-documents = []
-metadatas = []
-enriched_texts = []
-
-for quote in citations:
-    # ID robuste
-    qid = quote.get('id')
-    if not qid:
-        qid = f"cit_{len(ids)}"
-    ids.append(str(qid))
-
-    original_text = (quote.get('Citation') or quote.get('text') or '')
-    documents.append(original_text)
-
-    # Métadonnées avec texte original + attributs utiles
-    author = (quote.get("Auteur") or quote.get("author") or "")
-    context = (quote.get("context") or quote.get("contexte") or "")
-    tags = quote.get("tags") or []
-    if isinstance(tags, str):
-        tags = [tags]
-    if not isinstance(tags, list):
-        tags = []
-    # Convertir tags en string (ChromaDB ne supporte pas les listes en métadonnées)
-    tags_str = ", ".join([str(t).strip() for t in tags if str(t).strip()])
-
-    metadatas.append({
-        "author": author,
-        "tags": tags_str,
-        "context": context,
-        "original_text": original_text
-    })
 
-    enriched_texts.append(create_enriched_text(quote))
+class StartupStatus:
+    """
+    Avancement du démarrage, mis à jour par init() et lu par /health/ready.
+    Phases: starting -> loading_model -> loading_corpus -> loading_index -> indexing -> ready (ou failed).
+    serving passe à True dès qu'un index répond aux recherches, éventuellement l'index persisté
+    (stale=True) pendant que la reconstruction se poursuit.
+    """
 
-# Encoder les textes ENRICHIS
-embeddings = embedder.encode(enriched_texts, show_progress_bar=False)
-# Stocker les textes enrichis pour maintenir la cohérence avec les embeddings
-collection.add(
-    ids=ids,
-    embeddings=embeddings.tolist(),
-    documents=enriched_texts,  # ✅ Textes enrichis pour cohérence sémantique
-    metadatas=metadatas
-)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fields = {
+            "phase": "starting",
+            "serving": False,
+            "stale": False,
+            "indexed": 0,
+            "total": 0,
+            "model_load_seconds": None,
+            "index_seconds": None,
+            "error": None,
+        }
+        self.started_at = time.time()
 
-print(f"✅ {len(citations)} citations indexées", file=sys.stderr)
+    def set(self, **fields):
+        with self._lock:
+            self._fields.update(fields)
 
-@app.route('/search', methods=['POST'])
-def search():
+    def progress(self, done: int, total: int):
+        self.set(indexed=done, total=total)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            fields = dict(self._fields)
+        fields["percent"] = round(100.0 * fields["indexed"] / fields["total"], 1) if fields["total"] else 0.0
+        fields["uptime_seconds"] = round(time.time() - self.started_at, 1)
+        return fields
+
+
+startup = StartupStatus()
+
+# Renseignés par init(): tant que store est None, seules les routes /health répondent
+embedder = None  # Encodeur des requêtes (backend RAG_EMBEDDER_BACKEND, voir embedders.py)
+reranker = None
+citations = None
+store = None
+
+# Cache disque des embeddings du corpus (partagé avec test_rag.py)
+embedding_cache = EmbeddingCache(EMBEDDER_MODEL)
+
+# Modèle de référence pour le corpus, chargé seulement si des textes manquent au cache
+corpus_embedder = None
+corpus_embedder_lock = threading.Lock()
+
+def reference_embedder():
+    """Le cache d'embeddings est indexé par modèle: le corpus est toujours encodé en float32 (torch)."""
+    global corpus_embedder
+    if EMBEDDER_BACKEND == "torch":
+        return embedder
+    with corpus_embedder_lock:
+        if corpus_embedder is None:
+            print("🔄 Chargement du modèle de référence pour le corpus...", file=sys.stderr)
+            corpus_embedder = load_embedder("torch")
+        return corpus_embedder
+
+def encode_corpus(texts: List[str], progress: Optional[Callable[[int, int], None]] = None):
+    """Embeddings des textes enrichis: cache disque, puis encodage par lots des textes absents."""
+    def encode_missing(todo: List[str]):
+        model = reference_embedder()
+        done = len(texts) - len(todo)
+        chunks = []
+        for start in range(0, len(todo), INDEX_ENCODE_CHUNK):
+            chunks.append(model.encode(todo[start:start + INDEX_ENCODE_CHUNK], show_progress_bar=False))
+            if progress is not None:
+                progress(done + start + len(chunks[-1]), len(texts))
+        return np.concatenate(chunks)
+
+    return embedding_cache.encode(texts, encode_missing)
+
+def init():
     """
-    API de recherche sémantique.
-    Body JSON: { 
-        "query": "phrase de recherche", 
-        "top_k": 5,
-        "exclude_ids": ["id1", "id2", ...]  # IDs à exclure (citations déjà vues)
-    }
-    Retourne: { "results": [{ "id", "text", "score", "metadata" }, ...] }
+    Charge modèles, corpus et index (bloquant). Lancé en tâche de fond par start() pour que le
+    serveur réponde immédiatement, ou appelé directement par serve.py avant le fork des workers.
     """
+    global embedder, reranker, citations, store
     try:
-        data = request.get_json()
-        query = data.get("query", "").strip()
-        top_k = data.get("top_k", TOP_K_FINAL)
-        exclude_ids = data.get("exclude_ids", [])
-        
-        if not query:
-            return jsonify({"error": "Query manquante"}), 400
-        
-        # Valider exclude_ids
-        if not isinstance(exclude_ids, list):
-            exclude_ids = []
-        exclude_ids_set = set(str(x) for x in exclude_ids if x)
-        
-        # Phase 1: Retrieval vectoriel
-        # On récupère plus de résultats pour compenser les exclusions
-        retrieval_count = min(TOP_K_RETRIEVAL + len(exclude_ids_set), len(citations))
-        
-        query_embedding = embedder.encode([query])[0]
-        results = collection.query(
-            query_embeddings=[query_embedding.tolist()],
-            n_results=retrieval_count
-        )
-        
-        ids_list = results['ids'][0]
-        documents_list = results['documents'][0]
-        metadatas_list = results['metadatas'][0]
-        distances_list = results.get('distances', [[]])[0]  # Récupérer les distances
-        
-        # Filtrer les IDs exclus
-        filtered = []
-        for i, (quote_id, doc, meta) in enumerate(zip(ids_list, documents_list, metadatas_list)):
-            if quote_id not in exclude_ids_set:
-                # Calculer le score de similarité depuis la distance L2 au carré
-                # ChromaDB retourne des distances L2 squared (au carré)
-                # Conversion en similarité : similarity ≈ 1 / (1 + distance)
-                distance = distances_list[i] if i < len(distances_list) else float('inf')
-                similarity_score = 1.0 / (1.0 + distance) if distance < float('inf') else 0.0
-                filtered.append((quote_id, doc, meta, similarity_score))
-        
-        # Pas de reranking pour le MVP: utiliser directement les top-k résultats chromadb
-        if not filtered:
-            return jsonify({"results": []}), 200
-        
+        startup.set(phase="loading_model")
+        print(f"🔄 Chargement des modèles (encodeur: {EMBEDDER_BACKEND})...", file=sys.stderr)
+        t0 = time.perf_counter()
+        embedder = load_embedder(EMBEDDER_BACKEND)
+        reranker = Reranker(budget_ms=RERANK_BUDGET_MS) if RERANK else None
+        startup.set(model_load_seconds=round(time.perf_counter() - t0, 2))
+        print(f"✅ Modèles chargés ({time.perf_counter() - t0:.1f}s)", file=sys.stderr)
+
+        startup.set(phase="loading_corpus")
+        # Utiliser le dataset demandé par l'utilisateur
+        print(f"📂 Fichier: {CITATIONS_PATH}", file=sys.stderr)
+        corpus, corpus_hash = load_citations(CITATIONS_PATH)
+        startup.set(total=len(corpus))
+
+        # Index persistant: servi tout de suite, même périmé, pendant la reconstruction
+        t0 = time.perf_counter()
+        startup.set(phase="loading_index")
+        new_store = create_store(VECTOR_BACKEND)
+        fresh = new_store.restore(corpus, corpus_hash) if PERSIST_INDEX else None
+        if fresh is not None:
+            citations, store = corpus, new_store
+            startup.set(serving=True, stale=not fresh)
+            print(f"♻️  Index persistant rechargé ({len(new_store)} citations"
+                  f"{'' if fresh else ', périmé: mise à jour en cours'})", file=sys.stderr)
+
+        if not fresh:
+            startup.set(phase="indexing")
+            print(f"🔄 Indexation des citations (backend: {VECTOR_BACKEND})...", file=sys.stderr)
+            with reindex_lock:
+                stats = new_store.sync(corpus, lambda texts: encode_corpus(texts, startup.progress), corpus_hash)
+            citations, store = corpus, new_store
+            if PERSIST_INDEX:
+                print(f"♻️  Index persistant ({INDEX_DIR}): {format_stats(stats)}", file=sys.stderr)
+
+        startup.set(phase="ready", serving=True, stale=False, indexed=len(corpus), total=len(corpus),
+                    index_seconds=round(time.perf_counter() - t0, 2))
+        print(f"✅ {len(citations)} citations indexées", file=sys.stderr)
+    except Exception as e:
+        startup.set(phase="failed", error=str(e))
+        print(f"❌ Échec du démarrage: {e}", file=sys.stderr)
+        raise
+
+def start() -> threading.Thread:
+    """Lance init() dans un thread: le serveur accepte les connexions pendant le chargement."""
+    def run():
+        try:
+            init()
+        except Exception:
+            pass  # Déjà signalé par init(); /health/live répond 500
+
+    thread = threading.Thread(target=run, name="rag-init", daemon=True)
+    thread.start()
+    return thread
+
+query_cache = TTLCache(max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+query_batcher = MicroBatcher(
+    lambda texts: embedder.encode(texts, batch_size=len(texts), show_progress_bar=False),
+    max_wait_ms=BATCH_WAIT_MS,
+    max_batch=BATCH_MAX_SIZE
+)
+
+def embed_query(query: str):
+    """Embedding d'une requête, servi depuis le cache LRU quand c'est possible."""
+    key = normalize_query(query)
+    embedding = query_cache.get(key)
+    if embedding is None:
+        embedding = query_batcher.submit(key)
+        query_cache.put(key, embedding)
+    return embedding
+
+# Une seule réindexation à la fois
+reindex_lock = threading.Lock()
+
+@app.before_request
+def require_index():
+    """503 tant qu'aucun index n'est prêt (les routes /health restent disponibles)."""
+    if store is not None or request.path.startswith("/health") or request.method == "OPTIONS":
+        return None
+    response = jsonify({"error": "Serveur en cours de démarrage", **startup.snapshot()})
+    response.headers["Retry-After"] = "5"
+    return response, 503
+
+def parse_search_spec(data: Dict) -> Tuple[str, int, set, Optional[Dict]]:
+    """Valide un objet { query, top_k, exclude_ids, filters } -> (query, top_k, ids exclus, filtres)."""
+    if not isinstance(data, dict):
+        raise ValueError("Requête invalide")
+    query = (data.get("query") or "").strip()
+    exclude_ids = data.get("exclude_ids", [])
+
+    if not query:
+        raise ValueError("Query manquante")
+
+    try:
+        top_k = int(data.get("top_k", TOP_K_FINAL))
+    except (TypeError, ValueError):
+        raise ValueError("top_k invalide")
+    if top_k < 1:
+        raise ValueError("top_k invalide")
+
+    # Valider exclude_ids
+    if not isinstance(exclude_ids, list):
+        exclude_ids = []
+    exclude_ids_set = set(str(x) for x in exclude_ids if x)
+    return query, top_k, exclude_ids_set, parse_filters(data.get("filters"))
+
+def embed_queries(queries: List[str]):
+    """Embeddings d'un lot de requêtes: cache LRU d'abord, puis un seul appel à l'encodeur."""
+    keys = [normalize_query(q) for q in queries]
+    embeddings = [query_cache.get(k) for k in keys]
+    missing = list(dict.fromkeys(k for k, e in zip(keys, embeddings) if e is None))
+    if missing:
+        encoded = dict(zip(missing, embedder.encode(missing, show_progress_bar=False)))
+        for k, e in encoded.items():
+            query_cache.put(k, e)
+        embeddings = [encoded[k] if e is None else e for k, e in zip(keys, embeddings)]
+    return embeddings
+
+def run_search(
+    query_embeddings: List,
+    specs: List[Tuple[str, int, set, Optional[Dict]]]
+) -> Tuple[List[List[Dict]], Optional[bool]]:
+    """
+    Retrieval vectoriel (un seul appel au backend pour toutes les requêtes), reranking
+    optionnel, puis formatage. Les IDs exclus et les filtres de métadonnées sont appliqués par
+    le backend pendant la recherche, donc top_k résultats sont toujours renvoyés s'il en existe assez.
+    Retourne (résultats par requête, reranked): reranked vaut None sans reranker, False si le
+    budget a été dépassé et que l'ordre vectoriel a été renvoyé.
+    """
+    retrieval_count = max(spec[1] for spec in specs)
+    if reranker is not None:
+        # Le reranker choisit parmi TOP_K_RETRIEVAL candidats
+        retrieval_count = max(retrieval_count, TOP_K_RETRIEVAL)
+    hits = store.search(
+        np.stack(query_embeddings),
+        retrieval_count,
+        [spec[2] for spec in specs],
+        [spec[3] for spec in specs]
+    )
+
+    # Phase 2: reranking CrossEncoder (repli sur l'ordre vectoriel si le budget est dépassé)
+    if reranker is not None:
+        ranked = reranker.rerank_many([spec[0] for spec in specs], hits)
+        reranked = all(scores is not None for _, scores in ranked)
+    else:
+        reranked = None
+        ranked = [(query_hits, None) for query_hits in hits]
+
+    outputs = []
+    for (_, top_k, _, _), (query_hits, rerank_scores) in zip(specs, ranked):
         # Formatter la réponse
         results_out = []
-        for quote_id, text, metadata, score in filtered[:top_k]:
+        for rank, (quote_id, text, metadata, distance) in enumerate(query_hits[:top_k]):
+            # Calculer le score de similarité depuis la distance L2 au carré
+            # Conversion en similarité : similarity ≈ 1 / (1 + distance)
+            score = 1.0 / (1.0 + distance) if distance < float('inf') else 0.0
             # Utiliser le texte original pour l'affichage, pas le texte enrichi
             display_text = metadata.get('original_text', text)
             results_out.append({
@@ -202,22 +308,166 @@ def search():
                 "metadata": {
                     "author": metadata.get('author', ''),
                     "tags": metadata.get('tags', ''),  # String séparé par des virgules
-                    "context": metadata.get('context', '')
+                    "context": metadata.get('context', ''),
+                    "need": metadata.get('need', ''),
+                    "mood": metadata.get('mood', ''),
+                    "tone": metadata.get('tone', ''),
+                    "energy": metadata.get('energy', -1),
+                    "is_injunctive": metadata.get('is_injunctive', False),
+                    "is_guilt_inducing": metadata.get('is_guilt_inducing', False),
+                    "is_toxic_positive": metadata.get('is_toxic_positive', False)
                 }
             })
-        
-        return jsonify({"results": results_out})
+            if rerank_scores is not None:
+                results_out[-1]["rerank_score"] = round(rerank_scores[rank], 4)
+        outputs.append(results_out)
+
+    return outputs, reranked
+
+def search_response(results: List, reranked: Optional[bool]) -> Dict:
+    """Corps de réponse de /search et /search/batch."""
+    response = {"results": results}
+    if reranked is not None:
+        response["reranked"] = reranked
+    return response
+
+@app.route('/search', methods=['POST'])
+def search():
+    """
+    API de recherche sémantique.
+    Body JSON: { 
+        "query": "phrase de recherche", 
+        "top_k": 5,
+        "exclude_ids": ["id1", "id2", ...],  # IDs à exclure (citations déjà vues)
+        "filters": {                          # Optionnel, appliqué avant le classement
+            "need": "calme",                  # str ou liste (idem mood, tone)
+            "energy_cap": 2,                  # énergie <= cap (inconnue acceptée)
+            "safe": true                      # exclut injonctif / culpabilisant / positivité toxique
+        }
+    }
+    Retourne: { "results": [{ "id", "text", "score", "metadata" }, ...] }
+    + "reranked" si le reranking est activé (false = budget dépassé, ordre vectoriel renvoyé)
+    """
+    try:
+        try:
+            spec = parse_search_spec(request.get_json())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Phase 1: Retrieval vectoriel
+        query_embedding = embed_query(spec[0])
+        results, reranked = run_search([query_embedding], [spec])
+
+        return jsonify(search_response(results[0], reranked))
     
     except Exception as e:
         print(f"❌ Erreur: {e}", file=sys.stderr)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """
+    Recherche sémantique groupée (jobs de précalcul).
+    Body JSON: { "queries": [{ "query", "top_k", "exclude_ids", "filters" }, ...] }
+    Retourne: { "results": [[{ "id", "text", "score", "metadata" }, ...], ...] } dans l'ordre des requêtes
+    (+ "reranked" comme /search)
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        queries = data.get("queries")
+        if not isinstance(queries, list) or not queries:
+            return jsonify({"error": "Liste 'queries' manquante"}), 400
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({"error": f"Maximum {MAX_BATCH_QUERIES} requêtes par appel"}), 400
+
+        specs = []
+        for i, item in enumerate(queries):
+            try:
+                specs.append(parse_search_spec(item))
+            except ValueError as e:
+                return jsonify({"error": f"Requête {i}: {e}"}), 400
+
+        query_embeddings = embed_queries([spec[0] for spec in specs])
+        return jsonify(search_response(*run_search(query_embeddings, specs)))
+
+    except Exception as e:
+        print(f"❌ Erreur: {e}", file=sys.stderr)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    """Liveness: le processus répond (500 si le démarrage a échoué, à redémarrer)."""
+    status = startup.snapshot()
+    if status["phase"] == "failed":
+        return jsonify({"status": "failed", "error": status["error"]}), 500
+    return jsonify({"status": "alive", "uptime_seconds": status["uptime_seconds"]})
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    """
+    Readiness: 200 dès qu'un index répond aux recherches (stale=true s'il s'agit de l'index
+    persisté en cours de mise à jour), 503 sinon.
+    Retourne: { "ready", "phase", "percent", "indexed", "total", "stale", "model_load_seconds", "index_seconds", ... }
+    """
+    status = startup.snapshot()
+    ready = status["serving"] and store is not None
+    return jsonify({"ready": ready, **status}), 200 if ready else 503
+
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint."""
-    return jsonify({"status": "ok", "citations_count": len(citations)})
+    """Health check endpoint (503 pendant le démarrage, voir /health/ready)."""
+    if store is None:
+        return jsonify({"status": "starting", "startup": startup.snapshot()}), 503
+    return jsonify({
+        "status": "ok",
+        "startup": startup.snapshot(),
+        "citations_count": len(citations),
+        "vector_backend": store.name,
+        "vector_dtype": getattr(store, "dtype", "float32"),
+        "embedder_backend": EMBEDDER_BACKEND,
+        "query_cache": query_cache.stats(),
+        "batching": query_batcher.stats(),
+        "reranking": reranker.stats() if reranker is not None else None,
+    })
+
+@app.route('/reindex', methods=['POST'])
+def reindex():
+    """
+    Endpoint admin: relit le corpus et ne réencode que les citations ajoutées/modifiées.
+    En-tête X-Admin-Token = RAG_ADMIN_TOKEN (sans jeton configuré, l'endpoint répond 403).
+    Body JSON optionnel: { "full": true } pour reconstruire tout l'index.
+    Retourne: { "added", "updated", "removed", "unchanged", "citations_count" }
+    """
+    global citations
+
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Réindexation désactivée: définir RAG_ADMIN_TOKEN"}), 403
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        return jsonify({"error": "Non autorisé"}), 403
+
+    if not REINDEX_ENABLED:
+        return jsonify({"error": "Réindexation désactivée (plusieurs workers): redémarrer le service"}), 409
+
+    if not reindex_lock.acquire(blocking=False):
+        return jsonify({"error": "Réindexation déjà en cours"}), 409
+
+    try:
+        data = request.get_json(silent=True) or {}
+        new_citations, new_hash = load_citations(CITATIONS_PATH)
+        result = store.sync(new_citations, encode_corpus, new_hash, full=bool(data.get("full")))
+        citations = new_citations
+        print(f"🔁 Réindexation: {format_stats(result)}", file=sys.stderr)
+        return jsonify({**result, "citations_count": len(citations)})
+    except Exception as e:
+        print(f"❌ Erreur de réindexation: {e}", file=sys.stderr)
+        return jsonify({"error": str(e)}), 500
+    finally:
+        reindex_lock.release()
 
 if __name__ == '__main__':
+    # Serveur de développement (un seul processus); en production: python serve.py
+    # Le port est ouvert tout de suite: suivre le chargement via GET /health/ready
+    start()
     print("\n🚀 Serveur RAG démarré sur http://localhost:5001", file=sys.stderr)
     print("📍 Endpoint: POST /search avec { \"query\": \"...\" }\n", file=sys.stderr)
     app.run(host='127.0.0.1', port=5001, debug=False)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Reranking CrossEncoder pour rag_server.py, avec budget de latence.
+
+Toutes les paires (requête, candidat) d'un appel sont scorées en un seul predict().
+Le budget est par requête: un appel groupé (/search/batch) dispose de budget × le nombre
+de requêtes à scorer. S'il est dépassé, l'ordre vectoriel est renvoyé tel quel; le calcul en cours
+termine en arrière-plan et alimente le cache des scores (clé: requête, ID, hash du texte),
+la même requête sera donc rerankée au prochain appel.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Dict, List, Optional, Tuple
+
+from query_cache import TTLCache, normalize_query
+
+RERANKER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+# (id, document, métadonnées, distance) comme dans vector_store.py
+Hit = Tuple[str, str, Dict, float]
+
+
+class Reranker:
+    """Reranking borné en temps, avec cache des scores par (requête, citation)."""
+
+    def __init__(
+        self,
+        model_name: str = RERANKER_MODEL,
+        budget_ms: float = 150.0,
+        cache_size: int = 20000,
+        cache_ttl: float = 3600.0,
+        max_pending: int = 4
+    ):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name)
+        self.budget = budget_ms / 1000.0  # par requête
+        self.max_pending = max_pending
+        self.cache = TTLCache(max_size=cache_size, ttl=cache_ttl)
+        self.reranked = 0
+        self.fallbacks = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        # Un seul thread: le CrossEncoder n'est pas appelé en parallèle
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+
+    @staticmethod
+    def _key(query: str, hit: Hit) -> Tuple[str, str, str]:
+        return (query, hit[0], hit[2].get("content_hash", ""))
+
+    def _predict(self, keys: List[Tuple[str, str, str]], pairs: List[List[str]]):
+        try:
+            scores = self.model.predict(pairs, batch_size=max(1, len(pairs)), show_progress_bar=False)
+            for key, score in zip(keys, scores):
+                self.cache.put(key, float(score))
+            return [float(s) for s in scores]
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def rerank_many(self, queries: List[str], hits: List[List[Hit]]) -> List[Tuple[List[Hit], Optional[List[float]]]]:
+        """
+        Reclasse les candidats de chaque requête par score CrossEncoder.
+        Retourne, par requête, (candidats ordonnés, scores) ou (ordre vectoriel, None) si le
+        budget est dépassé ou si trop de calculs sont déjà en attente.
+        """
+        queries = [normalize_query(q) for q in queries]
+        scores: List[List[Optional[float]]] = []
+        missing_keys, missing_pairs, missing_slots = [], [], []
+        missing_queries = set()
+        for q, (query, query_hits) in enumerate(zip(queries, hits)):
+            row = []
+            for i, hit in enumerate(query_hits):
+                key = self._key(query, hit)
+                cached = self.cache.get(key)
+                row.append(cached)
+                if cached is None:
+                    missing_keys.append(key)
+                    missing_pairs.append([query, hit[1]])
+                    missing_slots.append((q, i))
+                    missing_queries.add(q)
+            scores.append(row)
+
+        if missing_pairs:
+            with self._lock:
+                saturated = self._pending >= self.max_pending
+                if not saturated:
+                    self._pending += 1
+            if saturated:
+                self.fallbacks += 1
+                return [(query_hits, None) for query_hits in hits]
+
+            future = self._executor.submit(self._predict, missing_keys, missing_pairs)
+            try:
+                predicted = future.result(timeout=self.budget * len(missing_queries))
+            except TimeoutError:
+                self.fallbacks += 1
+                return [(query_hits, None) for query_hits in hits]
+            for (q, i), score in zip(missing_slots, predicted):
+                scores[q][i] = score
+
+        self.reranked += 1
+        outputs = []
+        for query_hits, row in zip(hits, scores):
+            order = sorted(range(len(query_hits)), key=lambda i: row[i], reverse=True)
+            outputs.append(([query_hits[i] for i in order], [row[i] for i in order]))
+        return outputs
+
+    def stats(self) -> Dict:
+        return {
+            "budget_ms": self.budget * 1000.0,
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "score_cache": self.cache.stats(),
+        }
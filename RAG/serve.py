@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Point d'entrée de production de rag_server.py: gunicorn en pré-fork.
+
+Le maître importe rag_server une seule fois (preload): modèle, corpus et index sont construits
+avant le fork et partagés par copie-sur-écriture entre les workers. La matrice d'embeddings
+des backends numpy / ivf est en plus mappée en lecture seule depuis INDEX_DIR (voir
+NumpyStore._persist): ses pages restent communes à tous les workers.
+Le chargement (rag_server.init) est donc fait de façon synchrone dans le maître, avant
+l'ouverture du port; sans preload (chroma), l'unique worker le lance en arrière-plan et
+répond 503 sur /health/ready jusqu'à ce que son index soit prêt.
+
+Chaque worker limite ses threads de calcul (torch + BLAS) à --intra-op-threads, pour que
+workers × threads ne dépasse pas le nombre de cœurs. Les requêtes d'un worker sont servies
+par --threads threads (gthread), que le micro-batcher regroupe en un seul appel au modèle.
+
+Prérequis:
+  pip install gunicorn   (Linux / macOS)
+
+Usage:
+  RAG_VECTOR_BACKEND=numpy python serve.py                     # un worker par cœur, 1 thread de calcul chacun
+  RAG_VECTOR_BACKEND=numpy python serve.py --workers 4 --intra-op-threads 2 --bind 0.0.0.0:5001
+
+Limites:
+- backend chroma: le client SQLite ne survit pas au fork (pas de preload) et ne supporte pas
+  plusieurs processus écrivant dans le même INDEX_DIR: un seul worker, --workers > 1 est refusé
+- POST /reindex ne mettrait à jour qu'un seul worker: désactivé dès 2 workers, redémarrer
+  le service pour réindexer
+"""
+
+import argparse
+import gc
+import os
+import sys
+
+# Pas d'import de numpy / torch ici: les variables de threads doivent être posées avant
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+INTRA_OP_THREADS = int(os.environ.get("RAG_INTRA_OP_THREADS", "1"))
+WORKERS = int(os.environ.get("RAG_WORKERS", "0"))  # 0 = cœurs / threads de calcul
+WORKER_THREADS = int(os.environ.get("RAG_WORKER_THREADS", "8"))
+BIND = os.environ.get("RAG_BIND", "127.0.0.1:5001")
+WORKER_TIMEOUT = int(os.environ.get("RAG_WORKER_TIMEOUT", "120"))
+
+
+def default_workers(intra_op_threads: int) -> int:
+    return max(1, (os.cpu_count() or 1) // max(1, intra_op_threads))
+
+
+def limit_threads(intra_op_threads: int):
+    """Threads de calcul de torch pour le processus courant (à rappeler après chaque fork)."""
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(intra_op_threads)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sert rag_server.py avec gunicorn (pré-fork, modèle préchargé)")
+    parser.add_argument("--bind", default=BIND, help="Adresse d'écoute (host:port)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Processus workers (0 = cœurs / --intra-op-threads; 1 seul avec chroma)")
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS,
+                        help="Threads de requêtes par worker")
+    parser.add_argument("--intra-op-threads", type=int, default=INTRA_OP_THREADS,
+                        help="Threads de calcul torch / BLAS par worker")
+    parser.add_argument("--timeout", type=int, default=WORKER_TIMEOUT,
+                        help="Délai (s) avant redémarrage d'un worker bloqué")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Même défaut que vector_store.VECTOR_BACKEND (non importé: numpy / torch pas encore configurés)
+    chroma = os.environ.get("RAG_VECTOR_BACKEND", "chroma") == "chroma"
+    if chroma and args.workers > 1:
+        print("❌ Backend chroma: un seul worker (chaque worker ouvrirait et synchroniserait la même "
+              "base SQLite); RAG_VECTOR_BACKEND=numpy pour plusieurs workers", file=sys.stderr)
+        sys.exit(1)
+    workers = 1 if chroma else args.workers or default_workers(args.intra_op_threads)
+
+    # Hérité par le maître (chargement du modèle) puis par chaque worker
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(args.intra_op_threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    if workers > 1:
+        os.environ["RAG_REINDEX"] = "0"
+
+    from gunicorn.app.base import BaseApplication
+
+    preload = not chroma
+    if not preload:
+        print("⚠️  Backend chroma: un seul worker, sans preload "
+              "(RAG_VECTOR_BACKEND=numpy pour plusieurs workers)", file=sys.stderr)
+
+    def when_ready(server):
+        # Objets du maître hors du ramasse-miettes: les workers n'en réécrivent pas les en-têtes
+        gc.collect()
+        gc.freeze()
+        server.log.info("Démarrage de %d workers", workers)
+
+    def post_fork(server, worker):
+        limit_threads(args.intra_op_threads)
+
+    class RagApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": args.bind,
+                "workers": workers,
+                "worker_class": "gthread",
+                "threads": args.threads,
+                "timeout": args.timeout,
+                "preload_app": preload,
+                "when_ready": when_ready,
+                "post_fork": post_fork,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            limit_threads(args.intra_op_threads)
+            import rag_server
+            if preload:
+                # Dans le maître: les threads ne survivent pas au fork, l'index doit être complet avant
+                rag_server.init()
+            else:
+                rag_server.start()
+            return rag_server.app
+
+    print(f"🚀 {workers} workers × {args.threads} threads ({args.intra_op_threads} thread(s) de calcul chacun) "
+          f"sur http://{args.bind}", file=sys.stderr)
+    RagApplication().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 """
 Test RAG pour citations françaises avec ChromaDB.
-Évalue la qualité de la recherche sémantique sur les requêtes utilisateur.
+Affiche les résultats de chaque requête de test pour une relecture manuelle.
+Pour des métriques automatiques (recall@k, MRR, nDCG, latence), voir benchmark.py.
+
+Usage:
+  python test_rag.py                 # toutes les requêtes d'affilée
+  python test_rag.py --interactive   # pause entre les requêtes pour les noter
 """
 
+import argparse
 import json
 import chromadb
 from sentence_transformers import SentenceTransformer, CrossEncoder
@@ -11,6 +17,9 @@ from typing import List, Dict, Tuple
 import time
 from pathlib import Path
 
+from corpus import Corpus, load_corpus
+from embedding_cache import EmbeddingCache
+
 # Configuration
 COLLECTION_NAME = "citations_mvp"
 TOP_K_RETRIEVAL = 20  # Nombre de candidats pour le retrieval
@@ -24,44 +33,13 @@ RERANKER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
 # Dataset principal (le fichier est à la racine du repo)
 DATASET_FILE = (Path(__file__).resolve().parents[1] / "citations.json")
 
-def load_quotes(filename: str = str(DATASET_FILE)) -> List[Dict]:
-    """Charge les citations depuis le fichier JSON."""
-    with open(filename, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    # Formats supportés:
-    # 1) Liste directe de citations
-    # 2) Objet avec clé "quotes" (format QuoteKG extrait par extract_quotekg_final.py)
-    if isinstance(data, list):
-        quotes = data
-    elif isinstance(data, dict):
-        quotes = data.get("quotes") or data.get("citations") or []
-    else:
-        raise TypeError(f"Format JSON inattendu: {type(data)}")
-
-    if not isinstance(quotes, list):
-        raise TypeError(f"La clé 'quotes' doit être une liste, reçu: {type(quotes)}")
-
-    # Garantir un champ id stable ET unique (ChromaDB exige l'unicité)
-    normalized: List[Dict] = []
-    seen_ids: Dict[str, int] = {}
-    for idx, quote in enumerate(quotes):
-        if not isinstance(quote, dict):
-            raise TypeError(f"Citation invalide à l'index {idx}: {type(quote)}")
-
-        base_id = quote.get("id")
-        if base_id in (None, ""):
-            base_id = quote.get("uri") or f"quote_{idx}"
-
-        dup_index = seen_ids.get(base_id, 0)
-        seen_ids[base_id] = dup_index + 1
-
-        quote_id = base_id if dup_index == 0 else f"{base_id}__dup{dup_index}"
-        quote = {**quote, "id": quote_id}
-
-        normalized.append(quote)
-
-    return normalized
+def load_quotes(filename: str = str(DATASET_FILE)) -> Corpus:
+    """
+    Charge les citations normalisées (IDs uniques) via corpus.py: mêmes formats et même
+    instantané compilé que rag_server.py (liste JSON, objet "quotes"/"citations", NDJSON).
+    """
+    corpus, _ = load_corpus(Path(filename))
+    return corpus
 
 def load_test_queries(filename: str = "test_queries.json") -> List[Dict]:
     """Charge les requêtes de test."""
@@ -73,32 +51,15 @@ def create_enriched_text(quote: Dict) -> str:
     Crée un texte enrichi pour l'indexation en ajoutant les métadonnées utiles.
     Objectif: maximiser la qualité sémantique (texte + attributs).
     """
-    # Supporte plusieurs schémas (citations.json / gpt_quotes_rag.json / quotekg_citations.json)
-    text = (quote.get("text") or quote.get("citation") or "").strip()
-
-    author = (quote.get("author") or quote.get("auteur") or "").strip()
-
-    year = quote.get("year")
-    if year in (None, ""):
-        year = quote.get("annee")
-    year = "" if year is None else str(year).strip()
-
-    emotion_category = (quote.get("emotion_category") or "").strip()
-
-    # emotion_intensity peut être str/float/int selon le dataset
-    emotion_intensity = quote.get("emotion_intensity", "")
-    if emotion_intensity is None:
-        emotion_intensity = ""
-    emotion_intensity = str(emotion_intensity).strip()
-
-    source = (quote.get("source") or "").strip()
-    context = (quote.get("context") or quote.get("contexte") or "").strip()
-    tags = quote.get("tags") or []
-    if isinstance(tags, str):
-        tags = [tags]
-    if not isinstance(tags, list):
-        tags = []
-    tags = [str(t).strip() for t in tags if str(t).strip()]
+    # Citation normalisée par corpus.py (tous les schémas ont les mêmes clés)
+    text = quote["text"]
+    author = quote["author"]
+    year = quote["year"]
+    emotion_category = quote["emotion_category"]
+    emotion_intensity = "" if quote["emotion_intensity"] is None else str(quote["emotion_intensity"])
+    source = quote["source"]
+    context = quote["context"]
+    tags = quote["tags"]
 
     # Format "champ: valeur" (facile à apprendre pour l'embedding)
     # On répète légèrement certains champs importants pour augmenter leur poids sémantique.
@@ -112,20 +73,16 @@ def create_enriched_text(quote: Dict) -> str:
         parts.append(f"Année: {year}")
 
     # Champs spécifiques à citations.json (très utiles pour le matching sémantique)
-    need = (quote.get("need") or "").strip()
-    mood = (quote.get("mood") or "").strip()
-    tone = (quote.get("tone") or "").strip()
-    length = (quote.get("length") or "").strip()
-    language = (quote.get("language") or "").strip()
+    need = quote["need"]
+    mood = quote["mood"]
+    tone = quote["tone"]
+    length = quote["length"]
+    language = quote["language"]
+    energy = "" if quote["energy"] is None else str(quote["energy"])
 
-    energy = quote.get("energy", "")
-    if energy is None:
-        energy = ""
-    energy = str(energy).strip()
-
-    is_injunctive = quote.get("is_injunctive")
-    is_guilt_inducing = quote.get("is_guilt_inducing")
-    is_toxic_positive = quote.get("is_toxic_positive")
+    is_injunctive = quote["is_injunctive"]
+    is_guilt_inducing = quote["is_guilt_inducing"]
+    is_toxic_positive = quote["is_toxic_positive"]
 
     if need:
         parts.append(f"Besoin: {need}")
@@ -208,7 +165,7 @@ def initialize_rag_system() -> Tuple[chromadb.Collection, SentenceTransformer, C
     return collection, embedder, reranker
 
 def index_quotes(
-    quotes: List[Dict],
+    quotes: Corpus,
     collection: chromadb.Collection,
     embedder: SentenceTransformer
 ):
@@ -227,50 +184,41 @@ def index_quotes(
 
     for quote in quotes:
         ids.append(quote['id'])
-        documents.append((quote.get('text') or quote.get('citation') or ''))  # Texte original pour l'affichage
-
-        tags = quote.get("tags")
-        if isinstance(tags, list):
-            tags = ", ".join([str(t).strip() for t in tags if str(t).strip()])
-        elif tags is None:
-            tags = ""
-        else:
-            tags = str(tags)
+        documents.append(quote['text'])  # Texte original pour l'affichage
 
         # ChromaDB: metadata doit être un dict plat de scalaires (str/int/float/bool)
-        energy = quote.get("energy")
-        try:
-            energy = -1 if energy is None else int(energy)
-        except Exception:
-            energy = -1
-
         metadatas.append({
-            "author": (quote.get("author") or quote.get("auteur") or ""),
-            "year": "" if quote.get("year") is None else str(quote.get("year")),
-            "need": (quote.get("need") or ""),
-            "mood": (quote.get("mood") or ""),
-            "tone": (quote.get("tone") or ""),
-            "length": (quote.get("length") or ""),
-            "energy": energy,
-            "is_injunctive": bool(quote.get("is_injunctive", False)),
-            "is_guilt_inducing": bool(quote.get("is_guilt_inducing", False)),
-            "is_toxic_positive": bool(quote.get("is_toxic_positive", False)),
-            "language": (quote.get("language") or ""),
-            "emotion_category": (quote.get("emotion_category") or ""),
-            "emotion_intensity": quote.get("emotion_intensity", ""),
-            "source": (quote.get("source") or ""),
-            "tags": tags,
+            "author": quote["author"],
+            "year": quote["year"],
+            "need": quote["need"],
+            "mood": quote["mood"],
+            "tone": quote["tone"],
+            "length": quote["length"],
+            "energy": -1 if quote["energy"] is None else quote["energy"],
+            "is_injunctive": bool(quote["is_injunctive"]),
+            "is_guilt_inducing": bool(quote["is_guilt_inducing"]),
+            "is_toxic_positive": bool(quote["is_toxic_positive"]),
+            "language": quote["language"],
+            "emotion_category": quote["emotion_category"],
+            "emotion_intensity": "" if quote["emotion_intensity"] is None else quote["emotion_intensity"],
+            "source": quote["source"],
+            "tags": ", ".join(quote["tags"]),
         })
 
         # Texte enrichi pour l'embedding (sans context/source)
         enriched_texts.append(create_enriched_text(quote))
 
-    # Générer les embeddings
+    # Générer les embeddings (seuls les textes absents du cache disque sont encodés)
     print("Génération des embeddings...")
     start_time = time.time()
-    embeddings = embedder.encode(enriched_texts, show_progress_bar=True)
+    cache = EmbeddingCache(EMBEDDER_MODEL)
+    cached_before = len(cache)
+    embeddings = cache.encode(
+        enriched_texts,
+        lambda texts: embedder.encode(texts, show_progress_bar=True)
+    )
     elapsed = time.time() - start_time
-    print(f"   OK: Embeddings générés en {elapsed:.2f}s\n")
+    print(f"   OK: Embeddings générés en {elapsed:.2f}s ({len(cache) - cached_before} encodés, reste depuis le cache)\n")
 
     # Indexer dans ChromaDB
     print("Indexation dans ChromaDB...")
@@ -328,7 +276,8 @@ def evaluate_query(
     query_obj: Dict,
     collection: chromadb.Collection,
     embedder: SentenceTransformer,
-    reranker: CrossEncoder
+    reranker: CrossEncoder,
+    interactive: bool = False
 ):
     """
     Évalue une requête test et affiche les résultats.
@@ -377,6 +326,9 @@ def evaluate_query(
 
         print()
 
+    if not interactive:
+        return
+
     # Demander l'évaluation manuelle
     print("ÉVALUATION MANUELLE:")
     print("   Excellent (5/5) : Lien sémantique fort, citation parfaitement adaptée")
@@ -385,9 +337,9 @@ def evaluate_query(
     print("   Faible (2/5)    : Hors-sujet partiel")
     print("   Hors-sujet (1/5): Aucun rapport\n")
 
-def run_evaluation():
+def run_evaluation(interactive: bool = False):
     """
-    Lance l'évaluation complète du système RAG.
+    Lance l'évaluation complète du système RAG (pause entre les requêtes si interactive).
     """
     print("\nÉVALUATION DU SYSTÈME RAG POUR CITATIONS FRANÇAISES")
     print("=" * 80)
@@ -419,9 +371,9 @@ def run_evaluation():
 
     for i, query_obj in enumerate(test_queries, 1):
         print(f"\n[Test {i}/{len(test_queries)}]")
-        evaluate_query(query_obj, collection, embedder, reranker)
+        evaluate_query(query_obj, collection, embedder, reranker, interactive)
 
-        if i < len(test_queries):
+        if interactive and i < len(test_queries):
             input("\nAppuyez sur Entrée pour la requête suivante...")
 
     print("\n" + "=" * 80)
@@ -430,6 +382,9 @@ def run_evaluation():
     print("   1. Noter la qualité des résultats pour chaque requête")
     print("   2. Identifier les patterns de réussite et d'échec")
     print("   3. Ajuster l'enrichissement des données si nécessaire")
+    print("   4. Suivre les régressions avec benchmark.py (requêtes annotées dans test_queries.json)")
 
 if __name__ == "__main__":
-    run_evaluation()
+    parser = argparse.ArgumentParser(description="Relecture des résultats des requêtes de test")
+    parser.add_argument("--interactive", action="store_true", help="Pause entre les requêtes pour les noter")
+    run_evaluation(parser.parse_args().interactive)
@@ -0,0 +1,742 @@
+#!/usr/bin/env python3
+"""
+Backends de recherche vectorielle interchangeables pour rag_server.py.
+
+- chroma : collection ChromaDB (persistante, voir indexer.py)
+- numpy  : matrice en mémoire, un seul produit matriciel + argpartition
+- ivf    : index approximatif (k-means + listes inversées) pour les gros corpus
+
+numpy et ivf stockent les vecteurs du corpus en float32, float16 ou int8 avec une échelle
+par ligne (RAG_VECTOR_DTYPE); les scores sont calculés directement sur ce tableau compact.
+
+Tous renvoient des distances L2 au carré, le score affiché reste donc identique
+quel que soit le backend. Sélection via RAG_VECTOR_BACKEND.
+
+Les exclusions d'IDs et les filtres de métadonnées (need, mood, tone, energy_cap,
+flags de sécurité) sont appliqués pendant la recherche, avant le classement.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from corpus import Corpus, as_corpus
+from indexer import (
+    INDEX_DIR,
+    PERSIST_INDEX,
+    Citations,
+    index_fingerprint,
+    open_client,
+    open_collection,
+    sync_collection,
+)
+
+VECTOR_BACKEND = os.environ.get("RAG_VECTOR_BACKEND", "chroma")
+
+# Index IVF: nombre de listes (0 = auto, 4·√n), listes sondées par requête, itérations k-means
+IVF_NLIST = int(os.environ.get("RAG_IVF_NLIST", "0"))
+IVF_NPROBE = int(os.environ.get("RAG_IVF_NPROBE", "8"))
+IVF_TRAIN_ITERS = int(os.environ.get("RAG_IVF_TRAIN_ITERS", "20"))
+# Centroïdes persistés réutilisés tant que la taille du corpus reste dans [n/dérive, n·dérive]
+IVF_RETRAIN_DRIFT = float(os.environ.get("RAG_IVF_RETRAIN_DRIFT", "2"))
+IVF_DIR = INDEX_DIR / "ivf" if PERSIST_INDEX else None
+# Matrice numpy/ivf écrite dans INDEX_DIR/<backend> et mappée en lecture seule: les workers
+# pré-forkés (serve.py) la partagent via le cache de pages au lieu d'en garder chacun une copie,
+# et rag_server.py la rouvre au démarrage (restore) pendant la reconstruction
+MMAP_MATRIX = PERSIST_INDEX and os.environ.get("RAG_MMAP_MATRIX", "1") != "0"
+# Stockage des vecteurs numpy/ivf: float32 (4 octets/dim), float16 (2) ou int8 + échelle par ligne (1).
+# int8 garde une latence proche de float32; la conversion float16 -> float32 de numpy est lente
+VECTOR_DTYPE = os.environ.get("RAG_VECTOR_DTYPE", "float32")
+VECTOR_DTYPES = ("float32", "float16", "int8")
+# Lignes converties en float32 à la fois pour les formats compacts (petits blocs = restent en cache CPU)
+SCORE_CHUNK_ROWS = int(os.environ.get("RAG_SCORE_CHUNK_ROWS", "1024"))
+
+# (id, document, métadonnées, distance L2 au carré)
+Hit = Tuple[str, str, Dict, float]
+Encoder = Callable[[List[str]], np.ndarray]
+
+
+def quantize(matrix: np.ndarray, dtype: str = VECTOR_DTYPE) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Matrice float32 -> (matrice stockée dans dtype, échelle par ligne pour int8 sinon None)."""
+    if dtype == "float32":
+        return np.ascontiguousarray(matrix, dtype=np.float32), None
+    if dtype == "float16":
+        return np.ascontiguousarray(matrix, dtype=np.float16), None
+    if dtype == "int8":
+        # Quantification symétrique par ligne: x ≈ scale · code, code dans [-127, 127]
+        scale = (np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.zeros(0)).astype(np.float32)
+        scale[scale == 0] = 1.0
+        codes = np.rint(matrix / scale[:, None]).astype(np.int8)
+        return codes, scale
+    raise ValueError(f"Format de vecteurs inconnu: {dtype} (attendu: {', '.join(VECTOR_DTYPES)})")
+
+
+def dequantize(matrix: np.ndarray, scale: Optional[np.ndarray] = None, rows=slice(None)) -> np.ndarray:
+    """Lignes rows (tranche ou indices) de la matrice stockée, en float32."""
+    block = np.asarray(matrix[rows], dtype=np.float32)
+    return block * scale[rows, None] if scale is not None else block
+
+
+def dot_products(
+    matrix: np.ndarray,
+    scale: Optional[np.ndarray],
+    queries: np.ndarray,
+    chunk_rows: int = SCORE_CHUNK_ROWS
+) -> np.ndarray:
+    """
+    queries @ matrix.T (n_queries, n) calculé sur la matrice stockée, sans la décompresser:
+    les formats compacts sont convertis par blocs de chunk_rows lignes, et l'échelle int8
+    est appliquée aux scores (x·q = scale · (code·q)) plutôt qu'aux vecteurs.
+    """
+    if matrix.dtype == np.float32:
+        return queries @ matrix.T
+    out = np.empty((len(queries), len(matrix)), dtype=np.float32)
+    for start in range(0, len(matrix), chunk_rows):
+        block = np.asarray(matrix[start:start + chunk_rows], dtype=np.float32)
+        out[:, start:start + len(block)] = queries @ block.T
+    if scale is not None:
+        out *= scale[None, :]
+    return out
+
+
+def row_sq_norms(matrix: np.ndarray, scale: Optional[np.ndarray], chunk_rows: int = SCORE_CHUNK_ROWS) -> np.ndarray:
+    """||x||² des vecteurs tels que stockés: les distances restent cohérentes avec dot_products."""
+    out = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), chunk_rows):
+        block = dequantize(matrix, scale, slice(start, start + chunk_rows))
+        out[start:start + len(block)] = np.einsum("ij,ij->i", block, block)
+    return out
+
+# Champs filtrables (voir Corpus.metadata dans corpus.py)
+CATEGORY_FIELDS = ("need", "mood", "tone")
+SAFETY_FLAGS = ("is_injunctive", "is_guilt_inducing", "is_toxic_positive")
+
+
+def parse_filters(raw: Optional[Dict]) -> Optional[Dict]:
+    """
+    Valide les filtres d'une requête /search et les met sous forme normalisée:
+      { "need": [..], "mood": [..], "tone": [..], "energy_cap": int, "exclude_flags": [..] }
+    Entrée acceptée: chaque champ catégoriel en str ou liste de str, "energy_cap" entier,
+    "exclude_flags" liste de flags, ou "safe": true pour exclure les trois flags de sécurité.
+    Retourne None s'il n'y a aucun filtre. Lève ValueError si l'entrée est invalide.
+    """
+    if raw in (None, {}):
+        return None
+    if not isinstance(raw, dict):
+        raise ValueError("filters doit être un objet")
+
+    filters: Dict = {}
+    for field in CATEGORY_FIELDS:
+        value = raw.get(field)
+        if value in (None, "", []):
+            continue
+        values = [value] if isinstance(value, str) else value
+        if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+            raise ValueError(f"filtre {field} invalide")
+        filters[field] = sorted(set(values))
+
+    if raw.get("energy_cap") is not None:
+        try:
+            filters["energy_cap"] = int(raw["energy_cap"])
+        except (TypeError, ValueError):
+            raise ValueError("filtre energy_cap invalide")
+
+    flags = set(SAFETY_FLAGS) if raw.get("safe") else set()
+    extra_flags = raw.get("exclude_flags") or []
+    if not isinstance(extra_flags, list) or not set(extra_flags) <= set(SAFETY_FLAGS):
+        raise ValueError(f"exclude_flags doit être une liste parmi {', '.join(SAFETY_FLAGS)}")
+    flags.update(extra_flags)
+    if flags:
+        filters["exclude_flags"] = sorted(flags)
+
+    return filters or None
+
+
+def filters_key(filters: Optional[Dict]) -> str:
+    return json.dumps(filters, sort_keys=True) if filters else ""
+
+
+def chroma_where(filters: Optional[Dict], excluded: Set[str]) -> Optional[Dict]:
+    """Traduit exclusions + filtres en clause where ChromaDB."""
+    clauses = []
+    if excluded:
+        clauses.append({"qid": {"$nin": sorted(excluded)}})
+    if filters:
+        for field in CATEGORY_FIELDS:
+            if field in filters:
+                clauses.append({field: {"$in": filters[field]}})
+        if "energy_cap" in filters:
+            # Énergie inconnue (-1) acceptée, comme dans safetyFilter (app.js)
+            clauses.append({"energy": {"$lte": filters["energy_cap"]}})
+        for flag in filters.get("exclude_flags", []):
+            clauses.append({flag: {"$ne": True}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class VectorStore:
+    """Interface commune des backends."""
+
+    name = ""
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def ids(self) -> Set[str]:
+        raise NotImplementedError
+
+    def sync(self, citations: Citations, encode: Encoder, corpus_hash: str = "", full: bool = False) -> Dict[str, int]:
+        """Aligne l'index sur le corpus; retourne les compteurs added/updated/removed/unchanged."""
+        raise NotImplementedError
+
+    def restore(self, citations: Citations, corpus_hash: str = "") -> Optional[bool]:
+        """
+        Rouvre l'index persisté par un précédent sync, sans rien encoder, pour servir des
+        recherches pendant que sync le met à jour. Retourne None s'il n'y a rien d'utilisable,
+        True s'il correspond exactement au corpus (sync inutile), False s'il est périmé.
+        """
+        return None
+
+    def search(
+        self,
+        embeddings: np.ndarray,
+        top_k: int,
+        exclude_ids: List[Set[str]],
+        filters: Optional[List[Optional[Dict]]] = None
+    ) -> List[List[Hit]]:
+        """
+        Top-k par requête (une ligne d'embeddings par requête). Les IDs exclus et les citations
+        ne passant pas les filtres (voir parse_filters) sont écartés pendant la recherche:
+        top_k résultats sont renvoyés dès qu'il en existe assez.
+        """
+        raise NotImplementedError
+
+
+class ChromaStore(VectorStore):
+    """Collection ChromaDB; les exclusions passent par un filtre where sur la métadonnée qid."""
+
+    name = "chroma"
+
+    def __init__(self, persist: bool = PERSIST_INDEX):
+        self.persist = persist
+        self.client = open_client(persist)
+        self.collection = None
+        self._ids: Set[str] = set()
+
+    @property
+    def ids(self) -> Set[str]:
+        return self._ids
+
+    def sync(self, citations, encode, corpus_hash="", full=False):
+        corpus = as_corpus(citations)
+        collection = open_collection(self.client, full=full)
+        stats = sync_collection(collection, corpus, encode, corpus_hash)
+        self.collection = collection
+        self._ids = set(corpus.ids)
+        return stats
+
+    def restore(self, citations, corpus_hash=""):
+        if not self.persist:
+            return None
+        collection = open_collection(self.client)
+        if collection.count() == 0:
+            return None
+        self.collection = collection
+        self._ids = set(collection.get(include=[])["ids"])
+        return bool(corpus_hash) and (collection.metadata or {}).get("corpus_hash") == corpus_hash
+
+    def search(self, embeddings, top_k, exclude_ids, filters=None):
+        filters = filters or [None] * len(exclude_ids)
+        # Les requêtes partageant exclusions et filtres sont envoyées en un seul appel
+        groups: Dict[Tuple[frozenset, str], List[int]] = {}
+        for q, excluded in enumerate(exclude_ids):
+            groups.setdefault((frozenset(excluded), filters_key(filters[q])), []).append(q)
+
+        outputs: List[List[Hit]] = [[] for _ in exclude_ids]
+        for (excluded, _), positions in groups.items():
+            excluded = excluded & self._ids
+            retrieval_count = min(top_k, len(self._ids) - len(excluded))
+            if retrieval_count <= 0:
+                continue
+
+            results = self.collection.query(
+                query_embeddings=[embeddings[q].tolist() for q in positions],
+                n_results=retrieval_count,
+                where=chroma_where(filters[positions[0]], excluded)
+            )
+            for row, q in enumerate(positions):
+                distances = (results.get('distances') or [[]] * len(positions))[row]
+                outputs[q] = [
+                    (quote_id, doc, meta, distances[i] if i < len(distances) else float('inf'))
+                    for i, (quote_id, doc, meta) in enumerate(zip(
+                        results['ids'][row], results['documents'][row], results['metadatas'][row]
+                    ))
+                ]
+        return outputs
+
+
+class NumpyStore(VectorStore):
+    """
+    Recherche exacte brute-force: distances L2² = ||x||² - 2 x·q + ||q||² pour toutes les lignes
+    en un produit matriciel, masque booléen pour les exclusions et filtres, argpartition pour le top-k.
+    La matrice est stockée dans le format dtype (float32, float16 ou int8 + échelle par ligne,
+    voir quantize) et les scores sont calculés sur ce format (dot_products).
+    Les filtres s'appuient sur un index colonnaire (un masque par valeur de need/mood/tone,
+    un tableau d'énergie, un tableau par flag) tiré directement des colonnes du corpus;
+    les métadonnées d'un résultat ne sont construites qu'au moment où il est renvoyé.
+    La matrice est reconstruite depuis le cache d'embeddings; avec matrix_dir, elle est ensuite
+    écrite sur disque et remplacée par un mmap en lecture seule (partagé entre processus),
+    avec les IDs et hashes de ses lignes (index.json) pour que restore() puisse la rouvrir.
+    """
+
+    name = "numpy"
+
+    def __init__(self, matrix_dir: Optional[Path] = None, dtype: str = VECTOR_DTYPE):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Format de vecteurs inconnu: {dtype} (attendu: {', '.join(VECTOR_DTYPES)})")
+        self.matrix_dir = Path(matrix_dir) if matrix_dir else None
+        self.dtype = dtype
+        self._state = self._empty_state()
+        # Lignes persistées écartées par restore() (absentes du corpus): {id: hash}, comptées par sync()
+        self._dropped: Dict[str, str] = {}
+
+    @staticmethod
+    def _empty_state():
+        return {
+            "ids": [],
+            "rows": {},
+            "documents": [],
+            "metadatas": [],
+            "hashes": [],
+            "matrix": np.zeros((0, 0), dtype=np.float32),
+            "scale": None,
+            "sq_norms": np.zeros(0, dtype=np.float32),
+            "filter_index": {},
+        }
+
+    @property
+    def ids(self) -> Set[str]:
+        return set(self._state["rows"])
+
+    def __len__(self) -> int:
+        return len(self._state["ids"])
+
+    def sync(self, citations, encode, corpus_hash="", full=False):
+        # Diff contre l'index persistant complet, y compris les lignes que restore() n'a pas rechargées
+        previous = {**self._dropped, **dict(zip(self._state["ids"], self._state["hashes"]))}
+        corpus = as_corpus(citations)
+        ids = corpus.ids
+        hashes = corpus.content_hashes()
+        enriched_texts = corpus.enriched_texts()
+        matrix, scale = quantize(np.asarray(encode(enriched_texts), dtype=np.float32), self.dtype)
+
+        added = sum(1 for qid in ids if qid not in previous)
+        updated = sum(1 for qid, h in zip(ids, hashes) if qid in previous and previous[qid] != h)
+
+        # Remplacement atomique: une recherche concurrente voit l'ancien ou le nouvel état
+        state = self._prepare({
+            "ids": ids,
+            "rows": {qid: i for i, qid in enumerate(ids)},
+            "documents": enriched_texts,
+            "metadatas": corpus.metadatas(),
+            "hashes": hashes,
+            "matrix": matrix,
+            "scale": scale,
+            "sq_norms": row_sq_norms(matrix, scale),
+            "filter_index": self._build_filter_index(corpus),
+        }, full=full)
+        self._state = self._persist(state, corpus_hash)
+        self._dropped = {}
+        return {
+            "added": added,
+            "updated": updated,
+            "removed": len(set(previous) - set(ids)),
+            "unchanged": len(ids) - added - updated,
+        }
+
+    def _prepare(self, state: Dict, full: bool = False) -> Dict:
+        """Point d'extension: structures dérivées construites avant la publication de l'état."""
+        return state
+
+    def _persist(self, state: Dict, corpus_hash: str) -> Dict:
+        """
+        Écrit la matrice (et l'échelle int8) dans matrix_dir et les remplace par des mmaps en lecture seule.
+        index.json (empreinte, format, hash du corpus, IDs et hashes des lignes, noms des fichiers)
+        est remplacé en dernier: un lecteur voit toujours un ensemble cohérent.
+        """
+        if self.matrix_dir is None or not len(state["matrix"]):
+            return state
+        self.matrix_dir.mkdir(parents=True, exist_ok=True)
+        token = f"{os.getpid()}-{time.time_ns()}"
+        files = {"matrix": f"matrix-{token}.npy"}
+        if state["scale"] is not None:
+            files["scale"] = f"scale-{token}.npy"
+        for key, name in files.items():
+            with open(self.matrix_dir / name, "wb") as f:
+                np.save(f, state[key])
+        meta = {
+            "fingerprint": index_fingerprint(),
+            "dtype": self.dtype,
+            "corpus_hash": corpus_hash,
+            **files,
+            "ids": state["ids"],
+            "hashes": state["hashes"],
+        }
+        tmp_path = self.matrix_dir / f"index.json.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.matrix_dir / "index.json")
+        # Les processus qui mappent encore une ancienne matrice gardent leurs pages (inode conservé)
+        for pattern in ("matrix-*.npy", "scale-*.npy"):
+            for old in self.matrix_dir.glob(pattern):
+                if old.name not in files.values():
+                    old.unlink(missing_ok=True)
+        return {**state, **{key: np.load(self.matrix_dir / name, mmap_mode="r") for key, name in files.items()}}
+
+    def restore(self, citations, corpus_hash=""):
+        if self.matrix_dir is None:
+            return None
+        try:
+            with open(self.matrix_dir / "index.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            # Format différent (RAG_VECTOR_DTYPE modifié): reconstruction depuis le cache d'embeddings
+            if meta.get("fingerprint") != index_fingerprint() or meta.get("dtype", "float32") != self.dtype:
+                return None
+            matrix = np.load(self.matrix_dir / meta["matrix"], mmap_mode="r")
+            scale = np.load(self.matrix_dir / meta["scale"], mmap_mode="r") if "scale" in meta else None
+        except (OSError, ValueError, KeyError):
+            return None
+        if len(matrix) != len(meta["ids"]) or (scale is not None) != (self.dtype == "int8"):
+            return None
+
+        # Lignes persistées encore présentes dans le corpus; textes et métadonnées du corpus courant
+        corpus = as_corpus(citations)
+        corpus_rows = {qid: i for i, qid in enumerate(corpus.ids)}
+        kept = [i for i, qid in enumerate(meta["ids"]) if qid in corpus_rows]
+        self._dropped = {qid: h for qid, h in zip(meta["ids"], meta["hashes"]) if qid not in corpus_rows}
+        if not kept:
+            return None
+        if len(kept) != len(matrix):
+            matrix = np.ascontiguousarray(matrix[kept])
+            scale = scale[kept] if scale is not None else None
+        ids = [meta["ids"][i] for i in kept]
+        rows = np.array([corpus_rows[qid] for qid in ids], dtype=np.int64)
+        enriched_texts = corpus.enriched_texts()
+
+        self._state = self._prepare({
+            "ids": ids,
+            "rows": {qid: i for i, qid in enumerate(ids)},
+            "documents": [enriched_texts[r] for r in rows],
+            "metadatas": corpus.metadatas().take(rows),
+            # Hashes persistés: le sync suivant détecte les citations modifiées depuis
+            "hashes": [meta["hashes"][i] for i in kept],
+            "matrix": matrix,
+            "scale": scale,
+            "sq_norms": row_sq_norms(matrix, scale),
+            "filter_index": self._take_filter_index(self._build_filter_index(corpus), rows),
+        })
+        return bool(corpus_hash) and meta.get("corpus_hash") == corpus_hash and len(ids) == len(corpus)
+
+    @staticmethod
+    def _build_filter_index(corpus: Corpus) -> Dict:
+        """Index colonnaire des attributs filtrables (codes internés du corpus, sans dict par citation)."""
+        index = {field: corpus.category_masks(field) for field in CATEGORY_FIELDS}
+        index["energy"] = np.asarray(corpus.columns["energy"], dtype=np.int16)
+        for flag in SAFETY_FLAGS:
+            # Flag inconnu (-1) = non exclu, comme bool(None) auparavant
+            index[flag] = np.asarray(corpus.columns[flag]) == 1
+        return index
+
+    @staticmethod
+    def _take_filter_index(index: Dict, order: np.ndarray) -> Dict:
+        """Index des filtres pour des lignes réordonnées."""
+        return {
+            key: {value: mask[order] for value, mask in column.items()} if isinstance(column, dict) else column[order]
+            for key, column in index.items()
+        }
+
+    @staticmethod
+    def _allowed_mask(state: Dict, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """Masque des lignes passant les filtres (None = toutes)."""
+        if not filters:
+            return None
+        index = state["filter_index"]
+        mask = np.ones(len(state["ids"]), dtype=bool)
+        for field in CATEGORY_FIELDS:
+            if field in filters:
+                by_value = index[field]
+                allowed = np.zeros_like(mask)
+                for value in filters[field]:
+                    if value in by_value:
+                        allowed |= by_value[value]
+                mask &= allowed
+        if "energy_cap" in filters:
+            mask &= index["energy"] <= filters["energy_cap"]
+        for flag in filters.get("exclude_flags", []):
+            mask &= ~index[flag]
+        return mask
+
+    def search(self, embeddings, top_k, exclude_ids, filters=None):
+        state = self._state
+        n = len(state["ids"])
+        if n == 0:
+            return [[] for _ in exclude_ids]
+        filters = filters or [None] * len(exclude_ids)
+
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(exclude_ids), -1)
+        # (n_queries, n) en un seul produit matriciel
+        distances = state["sq_norms"][None, :] - 2.0 * dot_products(state["matrix"], state["scale"], queries)
+        distances += np.einsum("ij,ij->i", queries, queries)[:, None]
+        np.maximum(distances, 0.0, out=distances)
+
+        outputs = []
+        for q, excluded in enumerate(exclude_ids):
+            row = distances[q]
+            mask = self._allowed_mask(state, filters[q])
+            if mask is not None:
+                row[~mask] = np.inf
+            rows = [state["rows"][qid] for qid in excluded if qid in state["rows"]]
+            if rows:
+                row[rows] = np.inf
+            k = min(top_k, int(np.count_nonzero(np.isfinite(row))) if mask is not None else n - len(rows))
+            if k <= 0:
+                outputs.append([])
+                continue
+            top = np.argpartition(row, k - 1)[:k] if k < n else np.arange(n)
+            top = top[np.argsort(row[top], kind="stable")]
+            outputs.append([
+                (state["ids"][i], state["documents"][i], state["metadatas"][i], float(row[i]))
+                for i in top
+            ])
+        return outputs
+
+
+class IvfStore(NumpyStore):
+    """
+    Index approximatif IVF (inverted file) pour les gros corpus (100k+ citations).
+
+    Les vecteurs sont répartis en nlist listes par k-means; une requête ne calcule les
+    distances exactes que sur les nprobe listes aux centroïdes les plus proches.
+    Les lignes sont réordonnées par liste (chaque liste = une tranche contiguë de la matrice).
+    Les centroïdes sont persistés dans INDEX_DIR/ivf avec le nlist et la taille de corpus
+    de l'entraînement, et réutilisés tant que le modèle et la dimension sont inchangés et que
+    le corpus n'a pas dérivé au-delà de retrain_drift (×2 par défaut) depuis; les nouvelles
+    lignes sont simplement affectées. full=True force un nouvel entraînement.
+
+    Compromis rappel/latence: nprobe (plus grand = meilleur rappel, plus lent), nlist.
+    Voir ann_recall.py pour mesurer le recall@k face à la recherche exacte.
+    """
+
+    name = "ivf"
+
+    def __init__(
+        self,
+        nlist: int = IVF_NLIST,
+        nprobe: int = IVF_NPROBE,
+        train_iters: int = IVF_TRAIN_ITERS,
+        index_dir: Optional[Path] = IVF_DIR,
+        seed: int = 0,
+        matrix_dir: Optional[Path] = None,
+        dtype: str = VECTOR_DTYPE,
+        retrain_drift: float = IVF_RETRAIN_DRIFT
+    ):
+        super().__init__(matrix_dir, dtype)
+        self.nlist = nlist
+        self.retrain_drift = retrain_drift
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self.index_dir = Path(index_dir) if index_dir else None
+        self.seed = seed
+
+    def _effective_nlist(self, n: int) -> int:
+        nlist = self.nlist if self.nlist > 0 else int(4 * np.sqrt(n))
+        return max(1, min(nlist, n))
+
+    def _load_centroids(self, n: int, dim: int) -> Optional[np.ndarray]:
+        """
+        Centroïdes persistés s'ils conviennent encore à un corpus de n lignes: nlist de
+        l'entraînement conservé (l'auto 4·√n varie à chaque ajout), réentraînement seulement
+        si n a dérivé au-delà de retrain_drift ou si le nlist configuré a changé.
+        """
+        if self.index_dir is None:
+            return None
+        meta_path = self.index_dir / "meta.json"
+        if not meta_path.exists():
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("fingerprint") != index_fingerprint() or meta.get("dim") != dim:
+            return None
+        trained_n, nlist = meta.get("n", 0), meta.get("nlist", 0)
+        if not trained_n or nlist > n or not trained_n / self.retrain_drift <= n <= trained_n * self.retrain_drift:
+            return None
+        if self.nlist > 0 and nlist != self._effective_nlist(trained_n):
+            return None
+        return np.load(self.index_dir / "centroids.npy")
+
+    def _save_centroids(self, centroids: np.ndarray, n: int):
+        if self.index_dir is None:
+            return
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        np.save(self.index_dir / "centroids.npy", centroids)
+        meta = {
+            "fingerprint": index_fingerprint(),
+            "nlist": len(centroids),
+            "dim": int(centroids.shape[1]),
+            "n": n,
+        }
+        tmp_path = self.index_dir / "meta.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.index_dir / "meta.json")
+
+    @staticmethod
+    def _assign(
+        matrix: np.ndarray,
+        centroids: np.ndarray,
+        scale: Optional[np.ndarray] = None,
+        chunk: int = 16384
+    ) -> np.ndarray:
+        """Liste (centroïde le plus proche) de chaque ligne, par blocs pour borner la mémoire."""
+        c_norms = np.einsum("ij,ij->i", centroids, centroids)
+        out = np.empty(len(matrix), dtype=np.int32)
+        for start in range(0, len(matrix), chunk):
+            block = dequantize(matrix, scale, slice(start, start + chunk))
+            out[start:start + chunk] = np.argmin(c_norms[None, :] - 2.0 * (block @ centroids.T), axis=1)
+        return out
+
+    def _train(self, matrix: np.ndarray, nlist: int, scale: Optional[np.ndarray] = None) -> np.ndarray:
+        """k-means (Lloyd) sur un échantillon d'au plus 256 points par liste."""
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(matrix), 256 * nlist)
+        sample = dequantize(matrix, scale, rng.choice(len(matrix), sample_size, replace=False))
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.train_iters):
+            labels = self._assign(sample, centroids)
+            counts = np.bincount(labels, minlength=nlist)
+            filled = counts > 0
+            # Somme par liste: points triés par liste puis reduceat sur les listes non vides
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.add.reduceat(sample[np.argsort(labels, kind="stable")], starts[filled], axis=0)
+            centroids[filled] = sums / counts[filled, None]
+            # Listes vides: réinitialisées sur des points au hasard
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        return centroids
+
+    def _prepare(self, state, full=False):
+        matrix, scale = state["matrix"], state["scale"]
+        n = len(matrix)
+        if n == 0:
+            return {**state, "centroids": np.zeros((0, 0), dtype=np.float32), "offsets": np.zeros(1, dtype=np.int64)}
+
+        centroids = None if full else self._load_centroids(n, matrix.shape[1])
+        if centroids is None:
+            centroids = self._train(matrix, self._effective_nlist(n), scale)
+            self._save_centroids(centroids, n)
+        nlist = len(centroids)
+
+        labels = self._assign(matrix, centroids, scale)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(labels, minlength=nlist))
+
+        ids = [state["ids"][i] for i in order]
+        # Matrice déjà rangée par liste (index rouvert par restore): garder le mmap tel quel
+        if not np.array_equal(order, np.arange(n)):
+            matrix = np.ascontiguousarray(matrix[order])
+            scale = scale[order] if scale is not None else None
+        return {
+            "ids": ids,
+            "rows": {qid: i for i, qid in enumerate(ids)},
+            "documents": [state["documents"][i] for i in order],
+            "metadatas": state["metadatas"].take(order),
+            "hashes": [state["hashes"][i] for i in order],
+            "matrix": matrix,
+            "scale": scale,
+            "sq_norms": state["sq_norms"][order],
+            "centroids": centroids,
+            "c_norms": np.einsum("ij,ij->i", centroids, centroids),
+            "offsets": offsets,
+            "filter_index": self._take_filter_index(state["filter_index"], order),
+        }
+
+    def search(self, embeddings, top_k, exclude_ids, filters=None):
+        state = self._state
+        n = len(state["ids"])
+        if n == 0:
+            return [[] for _ in exclude_ids]
+        filters = filters or [None] * len(exclude_ids)
+
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(exclude_ids), -1)
+        nlist = len(state["centroids"])
+        centroid_distances = state["c_norms"][None, :] - 2.0 * (queries @ state["centroids"].T)
+        offsets = state["offsets"]
+
+        outputs = []
+        for q, excluded in enumerate(exclude_ids):
+            query = queries[q]
+            excluded_rows = np.array(
+                [state["rows"][qid] for qid in excluded if qid in state["rows"]], dtype=np.int64
+            )
+            mask = self._allowed_mask(state, filters[q])
+            if mask is None:
+                available = n - len(excluded_rows)
+            else:
+                available = int(np.count_nonzero(mask))
+                if len(excluded_rows):
+                    available -= int(np.count_nonzero(mask[excluded_rows]))
+            k = min(top_k, available)
+            if k <= 0:
+                outputs.append([])
+                continue
+
+            ranked_lists = np.argsort(centroid_distances[q])
+            nprobe = min(self.nprobe, nlist)
+            while True:
+                # Candidats = tranches contiguës des listes sondées
+                rows = np.concatenate([
+                    np.arange(offsets[l], offsets[l + 1]) for l in ranked_lists[:nprobe]
+                ])
+                scale = state["scale"][rows] if state["scale"] is not None else None
+                scores = dot_products(state["matrix"][rows], scale, query[None, :])[0]
+                distances = state["sq_norms"][rows] - 2.0 * scores
+                if mask is not None:
+                    distances[~mask[rows]] = np.inf
+                if len(excluded_rows):
+                    distances[np.isin(rows, excluded_rows)] = np.inf
+                # Élargir la recherche si les listes sondées ne suffisent pas à remplir top_k
+                if np.count_nonzero(np.isfinite(distances)) >= k or nprobe >= nlist:
+                    break
+                nprobe = min(nprobe * 2, nlist)
+
+            distances += float(query @ query)
+            np.maximum(distances, 0.0, out=distances)
+            kk = min(k, len(rows))
+            top = np.argpartition(distances, kk - 1)[:kk] if kk < len(rows) else np.arange(len(rows))
+            top = top[np.argsort(distances[top], kind="stable")]
+            outputs.append([
+                (state["ids"][rows[i]], state["documents"][rows[i]], state["metadatas"][rows[i]], float(distances[i]))
+                for i in top if np.isfinite(distances[i])
+            ])
+        return outputs
+
+
+def create_store(backend: str = VECTOR_BACKEND) -> VectorStore:
+    """Instancie le backend configuré."""
+    if backend == "chroma":
+        return ChromaStore()
+    matrix_dir = INDEX_DIR / backend if MMAP_MATRIX else None
+    if backend == "numpy":
+        return NumpyStore(matrix_dir)
+    if backend == "ivf":
+        return IvfStore(matrix_dir=matrix_dir)
+    raise ValueError(f"Backend vectoriel inconnu: {backend} (attendu: chroma, numpy, ivf)")
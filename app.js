@@ -297,8 +297,12 @@ function ensureCitationsReady(){
 // ===== MODE RAG =====
 async function handleRAGMode(ctx, freeTextQuery = null){
   // Vérifier la disponibilité du serveur RAG
-  const isHealthy = await RAG.checkHealth();
-  if(!isHealthy){
+  const readiness = await RAG.getReadiness();
+  if(readiness && !readiness.ready && readiness.phase !== "failed"){
+    alert(`⏳ Le serveur RAG démarre (${readiness.phase}, ${readiness.percent}%)… réessaie dans quelques secondes.`);
+    return;
+  }
+  if(!readiness || !readiness.ready){
     alert("⚠️ Le serveur RAG n'est pas disponible.\n\nLance le serveur avec:\ncd RAG && python rag_server.py");
     return;
   }
@@ -316,8 +320,21 @@ async function handleRAGMode(ctx, freeTextQuery = null){
   // Récupérer les IDs des citations déjà vues (30 derniers)
   const seenIds = getSeenIds().slice(-30);
   
+  // Filtres appliqués par le serveur avant le classement (mêmes règles que safetyFilter/pick)
+  const prefs = getJ(STORAGE.prefs);
+  const filters = RAG.buildSearchFilters({
+    need: ctx.need,
+    mood: ctx.mood,
+    energyCap: ctx.energyCap || prefs.energyCap
+  });
+
   // Lancer la recherche sémantique (top 3) en excluant les déjà vues
-  const results = await RAG.search(query, 3, seenIds);
+  let results = await RAG.search(query, 3, seenIds, filters);
+  if((!results || results.length === 0) && filters.need){
+    // Fallback comme pick(): on relâche le besoin mais on garde les règles de sécurité
+    delete filters.need;
+    results = await RAG.search(query, 3, seenIds, filters);
+  }
   
   if(!results || results.length === 0){
     alert("Aucun résultat trouvé pour cette recherche.");
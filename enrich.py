@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Enrichissement complet des citations en une seule passe.
+----------------
+Remplace les deux passes generate_tags.py + generate_context.py: une requête (ou un lot de
+requêtes groupées) par citation remplit d'un coup tous les champs manquants utilisés par
+le moteur (app.js) et par le RAG:
+  tags, context, need, mood, tone, energy, is_injunctive, is_guilt_inducing, is_toxic_positive
+
+Seuls les champs absents sont demandés (schéma JSON construit à la volée); les citations
+qui manquent des mêmes champs sont regroupées dans les mêmes lots.
+Parallélisme, limitation de débit, cache des réponses et journal de reprise: voir enrichment.py.
+
+Prérequis:
+  pip install openai
+  export OPENAI_API_KEY="..."
+
+Usage:
+  python enrich.py [--fields need mood tone energy] [--batch-size 10] [--concurrency 8] [--rpm 500] [--tpm 200000] [--base-url http://localhost:8080/v1]
+"""
+
+import argparse
+import json
+import os
+from typing import Any, Dict, List, Tuple
+
+from enrichment import (
+    COMPLETION_TOKENS_ESTIMATE,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_COMPACT_RATIO,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_RPM,
+    DEFAULT_TPM,
+    EnrichmentEngine,
+    EnrichmentJournal,
+    add_cache_arguments,
+    apply_fields,
+    batch_schema,
+    cache_from_args,
+    format_batch,
+    parse_batch,
+    row_keys,
+)
+from generate_context import CONTEXT_SCHEMA, validate_context
+from generate_tags import TAGS_SCHEMA, validate_tags
+
+INPUT_PATH = "2000_citations_hasard.json"
+MODEL = "gpt-4o-mini"
+MAX_RETRIES = 3
+key = os.environ.get("OPENAI_API_KEY", "sk-PLACEHOLDER")
+
+# Vocabulaire du moteur (index.html / app.js)
+NEEDS = ["calme", "réconfort", "clarté", "élan", "lâcher-prise", "perspective"]
+MOODS = ["bien", "neutre", "fatigué", "stressé", "triste", "motivé"]
+TONES = ["accompagnant", "neutre", "direct", "stoïque", "poétique"]
+ENERGY_LEVELS = [1, 2, 3]
+FLAG_FIELDS = ["is_injunctive", "is_guilt_inducing", "is_toxic_positive"]
+
+FIELD_SCHEMAS = {
+    "tags": TAGS_SCHEMA,
+    "context": CONTEXT_SCHEMA,
+    "need": {"type": "string", "enum": NEEDS},
+    "mood": {"type": "string", "enum": MOODS},
+    "tone": {"type": "string", "enum": TONES},
+    "energy": {"type": "integer", "enum": ENERGY_LEVELS},
+    **{flag: {"type": "boolean"} for flag in FLAG_FIELDS},
+}
+FIELDS = list(FIELD_SCHEMAS)
+
+FIELD_RULES = {
+    "tags": "tags : 3 à 8 tags en français et en minuscules, uniquement des concepts clés et "
+            "spécifiques de la citation (aucun tag vague comme \"vie\", \"chose\", \"pensée\", "
+            "aucun synonyme redondant)",
+    "context": "context : 1 phrase courte (2 au maximum) qui explique le SENS de la citation avec "
+               "des mots simples, en incluant 3 à 6 termes qu'on pourrait rechercher; ne jamais "
+               "mentionner l'auteur, une source, une date ou une œuvre, pas de \"Cette citation...\"",
+    "need": f"need : le besoin auquel la citation répond le mieux, parmi : {', '.join(NEEDS)}",
+    "mood": f"mood : l'humeur de la personne à qui elle conviendrait le mieux, parmi : {', '.join(MOODS)}",
+    "tone": f"tone : le ton de la citation, parmi : {', '.join(TONES)}",
+    "energy": "energy : l'énergie qu'elle demande au lecteur, 1 (apaisante) à 3 (très mobilisatrice)",
+    "is_injunctive": "is_injunctive : true si elle donne un ordre ou une injonction (\"il faut\", \"tu dois\")",
+    "is_guilt_inducing": "is_guilt_inducing : true si elle peut culpabiliser une personne qui va mal",
+    "is_toxic_positive": "is_toxic_positive : true si elle nie ou minimise la souffrance (positivité toxique)",
+}
+
+
+def missing_fields(row: Dict, fields: List[str]) -> Tuple[str, ...]:
+    """Champs à générer pour une citation (les drapeaux False sont des valeurs valides)."""
+    out = []
+    for field in fields:
+        value = row.get(field)
+        if field in FLAG_FIELDS:
+            missing = not isinstance(value, bool)
+        elif field == "energy":
+            missing = value not in ENERGY_LEVELS
+        else:
+            missing = not value
+        if missing:
+            out.append(field)
+    return tuple(out)
+
+
+def build_schema(fields: Tuple[str, ...]) -> Dict:
+    return {
+        "name": "citation_enrichment",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "additionalProperties": False,
+            "properties": {f: FIELD_SCHEMAS[f] for f in fields},
+            "required": list(fields)
+        }
+    }
+
+
+def build_rules(fields: Tuple[str, ...]) -> str:
+    rules = "\n".join(f"- {FIELD_RULES[f]}" for f in fields)
+    return f"""
+Tu es un annotateur de citations FR pour une application qui propose une citation adaptée
+au besoin et à l'humeur de la personne. Remplis UNIQUEMENT les champs suivants :
+
+{rules}
+
+Reste fidèle au sens évident de la citation, sans rien inventer.
+""".strip()
+
+
+def build_prompt(fields: Tuple[str, ...], citation: str, auteur: str) -> str:
+    return f"""
+{build_rules(fields)}
+
+Citation: {citation}
+Auteur: {auteur}
+""".strip()
+
+
+def build_batch_prompt(fields: Tuple[str, ...], citations: List[Tuple[str, str]]) -> str:
+    return f"""
+{build_rules(fields)}
+
+Voici {len(citations)} citations, chacune précédée de son identifiant [id=N].
+Annote CHAQUE citation indépendamment et renvoie exactement un résultat par citation,
+avec le même id.
+
+{format_batch(citations)}
+""".strip()
+
+
+def validate_fields(fields: Tuple[str, ...], data: Dict) -> Dict[str, Any]:
+    """Valeurs normalisées des champs demandés; ValueError si l'un d'eux est inutilisable."""
+    out = {}
+    for field in fields:
+        value = data.get(field)
+        if field == "tags":
+            value = validate_tags(value)
+        elif field == "context":
+            value = validate_context(value)
+        elif field in FLAG_FIELDS:
+            if not isinstance(value, bool):
+                raise ValueError(f"{field} invalide")
+        elif field == "energy":
+            if isinstance(value, bool) or value not in ENERGY_LEVELS:
+                raise ValueError("energy invalide")
+        elif value not in FIELD_SCHEMAS[field]["enum"]:
+            raise ValueError(f"{field} invalide: {value!r}")
+        out[field] = value
+    return out
+
+
+def call_llm_for_fields(engine: EnrichmentEngine, fields: Tuple[str, ...], citation: str, auteur: str) -> Dict[str, Any]:
+    data = engine.complete_json(build_prompt(fields, citation, auteur), build_schema(fields))
+    return validate_fields(fields, data)
+
+
+def call_llm_for_fields_batch(
+    engine: EnrichmentEngine,
+    fields: Tuple[str, ...],
+    citations: List[Tuple[str, str]]
+) -> Dict[int, Dict[str, Any]]:
+    """Mêmes champs pour K citations en un appel: {position: valeurs} des seuls éléments valides."""
+    prompt = build_batch_prompt(fields, citations)
+    schema = batch_schema("citation_enrichment", {f: FIELD_SCHEMAS[f] for f in fields})
+    data = engine.complete_json(prompt, schema, COMPLETION_TOKENS_ESTIMATE * len(citations))
+    results = parse_batch(data, len(citations), lambda item: validate_fields(fields, item))
+    # Chaque élément valide sert aussi de réponse (brute, non normalisée) au prompt individuel
+    for pos, (_, item) in results.items():
+        engine.remember(build_prompt(fields, *citations[pos]), build_schema(fields), {f: item[f] for f in fields})
+    return {pos: values for pos, (values, _) in results.items()}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Enrichit les citations en une seule passe")
+    parser.add_argument("--fields", nargs="*", choices=FIELDS, default=FIELDS,
+                        help="Champs à remplir s'ils manquent (défaut: tous)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Appels LLM en parallèle")
+    parser.add_argument("--rpm", type=float, default=DEFAULT_RPM, help="Requêtes par minute max")
+    parser.add_argument("--tpm", type=float, default=DEFAULT_TPM, help="Tokens par minute max")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"),
+                        help="URL de l'API compatible OpenAI (ex: stub local)")
+    parser.add_argument("--compact-ratio", type=float, default=DEFAULT_COMPACT_RATIO,
+                        help="Taille du journal, en fraction du fichier source, déclenchant sa réécriture")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Citations par requête (1 = une requête par citation)")
+    parser.add_argument("--force", action="store_true",
+                        help="Retraite aussi les citations déjà enrichies (tous les champs de --fields; réponses servies par le cache)")
+    add_cache_arguments(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    engine = EnrichmentEngine(
+        MODEL,
+        api_key=key,
+        base_url=args.base_url,
+        concurrency=args.concurrency,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        max_retries=MAX_RETRIES,
+        cache=cache_from_args(args),
+        offline=args.offline
+    )
+
+    with open(INPUT_PATH, "r", encoding="utf-8") as f:
+        items = json.load(f)
+
+    # Reprise: réappliquer les résultats journalisés mais pas encore compactés
+    journal = EnrichmentJournal(INPUT_PATH, compact_ratio=args.compact_ratio)
+    replayed = journal.replay(items)
+    if replayed:
+        print(f"♻️  {replayed} résultats repris depuis {journal.path}")
+    keys = row_keys(items)
+
+    fields = [f for f in FIELDS if f in args.fields]
+    todo = []
+    missing: Dict[int, Tuple[str, ...]] = {}
+    for idx, row in enumerate(items):
+        cid = row.get("id")
+        row_missing = tuple(fields) if args.force else missing_fields(row, fields)
+        if not row_missing:
+            continue
+
+        if not row.get("Citation", ""):
+            entry = {"enrich_error": "missing_citation"}
+            apply_fields(row, entry)
+            journal.append(items, keys[idx], entry)
+            print(f"[{idx+1:04d}] id={cid} ⚠️  citation vide")
+            continue
+
+        missing[idx] = row_missing
+        todo.append(idx)
+
+    print(f"🔄 {len(todo)}/{len(items)} citations à enrichir")
+
+    def worker(idx: int) -> Dict[str, Any]:
+        row = items[idx]
+        return call_llm_for_fields(engine, missing[idx], row.get("Citation", ""), row.get("Auteur", ""))
+
+    def batch_worker(batch: List[int]) -> Dict[int, Dict[str, Any]]:
+        citations = [(items[idx].get("Citation", ""), items[idx].get("Auteur", "")) for idx in batch]
+        results = call_llm_for_fields_batch(engine, missing[batch[0]], citations)
+        return {batch[pos]: values for pos, values in results.items()}
+
+    # Les résultats sont appliqués dans le thread principal, au fil des complétions
+    for idx, values, error in engine.run_batched(todo, args.batch_size, batch_worker, worker, missing.get):
+        row = items[idx]
+        cid = row.get("id")
+        if error is None:
+            entry = {**values, "enrich_error": None}
+            print(f"[{idx+1:04d}] id={cid} ✓ {', '.join(values)}")
+        else:
+            entry = {"enrich_error": str(error)}
+            print(f"[{idx+1:04d}] id={cid} ❌ error={error}")
+
+        apply_fields(row, entry)
+        journal.append(items, keys[idx], entry)
+
+    journal.close(items)
+    if args.batch_size > 1:
+        print(f"\n📦 {engine.batch_calls} requêtes groupées, {engine.single_fallbacks} citations rejouées seules")
+    if engine.cache is not None:
+        print(f"💾 Cache LLM: {engine.cache.hits} réponses réutilisées, {engine.cache.misses} absentes du cache")
+    print(f"\n✅ Fini. Champs ajoutés dans {INPUT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
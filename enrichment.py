@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Moteur d'enrichissement LLM partagé par generate_tags.py et generate_context.py.
+
+- N appels en parallèle (pool de threads, le client OpenAI est thread-safe)
+- Limitation de débit: requêtes/minute et tokens/minute (seaux à jetons)
+- Retry avec backoff exponentiel + jitter, en respectant Retry-After sur les 429
+- Mode groupé: K citations par requête (schéma {"results": [{id, ...}]}), validation
+  par élément et reprise individuelle des seuls éléments invalides ou manquants
+- Cache disque des réponses, clé (modèle, nom du schéma, hash du prompt), avec expiration
+  optionnelle et mode hors ligne (aucun appel réseau, un prompt absent du cache est une erreur)
+- Journal append-only (JSONL) des résultats, compacté atomiquement (volume d'écriture linéaire)
+  dans le fichier source (jamais réécrit partiellement); la reprise rejoue le journal
+
+Tout serveur compatible avec l'API chat completions convient (base_url), y compris
+un stub HTTP local pour les tests.
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from openai import OpenAI
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RPM = 500          # requêtes par minute
+DEFAULT_TPM = 200_000      # tokens par minute
+DEFAULT_MAX_RETRIES = 5
+COMPLETION_TOKENS_ESTIMATE = 200  # réservé par requête pour la réponse
+DEFAULT_COMPACT_RATIO = 0.5       # compaction quand le journal atteint cette fraction du fichier source
+DEFAULT_BATCH_SIZE = 10           # citations par requête en mode groupé (1 = une par requête)
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR", ".llm_cache")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimation grossière (≈ 3 caractères par token en français)."""
+    return len(text) // 3 + 1
+
+
+class TokenBucket:
+    """Seau à jetons: capacity jetons par minute, rechargés en continu."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Temps d'attente avant de pouvoir consommer amount (0 si disponible)."""
+        self._refill(time.monotonic())
+        # Une requête plus grosse que la capacité passe quand le seau est plein
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """Limites requêtes/minute et tokens/minute combinées."""
+
+    def __init__(self, rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        while True:
+            with self._lock:
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(tokens)
+                    return
+            time.sleep(min(wait, 1.0))
+
+    def adjust(self, delta_tokens: int):
+        """Corrige l'estimation avec l'usage réel renvoyé par l'API."""
+        with self._lock:
+            self.tokens.consume(delta_tokens)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Délai demandé par le serveur (en-tête Retry-After), s'il existe."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("retry-after")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CacheMiss(RuntimeError):
+    """Prompt absent du cache en mode hors ligne."""
+
+
+class ResponseCache:
+    """
+    Réponses LLM décodées, une par fichier JSON: <dir>/<2 premiers hex>/<clé>.json.
+    Clé = sha256(modèle, nom du schéma, sha256 du prompt complet). Écritures atomiques
+    (tmp + os.replace), donc sûr entre threads et entre processus.
+    """
+
+    def __init__(self, cache_dir: str = LLM_CACHE_DIR, ttl: Optional[float] = None):
+        self.dir = cache_dir
+        self.ttl = ttl  # secondes, None = pas d'expiration
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, json_schema: Dict, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        raw = json.dumps([model, json_schema.get("name", ""), prompt_hash])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            entry = None
+        if entry is not None and self.ttl is not None and time.time() - entry.get("created", 0) > self.ttl:
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if entry is None else entry["response"]
+
+    def put(self, key: str, response: Dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "response": response}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+def add_cache_arguments(parser):
+    """Options de cache communes aux scripts d'enrichissement."""
+    parser.add_argument("--cache-dir", default=LLM_CACHE_DIR, help="Répertoire du cache des réponses LLM")
+    parser.add_argument("--cache-ttl", type=float, default=None,
+                        help="Durée de validité des réponses en cache, en secondes (défaut: illimitée)")
+    parser.add_argument("--no-cache", action="store_true", help="Ni lecture ni écriture du cache")
+    parser.add_argument("--offline", action="store_true",
+                        help="Aucun appel réseau: uniquement les réponses déjà en cache")
+
+
+def cache_from_args(args) -> Optional[ResponseCache]:
+    if args.no_cache:
+        if args.offline:
+            raise SystemExit("--offline nécessite le cache (incompatible avec --no-cache)")
+        return None
+    return ResponseCache(args.cache_dir, ttl=args.cache_ttl)
+
+
+class EnrichmentEngine:
+    """Appels chat completions structurés (JSON Schema), parallèles et limités en débit."""
+
+    def __init__(
+        self,
+        model: str,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        rpm: float = DEFAULT_RPM,
+        tpm: float = DEFAULT_TPM,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        client: Optional[Any] = None,
+        cache: Optional[ResponseCache] = None,
+        offline: bool = False
+    ):
+        # Retries gérés ici (backoff + limiteur partagé), pas par le client
+        self.client = client or OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.cache = cache
+        self.offline = offline
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rpm, tpm)
+        self.max_retries = max_retries
+        self.batch_calls = 0
+        self.single_fallbacks = 0
+
+    def complete_json(
+        self,
+        prompt: str,
+        json_schema: Dict,
+        completion_tokens: int = COMPLETION_TOKENS_ESTIMATE
+    ) -> Dict:
+        """Un appel structuré: renvoie le JSON décodé de la réponse (cache, sinon API avec retries)."""
+        cache_key = ResponseCache.key(self.model, json_schema, prompt) if self.cache else None
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        if self.offline:
+            raise CacheMiss("réponse absente du cache (mode hors ligne)")
+
+        estimated = estimate_tokens(prompt) + completion_tokens
+        for attempt in range(1, self.max_retries + 1):
+            self.limiter.acquire(estimated)
+            try:
+                resp = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    response_format={
+                        "type": "json_schema",
+                        "json_schema": json_schema
+                    }
+                )
+                usage = getattr(resp, "usage", None)
+                if usage is not None and getattr(usage, "total_tokens", None):
+                    self.limiter.adjust(usage.total_tokens - estimated)
+                # Le contenu de la réponse est dans resp.choices[0].message.content
+                data = json.loads(resp.choices[0].message.content)
+                if cache_key is not None:
+                    self.cache.put(cache_key, data)
+                return data
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(60.0, 0.8 * 2 ** (attempt - 1)) * (0.5 + random.random())
+                if is_rate_limited(e):
+                    delay = max(delay, retry_after(e) or 0.0)
+                time.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    def remember(self, prompt: str, json_schema: Dict, response: Dict):
+        """
+        Enregistre une réponse obtenue autrement (ex: élément d'un lot) comme réponse au
+        prompt donné: une reprise individuelle ou hors ligne la trouvera dans le cache.
+        response doit être la réponse brute du LLM, jamais une valeur déjà post-traitée:
+        une reprise --force --offline rejoue la normalisation sur ce qui est en cache.
+        """
+        if self.cache is not None:
+            self.cache.put(ResponseCache.key(self.model, json_schema, prompt), response)
+
+    def run(
+        self,
+        tasks: Iterable[Any],
+        worker: Callable[[Any], Any]
+    ) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+        """
+        Exécute worker(task) pour chaque tâche avec au plus `concurrency` appels en vol.
+        Produit (task, résultat, erreur) au fil des complétions (ordre non garanti).
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(worker, task): task for task in tasks}
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    yield task, future.result(), None
+                except Exception as e:
+                    yield task, None, e
+
+    def run_batched(
+        self,
+        tasks: Iterable[Any],
+        batch_size: int,
+        batch_worker: Callable[[List[Any]], Dict[Any, Any]],
+        single_worker: Callable[[Any], Any],
+        group_key: Optional[Callable[[Any], Any]] = None
+    ) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+        """
+        Comme run(), mais par lots de batch_size tâches: batch_worker(lot) renvoie
+        {tâche: résultat} pour les seuls éléments valides. Les éléments absents de la
+        réponse (ou tout le lot si l'appel échoue) sont rejoués un par un avec single_worker.
+        Avec group_key, un lot ne mélange jamais des tâches de clés différentes.
+        """
+        tasks = list(tasks)
+        if batch_size <= 1:
+            yield from self.run(tasks, single_worker)
+            return
+
+        groups: Dict[Any, List[Any]] = {}
+        for task in tasks:
+            groups.setdefault(group_key(task) if group_key else None, []).append(task)
+        batches = [
+            group[i:i + batch_size]
+            for group in groups.values()
+            for i in range(0, len(group), batch_size)
+        ]
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = {pool.submit(batch_worker, batch): (True, batch) for batch in batches}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    is_batch, payload = pending.pop(future)
+                    if not is_batch:
+                        try:
+                            yield payload, future.result(), None
+                        except Exception as e:
+                            yield payload, None, e
+                        continue
+
+                    self.batch_calls += 1
+                    try:
+                        results = future.result()
+                    except Exception:
+                        results = {}
+                    for task in payload:
+                        if task in results:
+                            yield task, results[task], None
+                        else:
+                            self.single_fallbacks += 1
+                            pending[pool.submit(single_worker, task)] = (False, task)
+
+
+def batch_schema(name: str, properties: Dict[str, Dict]) -> Dict:
+    """Schéma strict d'une réponse groupée: {"results": [{"id": str, <properties>}, ...]}."""
+    return {
+        "name": f"{name}_batch",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "additionalProperties": False,
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "additionalProperties": False,
+                        "properties": {"id": {"type": "string"}, **properties},
+                        "required": ["id", *properties]
+                    }
+                }
+            },
+            "required": ["results"]
+        }
+    }
+
+
+def format_batch(citations: List[Tuple[str, str]]) -> str:
+    """Bloc de citations numérotées [id=1..K] pour un prompt groupé."""
+    return "\n\n".join(
+        f"[id={i}]\nCitation: {citation}\nAuteur: {auteur}"
+        for i, (citation, auteur) in enumerate(citations, start=1)
+    )
+
+
+def parse_batch(
+    data: Dict,
+    size: int,
+    validate: Callable[[Dict], Any]
+) -> Dict[int, Tuple[Any, Dict]]:
+    """
+    Résultats valides d'une réponse groupée, par position (0..size-1): (valeur normalisée,
+    élément brut). validate(élément) renvoie la valeur normalisée, ou lève ValueError si elle
+    est inutilisable; les ids inconnus ou en double sont ignorés (l'élément sera rejoué seul).
+    L'élément brut est ce que le cache doit garder (voir EnrichmentEngine.remember).
+    """
+    out: Dict[int, Tuple[Any, Dict]] = {}
+    for item in data.get("results") or []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            pos = int(str(item.get("id", "")).strip()) - 1
+            if not 0 <= pos < size or pos in out:
+                continue
+            out[pos] = (validate(item), item)
+        except (TypeError, ValueError):
+            continue
+    return out
+
+
+def row_keys(items: List[Dict]) -> List[str]:
+    """
+    Clés de journal des citations: leur id (sinon leur position), rendues uniques
+    comme dans corpus.compile_quotes (suffixe __dupN pour les ids répétés).
+    """
+    keys = []
+    seen: Dict[str, int] = {}
+    for idx, row in enumerate(items):
+        cid = row.get("id")
+        key = str(cid) if cid not in (None, "") else f"#{idx}"
+        dup_index = seen.get(key, 0)
+        seen[key] = dup_index + 1
+        keys.append(f"{key}__dup{dup_index}" if dup_index else key)
+    return keys
+
+
+def apply_fields(row: Dict, fields: Dict):
+    """Applique des champs à une citation (valeur None = suppression du champ)."""
+    for name, value in fields.items():
+        if value is None:
+            row.pop(name, None)
+        else:
+            row[name] = value
+
+
+class EnrichmentJournal:
+    """
+    Journal append-only des résultats d'enrichissement, à côté du fichier de données:
+    une ligne JSON {"key", "fields"} par citation traitée (écriture O(1) par résultat).
+
+    Quand le journal atteint compact_ratio fois la taille du fichier source (et en fin de run),
+    les citations sont réécrites dans un fichier temporaire puis substituées atomiquement au
+    fichier source, et le journal est vidé. Chaque réécriture est ainsi payée par au moins
+    compact_ratio × sa taille d'entrées journalisées: le volume écrit reste linéaire.
+    Un crash ne laisse jamais le fichier source à moitié écrit; au redémarrage, replay()
+    réapplique les entrées non compactées.
+    """
+
+    def __init__(self, data_path: str, compact_ratio: float = DEFAULT_COMPACT_RATIO):
+        self.data_path = data_path
+        self.path = f"{data_path}.journal.jsonl"
+        self.compact_ratio = compact_ratio
+        self.pending = 0
+        self.journal_bytes = 0
+        self.data_bytes = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        self._file = None
+
+    def replay(self, items: List[Dict]) -> int:
+        """Réapplique le journal existant sur items; retourne le nombre d'entrées rejouées."""
+        if not os.path.exists(self.path):
+            return 0
+        rows = dict(zip(row_keys(items), items))
+        with open(self.path, "rb") as f:
+            data = f.read()
+        *lines, tail = data.split(b"\n")
+
+        replayed = 0
+        for line in lines + [tail]:
+            try:
+                entry = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue  # Ligne vide ou illisible: les suivantes restent valides
+            row = rows.get(entry.get("key"))
+            if row is not None:
+                apply_fields(row, entry.get("fields", {}))
+                replayed += 1
+
+        # Fin de fichier sans saut de ligne (crash pendant une écriture): la compléter si elle est
+        # lisible, sinon la tronquer, pour que append() ne colle pas la prochaine entrée dessus
+        if tail:
+            try:
+                json.loads(tail)
+                with open(self.path, "ab") as f:
+                    f.write(b"\n")
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                with open(self.path, "r+b") as f:
+                    f.truncate(len(data) - len(tail))
+        self.pending = replayed
+        self.journal_bytes = os.path.getsize(self.path)
+        return replayed
+
+    def append(self, items: List[Dict], key: str, fields: Dict):
+        """Journalise un résultat (déjà appliqué à items) et compacte si nécessaire."""
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        line = (json.dumps({"key": key, "fields": fields}, ensure_ascii=False) + "\n").encode("utf-8")
+        self._file.write(line)
+        self._file.flush()
+        self.pending += 1
+        self.journal_bytes += len(line)
+        if self.journal_bytes >= self.compact_ratio * self.data_bytes:
+            self.compact(items)
+
+    def compact(self, items: List[Dict]):
+        """Écrit items dans le fichier source (atomiquement) puis vide le journal."""
+        if self.pending == 0 and not os.path.exists(self.path):
+            return
+        tmp_path = f"{self.data_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.data_path)
+        self.data_bytes = os.path.getsize(self.data_path)
+
+        # Le journal n'est vidé qu'une fois le fichier source à jour (rejouer reste idempotent)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.pending = 0
+        self.journal_bytes = 0
+
+    def close(self, items: List[Dict]):
+        self.compact(items)
@@ -3,29 +3,58 @@
 
 """
 Lit 2000_citations_hasard.json et génère le contexte/explication de chaque citation.
-Les contextes sont ajoutés directement dans le fichier source au fur et à mesure.
+Les contextes sont journalisés au fur et à mesure puis compactés dans le fichier source.
 
 Le contexte explique le SENS de la citation sans inventer d'infos (source, date, anecdote).
+Les appels sont groupés (--batch-size citations par requête, les éléments invalides sont
+rejoués un par un), parallélisés et limités en débit (voir enrichment.py).
 
 Prérequis:
   pip install openai
   export OPENAI_API_KEY="..."
+
+Pour remplir aussi tags, besoin, humeur, ton, énergie et drapeaux en une seule passe: enrich.py
+
+Usage:
+  python generate_context.py [--concurrency 8] [--rpm 500] [--tpm 200000] [--batch-size 10] [--base-url http://localhost:8080/v1]
+  python generate_context.py --force --offline   # rejoue depuis le cache, sans réseau
 """
 
+import argparse
 import os
 import json
-import time
-from typing import List, Dict, Any
-
-from openai import OpenAI
+from typing import List, Dict, Any, Tuple
+
+from enrichment import (
+    COMPLETION_TOKENS_ESTIMATE,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_COMPACT_RATIO,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_RPM,
+    DEFAULT_TPM,
+    EnrichmentEngine,
+    EnrichmentJournal,
+    add_cache_arguments,
+    apply_fields,
+    batch_schema,
+    cache_from_args,
+    format_batch,
+    parse_batch,
+    row_keys,
+)
 
 INPUT_PATH = "2000_citations_hasard.json"
 MODEL = "gpt-4o-mini"
-SLEEP_SEC = 0.05
 MAX_RETRIES = 3
-key = "sk-PLACEHOLDER"
+key = os.environ.get("OPENAI_API_KEY", "sk-PLACEHOLDER")
 
-client = OpenAI(api_key=key)
+CONTEXT_MIN_LENGTH = 50
+
+CONTEXT_SCHEMA = {
+    "type": "string",
+    "minLength": CONTEXT_MIN_LENGTH,
+    "maxLength": 500
+}
 
 JSON_SCHEMA = {
     "name": "citation_context",
@@ -34,18 +63,15 @@ JSON_SCHEMA = {
         "type": "object",
         "additionalProperties": False,
         "properties": {
-            "context": {
-                "type": "string",
-                "minLength": 50,
-                "maxLength": 500
-            }
+            "context": CONTEXT_SCHEMA
         },
         "required": ["context"]
     }
 }
 
-def build_prompt(citation: str, auteur: str) -> str:
-    return f"""
+BATCH_JSON_SCHEMA = batch_schema("citation_context", {"context": CONTEXT_SCHEMA})
+
+PROMPT_RULES = """
 Ta tâche est de générer une EXPLICATION COURTE et NEUTRE du sens de la citation,
 optimisée pour la recherche sémantique (RAG).
 
@@ -76,79 +102,146 @@ le choix fondamental et la réflexion sur le sens de l’existence."
 
 EXEMPLE INCORRECT :
 "Cette citation célèbre écrite par Shakespeare dans Hamlet en 1603..."
+""".strip()
+
+def build_prompt(citation: str, auteur: str) -> str:
+    return f"""
+{PROMPT_RULES}
 
 Citation: {citation}
 Auteur: {auteur}
+""".strip()
 
+def build_batch_prompt(citations: List[Tuple[str, str]]) -> str:
+    # Mêmes règles, une seule fois pour K citations
+    return f"""
+{PROMPT_RULES}
+
+Voici {len(citations)} citations, chacune précédée de son identifiant [id=N].
+Applique les règles à CHAQUE citation indépendamment et renvoie exactement un contexte
+par citation, avec le même id.
+
+{format_batch(citations)}
 """.strip()
 
-def call_llm_for_context(citation: str, auteur: str) -> str:
-    prompt = build_prompt(citation, auteur)
+def validate_context(context: Any) -> str:
+    if not isinstance(context, str) or len(context.strip()) < CONTEXT_MIN_LENGTH:
+        raise ValueError("contexte absent ou trop court")
+    return context.strip()
 
-    resp = client.chat.completions.create(
-        model=MODEL,
-        messages=[
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        response_format={
-            "type": "json_schema",
-            "json_schema": JSON_SCHEMA
-        }
-    )
+def call_llm_for_context(engine: EnrichmentEngine, citation: str, auteur: str) -> str:
+    prompt = build_prompt(citation, auteur)
 
-    output_text = resp.choices[0].message.content
-    data = json.loads(output_text)
+    data = engine.complete_json(prompt, JSON_SCHEMA)
     context = data["context"]
     return context.strip()
 
+def call_llm_for_context_batch(engine: EnrichmentEngine, citations: List[Tuple[str, str]]) -> Dict[int, str]:
+    """Contextes de K citations (citation, auteur) en un appel: {position: contexte} des seuls éléments valides."""
+    prompt = build_batch_prompt(citations)
+    data = engine.complete_json(prompt, BATCH_JSON_SCHEMA, COMPLETION_TOKENS_ESTIMATE * len(citations))
+    results = parse_batch(data, len(citations), lambda item: validate_context(item.get("context")))
+    # Chaque élément valide sert aussi de réponse (brute, non normalisée) au prompt individuel
+    for pos, (_, item) in results.items():
+        engine.remember(build_prompt(*citations[pos]), JSON_SCHEMA, {"context": item["context"]})
+    return {pos: context for pos, (context, _) in results.items()}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Génère le contexte des citations")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Appels LLM en parallèle")
+    parser.add_argument("--rpm", type=float, default=DEFAULT_RPM, help="Requêtes par minute max")
+    parser.add_argument("--tpm", type=float, default=DEFAULT_TPM, help="Tokens par minute max")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"),
+                        help="URL de l'API compatible OpenAI (ex: stub local)")
+    parser.add_argument("--compact-ratio", type=float, default=DEFAULT_COMPACT_RATIO,
+                        help="Taille du journal, en fraction du fichier source, déclenchant sa réécriture")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Citations par requête (1 = une requête par citation)")
+    parser.add_argument("--force", action="store_true",
+                        help="Retraite aussi les citations déjà enrichies (ex: après modification de la validation; réponses servies par le cache)")
+    add_cache_arguments(parser)
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    engine = EnrichmentEngine(
+        MODEL,
+        api_key=key,
+        base_url=args.base_url,
+        concurrency=args.concurrency,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        max_retries=MAX_RETRIES,
+        cache=cache_from_args(args),
+        offline=args.offline
+    )
+
     with open(INPUT_PATH, "r", encoding="utf-8") as f:
         items = json.load(f)
 
+    # Reprise: réappliquer les résultats journalisés mais pas encore compactés
+    journal = EnrichmentJournal(INPUT_PATH, compact_ratio=args.compact_ratio)
+    replayed = journal.replay(items)
+    if replayed:
+        print(f"♻️  {replayed} résultats repris depuis {journal.path}")
+    keys = row_keys(items)
+
     # Traiter TOUTES les citations du fichier test
     first_2000_indices = list(range(len(items)))
 
+    todo = []
     for idx in first_2000_indices:
         row = items[idx]
         cid = row.get("id")
-        citation = row.get("Citation", "")
-        auteur = row.get("Auteur", "")
 
         # Skip si déjà a un contexte
-        if "context" in row and row["context"]:
+        if not args.force and "context" in row and row["context"]:
             print(f"[{idx+1:04d}] id={cid} ⏭️  contexte déjà présent")
             continue
 
-        if not citation:
-            row["context"] = ""
-            row["context_error"] = "missing_citation"
+        if not row.get("Citation", ""):
+            fields = {"context_error": "missing_citation"}
+            if "context" not in row:
+                fields["context"] = ""
+            apply_fields(row, fields)
+            journal.append(items, keys[idx], fields)
             print(f"[{idx+1:04d}] id={cid} ⚠️  citation vide")
-        else:
-            for attempt in range(1, MAX_RETRIES + 1):
-                try:
-                    context = call_llm_for_context(citation, auteur)
-                    row["context"] = context
-                    if "context_error" in row:
-                        del row["context_error"]
-                    print(f"[{idx+1:04d}] id={cid} ✓ contexte généré")
-                    break
-                except Exception as e:
-                    if attempt == MAX_RETRIES:
-                        row["context"] = ""
-                        row["context_error"] = str(e)
-                        print(f"[{idx+1:04d}] id={cid} ❌ error={e}")
-                    else:
-                        time.sleep(0.8 * attempt)
-
-        # Sauvegarde après chaque citation
-        with open(INPUT_PATH, "w", encoding="utf-8") as f:
-            json.dump(items, f, ensure_ascii=False, indent=2)
-        
-        time.sleep(SLEEP_SEC)
+            continue
+
+        todo.append(idx)
+
+    def worker(idx: int) -> str:
+        row = items[idx]
+        return call_llm_for_context(engine, row.get("Citation", ""), row.get("Auteur", ""))
 
+    def batch_worker(batch: List[int]) -> Dict[int, str]:
+        citations = [(items[idx].get("Citation", ""), items[idx].get("Auteur", "")) for idx in batch]
+        results = call_llm_for_context_batch(engine, citations)
+        return {batch[pos]: context for pos, context in results.items()}
+
+    # Les résultats sont appliqués dans le thread principal, au fil des complétions
+    for idx, context, error in engine.run_batched(todo, args.batch_size, batch_worker, worker):
+        row = items[idx]
+        cid = row.get("id")
+        if error is None:
+            fields = {"context": context, "context_error": None}
+            print(f"[{idx+1:04d}] id={cid} ✓ contexte généré")
+        else:
+            # Échec (ex: --force --offline sans réponse en cache): le contexte déjà présent est conservé
+            fields = {"context_error": str(error)}
+            if "context" not in row:
+                fields["context"] = ""
+            print(f"[{idx+1:04d}] id={cid} ❌ error={error}")
+
+        # Journalisation après chaque citation (le fichier source est compacté quand le journal grossit)
+        apply_fields(row, fields)
+        journal.append(items, keys[idx], fields)
+
+    journal.close(items)
+    if args.batch_size > 1:
+        print(f"\n📦 {engine.batch_calls} requêtes groupées, {engine.single_fallbacks} citations rejouées seules")
+    if engine.cache is not None:
+        print(f"💾 Cache LLM: {engine.cache.hits} réponses réutilisées, {engine.cache.misses} absentes du cache")
     print(f"\n✅ Fini. Contextes ajoutés dans {INPUT_PATH}")
 
 if __name__ == "__main__":
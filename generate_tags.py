@@ -4,29 +4,61 @@
 """
 ----------------
 Lit 2000_citations_hasard.json (format liste d'objets),
-prend les 100 premières citations, et génère des tags via 1 appel LLM par citation.
-Les tags sont ajoutés directement dans le fichier source au fur et à mesure.
+prend les 2000 premières citations, et génère des tags via des appels LLM groupés
+(--batch-size citations par requête, les éléments invalides sont rejoués un par un).
+Les appels sont parallélisés et limités en débit (voir enrichment.py).
+Les tags sont journalisés au fur et à mesure puis compactés dans le fichier source.
 
 Prérequis:
   pip install openai
   export OPENAI_API_KEY="..."
+
+Pour remplir aussi contexte, besoin, humeur, ton, énergie et drapeaux en une seule passe: enrich.py
+
+Usage:
+  python generate_tags.py [--concurrency 8] [--rpm 500] [--tpm 200000] [--batch-size 10] [--base-url http://localhost:8080/v1]
+  python generate_tags.py --force --offline   # re-normalise depuis le cache, sans réseau
 """
 
+import argparse
 import os
 import json
-import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
-from openai import OpenAI
+from enrichment import (
+    COMPLETION_TOKENS_ESTIMATE,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_COMPACT_RATIO,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_RPM,
+    DEFAULT_TPM,
+    EnrichmentEngine,
+    EnrichmentJournal,
+    add_cache_arguments,
+    apply_fields,
+    batch_schema,
+    cache_from_args,
+    format_batch,
+    parse_batch,
+    row_keys,
+)
 
 INPUT_PATH = "2000_citations_hasard.json"
 
 MODEL = "gpt-4o-mini"  # bon rapport qualité/prix pour tagging
-SLEEP_SEC = 0.1        # pour éviter de taper trop vite (ajuste si besoin)
 MAX_RETRIES = 3
-key = "sk-PLACEHOLDER"
+key = os.environ.get("OPENAI_API_KEY", "sk-PLACEHOLDER")
 
-client = OpenAI(api_key=key)
+TAGS_SCHEMA = {
+    "type": "array",
+    "minItems": 3,
+    "maxItems": 8,
+    "items": {
+        "type": "string",
+        "minLength": 2,
+        "maxLength": 32
+    }
+}
 
 JSON_SCHEMA = {
     "name": "citation_tags",
@@ -35,21 +67,14 @@ JSON_SCHEMA = {
         "type": "object",
         "additionalProperties": False,
         "properties": {
-            "tags": {
-                "type": "array",
-                "minItems": 3,
-                "maxItems": 8,
-                "items": {
-                    "type": "string",
-                    "minLength": 2,
-                    "maxLength": 32
-                }
-            }
+            "tags": TAGS_SCHEMA
         },
         "required": ["tags"]
     }
 }
 
+BATCH_JSON_SCHEMA = batch_schema("citation_tags", {"tags": TAGS_SCHEMA})
+
 def normalize_tags(tags: List[str]) -> List[str]:
     # Normalisation légère (tu pourras renforcer ensuite)
     out = []
@@ -67,9 +92,8 @@ def normalize_tags(tags: List[str]) -> List[str]:
     # sécurité: clamp
     return out[:8]
 
-def build_prompt(citation: str, auteur: str) -> str:
-    # Prompt très cadré pour éviter dérives et tags vagues
-    return f"""
+# Prompt très cadré pour éviter dérives et tags vagues
+PROMPT_RULES = """
 Tu es un annotateur de citations FR. Génère des TAGS uniquement.
 
 RÈGLES STRICTES:
@@ -87,6 +111,11 @@ MAUVAIS:
 Tags: vie, chose, gens, réflexion, pensée (trop vagues)
 BON:
 Tags: courage, peur, dépassement de soi
+""".strip()
+
+def build_prompt(citation: str, auteur: str) -> str:
+    return f"""
+{PROMPT_RULES}
 
 Citation: {citation}
 Auteur: {auteur}
@@ -94,75 +123,141 @@ Auteur: {auteur}
 Génère UNIQUEMENT les tags vraiment essentiels pour retrouver cette citation.
 """.strip()
 
-def call_llm_for_tags(citation: str, auteur: str) -> List[str]:
+def build_batch_prompt(citations: List[Tuple[str, str]]) -> str:
+    # Mêmes règles, une seule fois pour K citations
+    return f"""
+{PROMPT_RULES}
+
+Voici {len(citations)} citations, chacune précédée de son identifiant [id=N].
+Applique les règles à CHAQUE citation indépendamment et renvoie exactement un résultat
+par citation, avec le même id.
+
+{format_batch(citations)}
+
+Génère UNIQUEMENT les tags vraiment essentiels pour retrouver chaque citation.
+""".strip()
+
+def validate_tags(tags: Any) -> List[str]:
+    if not isinstance(tags, list):
+        raise ValueError("tags absents")
+    tags = normalize_tags(tags)
+    if not tags:
+        raise ValueError("aucun tag exploitable")
+    return tags
+
+def call_llm_for_tags(engine: EnrichmentEngine, citation: str, auteur: str) -> List[str]:
     prompt = build_prompt(citation, auteur)
 
     # Chat Completions API avec Structured Outputs (JSON Schema strict)
-    resp = client.chat.completions.create(
-        model=MODEL,
-        messages=[
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        response_format={
-            "type": "json_schema",
-            "json_schema": JSON_SCHEMA
-        }
-    )
-
-    # Le contenu de la réponse est dans resp.choices[0].message.content
-    output_text = resp.choices[0].message.content
-    data = json.loads(output_text)
+    data = engine.complete_json(prompt, JSON_SCHEMA)
     tags = data["tags"]
     return normalize_tags(tags)
 
+def call_llm_for_tags_batch(engine: EnrichmentEngine, citations: List[Tuple[str, str]]) -> Dict[int, List[str]]:
+    """Tags de K citations (citation, auteur) en un appel: {position: tags} des seuls éléments valides."""
+    prompt = build_batch_prompt(citations)
+    data = engine.complete_json(prompt, BATCH_JSON_SCHEMA, COMPLETION_TOKENS_ESTIMATE * len(citations))
+    results = parse_batch(data, len(citations), lambda item: validate_tags(item.get("tags")))
+    # Chaque élément valide sert aussi de réponse (brute, non normalisée) au prompt individuel
+    for pos, (_, item) in results.items():
+        engine.remember(build_prompt(*citations[pos]), JSON_SCHEMA, {"tags": item["tags"]})
+    return {pos: tags for pos, (tags, _) in results.items()}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Génère les tags des citations")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Appels LLM en parallèle")
+    parser.add_argument("--rpm", type=float, default=DEFAULT_RPM, help="Requêtes par minute max")
+    parser.add_argument("--tpm", type=float, default=DEFAULT_TPM, help="Tokens par minute max")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"),
+                        help="URL de l'API compatible OpenAI (ex: stub local)")
+    parser.add_argument("--compact-ratio", type=float, default=DEFAULT_COMPACT_RATIO,
+                        help="Taille du journal, en fraction du fichier source, déclenchant sa réécriture")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Citations par requête (1 = une requête par citation)")
+    parser.add_argument("--force", action="store_true",
+                        help="Retraite aussi les citations déjà enrichies (ex: après modification de normalize_tags; réponses servies par le cache)")
+    add_cache_arguments(parser)
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    engine = EnrichmentEngine(
+        MODEL,
+        api_key=key,
+        base_url=args.base_url,
+        concurrency=args.concurrency,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        max_retries=MAX_RETRIES,
+        cache=cache_from_args(args),
+        offline=args.offline
+    )
 
     with open(INPUT_PATH, "r", encoding="utf-8") as f:
         items = json.load(f)
 
+    # Reprise: réappliquer les résultats journalisés mais pas encore compactés
+    journal = EnrichmentJournal(INPUT_PATH, compact_ratio=args.compact_ratio)
+    replayed = journal.replay(items)
+    if replayed:
+        print(f"♻️  {replayed} résultats repris depuis {journal.path}")
+    keys = row_keys(items)
+
     first_2000_indices = list(range(min(2000, len(items))))
 
+    todo = []
     for idx in first_2000_indices:
         row = items[idx]
         cid = row.get("id")
-        citation = row.get("Citation", "")
-        auteur = row.get("Auteur", "")
 
         # Skip si déjà taggé
-        if "tags" in row and row["tags"]:
+        if not args.force and "tags" in row and row["tags"]:
             print(f"[{idx+1:04d}/2000] id={cid} ⏭️  déjà taggé")
             continue
 
-        if not citation:
-            row["tags"] = []
-            row["tags_error"] = "missing_citation"
+        if not row.get("Citation", ""):
+            fields = {"tags_error": "missing_citation"}
+            if "tags" not in row:
+                fields["tags"] = []
+            apply_fields(row, fields)
+            journal.append(items, keys[idx], fields)
             print(f"[{idx+1:04d}/2000] id={cid} ⚠️  citation vide")
+            continue
+
+        todo.append(idx)
+
+    def worker(idx: int) -> List[str]:
+        row = items[idx]
+        return call_llm_for_tags(engine, row.get("Citation", ""), row.get("Auteur", ""))
+
+    def batch_worker(batch: List[int]) -> Dict[int, List[str]]:
+        citations = [(items[idx].get("Citation", ""), items[idx].get("Auteur", "")) for idx in batch]
+        results = call_llm_for_tags_batch(engine, citations)
+        return {batch[pos]: tags for pos, tags in results.items()}
+
+    # Les résultats sont appliqués dans le thread principal, au fil des complétions
+    for idx, tags, error in engine.run_batched(todo, args.batch_size, batch_worker, worker):
+        row = items[idx]
+        cid = row.get("id")
+        if error is None:
+            fields = {"tags": tags, "tags_error": None}
+            print(f"[{idx+1:04d}/2000] id={cid} tags={tags}")
         else:
-            for attempt in range(1, MAX_RETRIES + 1):
-                try:
-                    tags = call_llm_for_tags(citation, auteur)
-                    row["tags"] = tags
-                    if "tags_error" in row:
-                        del row["tags_error"]
-                    print(f"[{idx+1:04d}/2000] id={cid} tags={tags}")
-                    break
-                except Exception as e:
-                    if attempt == MAX_RETRIES:
-                        row["tags"] = []
-                        row["tags_error"] = str(e)
-                        print(f"[{idx+1:04d}/2000] id={cid} ❌ error={e}")
-                    else:
-                        time.sleep(0.8 * attempt)
-
-        # Sauvegarde après chaque citation
-        with open(INPUT_PATH, "w", encoding="utf-8") as f:
-            json.dump(items, f, ensure_ascii=False, indent=2)
-        
-        time.sleep(SLEEP_SEC)
+            # Échec (ex: --force --offline sans réponse en cache): les tags déjà présents sont conservés
+            fields = {"tags_error": str(error)}
+            if "tags" not in row:
+                fields["tags"] = []
+            print(f"[{idx+1:04d}/2000] id={cid} ❌ error={error}")
+
+        # Journalisation après chaque citation (le fichier source est compacté quand le journal grossit)
+        apply_fields(row, fields)
+        journal.append(items, keys[idx], fields)
 
+    journal.close(items)
+    if args.batch_size > 1:
+        print(f"\n📦 {engine.batch_calls} requêtes groupées, {engine.single_fallbacks} citations rejouées seules")
+    if engine.cache is not None:
+        print(f"💾 Cache LLM: {engine.cache.hits} réponses réutilisées, {engine.cache.misses} absentes du cache")
     print(f"\n✅ Fini. Tags ajoutés dans {INPUT_PATH}")
 
 if __name__ == "__main__":
@@ -10,9 +10,11 @@ const RAG_API_URL = 'http://localhost:5001/search';
  * @param {string} query - Phrase de recherche (ex: "j'ai besoin de calme, je me sens stressé")
  * @param {number} topK - Nombre de résultats à retourner (défaut: 5)
  * @param {Array<string>} excludeIds - IDs des citations à exclure (déjà vues)
+ * @param {Object|null} filters - Filtres appliqués côté serveur avant le classement
+ *   ({ need, mood, tone, energy_cap, safe }, voir buildSearchFilters)
  * @returns {Promise<Array>} - Liste de citations avec scores
  */
-export async function search(query, topK = 5, excludeIds = []) {
+export async function search(query, topK = 5, excludeIds = [], filters = null) {
   if (!query || typeof query !== 'string') {
     throw new Error('Query invalide');
   }
@@ -27,6 +29,11 @@ export async function search(query, topK = 5, excludeIds = []) {
     if (excludeIds && Array.isArray(excludeIds) && excludeIds.length > 0) {
       body.exclude_ids = excludeIds;
     }
+
+    // Ajouter les filtres de métadonnées si fournis
+    if (filters && Object.keys(filters).length > 0) {
+      body.filters = filters;
+    }
     
     const response = await fetch(RAG_API_URL, {
       method: 'POST',
@@ -82,16 +89,42 @@ export function buildSearchQuery(filters) {
 }
 
 /**
- * Vérifie si le serveur RAG est disponible.
+ * Construit les filtres serveur équivalents à safetyFilter/pick (app.js):
+ * flags de sécurité exclus, plafond d'énergie (abaissé si fatigué/triste), besoin exact.
+ * @param {Object} ctx - { need, mood, energyCap }
+ * @returns {Object} - Filtres pour search()
+ */
+export function buildSearchFilters(ctx) {
+  const { need, mood, energyCap } = ctx || {};
+
+  let cap = parseInt(energyCap || "3", 10);
+  if (Number.isNaN(cap)) cap = 3;
+  if (mood === "fatigué" || mood === "triste") cap = Math.min(cap, 2);
+
+  const filters = { safe: true, energy_cap: cap };
+  if (need) filters.need = need;
+  return filters;
+}
+
+/**
+ * Vérifie si le serveur RAG est prêt à répondre (index chargé).
  * @returns {Promise<boolean>}
  */
 export async function checkHealth() {
+  return (await getReadiness())?.ready === true;
+}
+
+/**
+ * État de démarrage du serveur RAG ({ ready, phase, percent, ... }), null s'il ne répond pas.
+ * @returns {Promise<Object|null>}
+ */
+export async function getReadiness() {
   try {
-    const response = await fetch('http://localhost:5001/health', {
+    const response = await fetch('http://localhost:5001/health/ready', {
       method: 'GET',
     });
-    return response.ok;
+    return await response.json();
   } catch {
-    return false;
+    return null;
   }
 }
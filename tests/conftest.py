@@ -0,0 +1,78 @@
+"""
+Outils communs des tests: les modules du repo sont des scripts à plat (racine et RAG/),
+importés directement; horloge et client chat completions factices pour enrichment.py.
+"""
+
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+for path in (ROOT, ROOT / "RAG"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+
+class FakeClock:
+    """Remplace le module time d'enrichment: sleep() avance l'horloge au lieu d'attendre."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return 1_700_000_000.0 + self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RateLimited(Exception):
+    """Erreur 429 au format du client OpenAI (status_code, response.headers)."""
+
+    def __init__(self, retry_after=None):
+        super().__init__("429 Too Many Requests")
+        self.status_code = 429
+        headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+        self.response = SimpleNamespace(headers=headers)
+
+
+class FakeClient:
+    """
+    client.chat.completions.create() factice: chaque appel consomme la réponse suivante
+    de outcomes (dict = contenu JSON renvoyé, str = contenu brut, exception = levée)
+    ou, une fois outcomes épuisé, appelle respond(kwargs).
+    """
+
+    def __init__(self, outcomes=(), respond=None, total_tokens=None):
+        self.outcomes = list(outcomes)
+        self.respond = respond
+        self.total_tokens = total_tokens
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0) if self.outcomes else self.respond(kwargs)
+        if isinstance(outcome, Exception):
+            raise outcome
+        usage = SimpleNamespace(total_tokens=self.total_tokens) if self.total_tokens else None
+        content = outcome if isinstance(outcome, str) else json.dumps(outcome, ensure_ascii=False)
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    import enrichment
+
+    fake = FakeClock()
+    monkeypatch.setattr(enrichment, "time", fake)
+    return fake
@@ -0,0 +1,35 @@
+"""
+Cache disque des embeddings (RAG/embedding_cache.py) partagé entre processus.
+"""
+
+import os
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache, text_key
+
+
+def fake_encode(texts):
+    return np.array([[len(t), ord(t[0]), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_append_rereads_index_published_within_same_mtime(tmp_path):
+    # Deux processus sur le même cache
+    first = EmbeddingCache("model", cache_dir=tmp_path)
+    second = EmbeddingCache("model", cache_dir=tmp_path)
+    first.encode(["alpha"], fake_encode)
+    second.encode(["alpha"], fake_encode)
+
+    # Le premier publie un index dans le même tick d'horloge que le précédent
+    mtime = first.index_path.stat().st_mtime_ns
+    first.encode(["beta"], fake_encode)
+    os.utime(first.index_path, ns=(mtime, mtime))
+
+    # Le second ajoute une ligne: celles du premier ne doivent pas être tronquées
+    vectors = second.encode(["gamma", "beta"], fake_encode)
+    np.testing.assert_array_equal(vectors, fake_encode(["gamma", "beta"]))
+
+    reopened = EmbeddingCache("model", cache_dir=tmp_path)
+    assert reopened.keys == [text_key(t) for t in ("alpha", "beta", "gamma")]
+    np.testing.assert_array_equal(reopened.encode(["alpha", "beta", "gamma"], None),
+                                  fake_encode(["alpha", "beta", "gamma"]))
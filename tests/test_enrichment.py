@@ -0,0 +1,372 @@
+"""Moteur d'enrichissement (enrichment.py): débit, retries, 429 / Retry-After, journal, mode groupé."""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from conftest import FakeClient, RateLimited
+from enrichment import EnrichmentEngine, EnrichmentJournal, ResponseCache, parse_batch, row_keys
+
+SCHEMA = {"name": "tags", "strict": True, "schema": {"type": "object"}}
+
+
+def make_engine(client, **kwargs):
+    kwargs.setdefault("concurrency", 1)
+    return EnrichmentEngine("test-model", client=client, **kwargs)
+
+
+def test_rpm_limit_spaces_requests(clock):
+    # 2 requêtes/minute: les deux premières passent, la troisième attend un jeton (30 s)
+    client = FakeClient(respond=lambda kwargs: {"tags": ["a"]})
+    engine = make_engine(client, rpm=2, tpm=1_000_000)
+    for i in range(3):
+        engine.complete_json(f"prompt {i}", SCHEMA)
+    assert len(client.calls) == 3
+    assert clock.now == pytest.approx(30.0, abs=0.01)
+
+
+def test_tpm_limit_waits_for_token_budget(clock):
+    # ≈ 501 tokens estimés par requête pour 1000 tokens/minute: la deuxième attend
+    client = FakeClient(respond=lambda kwargs: {"tags": ["a"]})
+    engine = make_engine(client, rpm=1000, tpm=1000)
+    engine.complete_json("p", SCHEMA, completion_tokens=500)
+    assert clock.now == 0.0
+    engine.complete_json("q", SCHEMA, completion_tokens=500)
+    assert clock.now == pytest.approx((2 * 501 - 1000) / (1000 / 60), abs=0.01)
+
+
+def test_tpm_limit_uses_reported_usage(clock):
+    # L'usage réel (900 tokens) remplace l'estimation: la requête suivante attend davantage
+    client = FakeClient(respond=lambda kwargs: {"tags": ["a"]}, total_tokens=900)
+    engine = make_engine(client, rpm=1000, tpm=1000)
+    engine.complete_json("p", SCHEMA, completion_tokens=100)
+    engine.complete_json("q", SCHEMA, completion_tokens=100)
+    assert clock.now == pytest.approx((900 + 101 - 1000) / (1000 / 60), abs=0.01)
+
+
+def test_retry_after_is_respected(clock):
+    client = FakeClient([RateLimited(retry_after=7), {"tags": ["a"]}])
+    engine = make_engine(client)
+    assert engine.complete_json("p", SCHEMA) == {"tags": ["a"]}
+    assert len(client.calls) == 2
+    assert clock.sleeps and clock.sleeps[0] >= 7
+
+
+def test_rate_limited_without_header_backs_off(clock):
+    client = FakeClient([RateLimited(), RateLimited(), {"tags": ["a"]}])
+    engine = make_engine(client)
+    assert engine.complete_json("p", SCHEMA) == {"tags": ["a"]}
+    # Backoff exponentiel avec jitter: 0.8 s puis 1.6 s, à ×[0.5, 1.5)
+    assert 0.4 <= clock.sleeps[0] < 1.2
+    assert 0.8 <= clock.sleeps[1] < 2.4
+
+
+def test_retry_exhaustion_raises_last_error(clock):
+    client = FakeClient([RateLimited(retry_after=1)] * 3)
+    engine = make_engine(client, max_retries=3)
+    with pytest.raises(RateLimited):
+        engine.complete_json("p", SCHEMA)
+    assert len(client.calls) == 3
+    assert len(clock.sleeps) == 2  # pas d'attente après le dernier échec
+
+
+def test_invalid_json_is_retried(clock):
+    client = FakeClient(["pas du json", {"tags": ["a"]}])
+    engine = make_engine(client)
+    assert engine.complete_json("p", SCHEMA) == {"tags": ["a"]}
+    assert len(client.calls) == 2
+
+
+def test_stub_server_429_then_success(clock):
+    """Client OpenAI réel contre un stub chat completions local (--base-url)."""
+    responses = [
+        (429, {"retry-after": "3"}, {"error": {"message": "rate limited", "type": "rate_limit"}}),
+        (200, {}, {
+            "id": "cmpl-1", "object": "chat.completion", "created": 0, "model": "test-model",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps({"tags": ["stub"]})}}],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 5, "total_tokens": 10},
+        }),
+    ]
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            requests.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            status, headers, body = responses.pop(0)
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        engine = EnrichmentEngine(
+            "test-model", api_key="test", base_url=f"http://127.0.0.1:{server.server_port}/v1", concurrency=1
+        )
+        assert engine.complete_json("p", SCHEMA) == {"tags": ["stub"]}
+    finally:
+        server.shutdown()
+    assert len(requests) == 2
+    assert requests[0]["response_format"]["json_schema"] == SCHEMA
+    assert clock.sleeps and clock.sleeps[0] >= 3
+
+
+def write_json(path, items):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(items, f)
+
+
+def test_journal_survives_two_crashes(tmp_path):
+    data_path = str(tmp_path / "citations.json")
+    items = [{"id": str(i)} for i in range(4)]
+    write_json(data_path, items)
+
+    journal = EnrichmentJournal(data_path, compact_ratio=100)
+    journal.append(items, "0", {"tags": ["a"]})
+    journal._file.write(b'{"key": "1", "fie')  # crash au milieu d'une écriture
+    journal._file.close()
+
+    # Première reprise: l'entrée 0 est rejouée, la fin tronquée est retirée avant d'écrire
+    resumed = [{"id": str(i)} for i in range(4)]
+    journal = EnrichmentJournal(data_path, compact_ratio=100)
+    assert journal.replay(resumed) == 1
+    journal.append(resumed, "1", {"tags": ["b"]})
+    journal.append(resumed, "2", {"tags": ["c"]})
+    journal._file.write(b'{"key": "3"')  # second crash
+    journal._file.close()
+
+    resumed = [{"id": str(i)} for i in range(4)]
+    journal = EnrichmentJournal(data_path, compact_ratio=100)
+    assert journal.replay(resumed) == 3
+    assert [row.get("tags") for row in resumed] == [["a"], ["b"], ["c"], None]
+
+
+def test_journal_keeps_complete_entry_missing_newline(tmp_path):
+    data_path = str(tmp_path / "citations.json")
+    with open(f"{data_path}.journal.jsonl", "w", encoding="utf-8") as f:
+        f.write('{"key": "0", "fields": {"tags": ["a"]}}')  # crash avant le saut de ligne
+    items = [{"id": "0"}, {"id": "1"}]
+    write_json(data_path, items)
+    journal = EnrichmentJournal(data_path, compact_ratio=100)
+    assert journal.replay(items) == 1
+    journal.append(items, "1", {"tags": ["b"]})
+    journal._file.close()
+
+    resumed = [{"id": "0"}, {"id": "1"}]
+    assert EnrichmentJournal(data_path).replay(resumed) == 2
+    assert [row["tags"] for row in resumed] == [["a"], ["b"]]
+
+
+def test_journal_replays_duplicate_ids_on_their_own_rows(tmp_path):
+    data_path = str(tmp_path / "citations.json")
+    items = [{"id": "x"}, {"id": "x"}, {}, {"id": "x"}]
+    keys = row_keys(items)
+    assert keys == ["x", "x__dup1", "#2", "x__dup2"]
+    write_json(data_path, items)
+
+    journal = EnrichmentJournal(data_path, compact_ratio=100)
+    for idx, key in enumerate(keys):
+        journal.append(items, key, {"tags": [str(idx)]})
+    journal._file.close()
+
+    resumed = [{"id": "x"}, {"id": "x"}, {}, {"id": "x"}]
+    assert EnrichmentJournal(data_path).replay(resumed) == 4
+    assert [row["tags"] for row in resumed] == [["0"], ["1"], ["2"], ["3"]]
+
+
+def test_journal_compaction_write_volume_is_linear(tmp_path, monkeypatch):
+    """Compaction déclenchée par la taille du journal: chaque réécriture suit ≥ ratio × fichier journalisés."""
+    data_path = tmp_path / "citations.json"
+    items = [{"id": str(i), "Citation": "x" * 200} for i in range(2000)]
+    write_json(data_path, items)
+    journal = EnrichmentJournal(str(data_path), compact_ratio=0.1)
+
+    compactions = []  # (octets journalisés, taille du fichier source) à chaque réécriture
+    real_compact = journal.compact
+    monkeypatch.setattr(journal, "compact", lambda rows: (
+        compactions.append((journal.journal_bytes, journal.data_bytes)), real_compact(rows)))
+    for key, row in zip(row_keys(items), items):
+        row["tags"] = ["amour", "courage", "espoir"]
+        journal.append(items, key, {"tags": row["tags"]})
+    journal.close(items)
+
+    # ≈ 60 octets par entrée pour un fichier de ≈ 450 Ko: quelques réécritures, pas une toutes les N entrées
+    assert 2 <= len(compactions) <= 4
+    assert all(logged >= 0.1 * size for logged, size in compactions[:-1])
+    assert json.loads(data_path.read_text(encoding="utf-8"))[-1]["tags"] == ["amour", "courage", "espoir"]
+
+
+def validate_tags_item(item):
+    tags = item.get("tags")
+    if not isinstance(tags, list) or not tags:
+        raise ValueError("tags invalides")
+    return tags
+
+
+def values(parsed):
+    return {pos: value for pos, (value, _) in parsed.items()}
+
+
+def test_parse_batch_short_response():
+    data = {"results": [{"id": "1", "tags": ["a"]}, {"id": "2", "tags": ["b"]}]}
+    assert values(parse_batch(data, 4, validate_tags_item)) == {0: ["a"], 1: ["b"]}
+
+
+def test_parse_batch_misnumbered_response():
+    data = {"results": [
+        {"id": "0", "tags": ["hors plage"]},
+        {"id": "5", "tags": ["hors plage"]},
+        {"id": " 2 ", "tags": ["b"]},
+        {"id": "2", "tags": ["doublon"]},
+        {"id": "trois", "tags": ["c"]},
+        {"tags": ["sans id"]},
+        "pas un objet",
+    ]}
+    assert values(parse_batch(data, 3, validate_tags_item)) == {1: ["b"]}
+
+
+def test_parse_batch_partly_invalid_response():
+    data = {"results": [{"id": "1", "tags": []}, {"id": "2", "tags": "x"}, {"id": "3", "tags": ["c"]}]}
+    assert parse_batch(data, 3, validate_tags_item) == {2: (["c"], {"id": "3", "tags": ["c"]})}
+    assert parse_batch({}, 3, validate_tags_item) == {}
+    assert parse_batch({"results": None}, 3, validate_tags_item) == {}
+
+
+def run_batched(engine, tasks, batch_size, batch_worker, group_key=None):
+    singles = []
+
+    def single_worker(task):
+        singles.append(task)
+        return f"seul:{task}"
+
+    results = {task: (value, error) for task, value, error in
+               engine.run_batched(tasks, batch_size, batch_worker, single_worker, group_key)}
+    return results, sorted(singles)
+
+
+def test_run_batched_replays_missing_items_alone():
+    engine = make_engine(FakeClient(), concurrency=2)
+
+    # Le lot renvoie un élément sur deux (réponse courte / éléments invalides)
+    def batch_worker(batch):
+        return {task: f"lot:{task}" for task in batch if task % 2 == 0}
+
+    results, singles = run_batched(engine, range(7), 3, batch_worker)
+    assert engine.batch_calls == 3
+    assert singles == [1, 3, 5]
+    assert engine.single_fallbacks == 3
+    assert {task: value for task, (value, _) in results.items()} == {
+        0: "lot:0", 1: "seul:1", 2: "lot:2", 3: "seul:3", 4: "lot:4", 5: "seul:5", 6: "lot:6"
+    }
+
+
+def test_run_batched_failed_call_falls_back_for_whole_batch():
+    engine = make_engine(FakeClient(), concurrency=1)
+
+    def batch_worker(batch):
+        if 0 in batch:
+            raise ValueError("réponse groupée illisible")
+        return {task: f"lot:{task}" for task in batch}
+
+    results, singles = run_batched(engine, range(4), 2, batch_worker)
+    assert (engine.batch_calls, engine.single_fallbacks) == (2, 2)
+    assert singles == [0, 1]
+    assert results[2] == ("lot:2", None)
+
+
+def test_run_batched_groups_by_key_and_reports_single_errors():
+    engine = make_engine(FakeClient(), concurrency=1)
+    batches = []
+
+    def batch_worker(batch):
+        batches.append(list(batch))
+        return {}
+
+    def single_worker(task):
+        raise RuntimeError(f"échec {task}")
+
+    out = list(engine.run_batched(range(5), 10, batch_worker, single_worker, lambda task: task % 2))
+    assert sorted(batches) == [[0, 2, 4], [1, 3]]
+    assert (engine.batch_calls, engine.single_fallbacks) == (2, 5)
+    assert sorted(task for task, value, error in out if isinstance(error, RuntimeError)) == [0, 1, 2, 3, 4]
+
+
+def test_run_batched_batch_size_one_skips_batching():
+    engine = make_engine(FakeClient(), concurrency=1)
+    results, singles = run_batched(engine, range(3), 1, lambda batch: pytest.fail("pas de lot"))
+    assert singles == [0, 1, 2]
+    assert (engine.batch_calls, engine.single_fallbacks) == (0, 0)
+
+
+def test_batch_items_cached_raw_for_single_prompts(tmp_path, clock):
+    """Le cache du prompt individuel garde la réponse brute: --force --offline re-normalise."""
+    import enrich
+    import generate_context
+    import generate_tags
+
+    raw_tags = ["Amour", "amour", "Paix", "Temps", "Courage", "Espoir", "Doute", "Joie", "Peur", "Calme"]
+    citations = [("Aimer, c'est agir.", "Victor Hugo"), ("Rien ne sert de courir.", "La Fontaine")]
+    client = FakeClient([
+        {"results": [{"id": "1", "tags": raw_tags}, {"id": "2", "tags": []}]},
+        {"results": [{"id": "1", "context": "  Le sens de l'amour est dans les actes du quotidien.  "}]},
+        {"results": [{"id": "1", "need": "élan", "tags": raw_tags}]},
+    ])
+    engine = make_engine(client, cache=ResponseCache(str(tmp_path)))
+
+    tags = generate_tags.call_llm_for_tags_batch(engine, citations)
+    assert list(tags) == [0] and tags[0] == generate_tags.normalize_tags(raw_tags)
+    contexts = generate_context.call_llm_for_context_batch(engine, citations[:1])
+    assert contexts == {0: "Le sens de l'amour est dans les actes du quotidien."}
+    fields = ("need", "tags")
+    values = enrich.call_llm_for_fields_batch(engine, fields, citations[:1])
+    assert values[0]["tags"] == generate_tags.normalize_tags(raw_tags)
+
+    def cached(prompt, schema):
+        return engine.cache.get(ResponseCache.key(engine.model, schema, prompt))
+
+    assert cached(generate_tags.build_prompt(*citations[0]), generate_tags.JSON_SCHEMA) == {"tags": raw_tags}
+    assert cached(generate_tags.build_prompt(*citations[1]), generate_tags.JSON_SCHEMA) is None
+    assert cached(generate_context.build_prompt(*citations[0]), generate_context.JSON_SCHEMA) == {
+        "context": "  Le sens de l'amour est dans les actes du quotidien.  "
+    }
+    assert cached(enrich.build_prompt(fields, *citations[0]), enrich.build_schema(fields)) == {
+        "need": "élan", "tags": raw_tags
+    }
+
+    # Reprise hors ligne: la normalisation est rejouée sur la réponse brute, sans appel réseau
+    offline = make_engine(FakeClient(), cache=ResponseCache(str(tmp_path)), offline=True)
+    assert generate_tags.call_llm_for_tags(offline, *citations[0]) == tags[0]
+
+
+@pytest.mark.parametrize("module_name, field, value", [
+    ("generate_tags", "tags", ["amour", "courage", "paix"]),
+    ("generate_context", "context", "Un contexte rédigé avant le cache."),
+])
+def test_force_offline_cache_miss_keeps_existing_values(tmp_path, monkeypatch, clock, module_name, field, value):
+    """--force --offline sans réponse en cache: la valeur existante reste, seule l'erreur est notée."""
+    module = __import__(module_name)
+    data_path = tmp_path / "citations.json"
+    rows = [
+        {"id": "a", "Citation": "Aimer, c'est agir.", "Auteur": "Victor Hugo", field: value},
+        {"id": "b", "Citation": "Rien ne sert de courir.", "Auteur": "La Fontaine"},
+    ]
+    data_path.write_text(json.dumps(rows), encoding="utf-8")
+    monkeypatch.setattr(module, "INPUT_PATH", str(data_path))
+    monkeypatch.setattr("sys.argv", [f"{module_name}.py", "--force", "--offline", "--cache-dir", str(tmp_path / "cache")])
+
+    module.main()
+
+    first, second = json.loads(data_path.read_text(encoding="utf-8"))
+    assert first[field] == value and first[f"{field}_error"]
+    assert not second[field] and second[f"{field}_error"]
@@ -0,0 +1,225 @@
+"""
+Extraction QuoteKG (RAG/extract_quotekg_final.py) contre un endpoint SPARQL local:
+reprise après interruption (checkpoint), curseur keyset, fusion des lignes d'une même URI.
+"""
+
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from conftest import ROOT
+
+import extract_quotekg_final as qkg
+
+EMOTIONS = ("PositiveEmotion", "NegativeEmotion", "NeutralEmotion")
+
+
+def make_rows(n_quotes: int = 60):
+    """Lignes SPARQL triées par ?quotation; une citation sur trois a 2 ou 3 lignes (jointures OPTIONAL)."""
+    rows = []
+    for i in range(n_quotes):
+        uri = f"https://quotekg.test/resource/q{i:04d}"
+        for j in range(1 + (i % 3 == 0) * (1 + i % 2)):
+            rows.append({
+                "quotation": {"type": "uri", "value": uri},
+                "text": {"type": "literal", "xml:lang": "fr", "value": f"Citation {i}"},
+                "authorLabel": {"type": "literal", "value": f"Auteur {i % 7}"},
+                "emotionCategory": {"type": "uri", "value": f"http://onyx.test/{EMOTIONS[j]}"},
+                "emotionIntensity": {"type": "literal", "value": str(0.1 * (j + 1))},
+            })
+    return rows
+
+
+class SparqlStub:
+    """
+    Endpoint SPARQL minimal: interprète LIMIT / OFFSET et le filtre keyset
+    FILTER(STR(?quotation) > "...") des requêtes de build_sparql_query.
+    block_after: les requêtes suivantes restent en attente de release (processus tué pendant l'attente);
+    fail_after: les requêtes suivantes échouent (HTTP 500).
+    """
+
+    def __init__(self, rows, block_after=None, fail_after=None):
+        self.rows = rows
+        self.block_after = block_after
+        self.fail_after = fail_after
+        self.release = threading.Event()
+        self.requests = []  # (offset, curseur, URIs renvoyées)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+                stub.handle(self, parse_qs(body)["query"][0])
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/sparql"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def answer(self, query: str):
+        limit = int(re.search(r"LIMIT (\d+)", query).group(1))
+        offset = re.search(r"OFFSET (\d+)", query)
+        cursor = re.search(r'FILTER\(STR\(\?quotation\) > "((?:[^"\\]|\\.)*)"\)', query)
+        cursor = cursor.group(1).replace('\\"', '"').replace("\\\\", "\\") if cursor else None
+        rows = self.rows
+        if "ORDER BY ?quotation" in query:
+            rows = [r for r in sorted(rows, key=lambda r: r["quotation"]["value"])
+                    if cursor is None or r["quotation"]["value"] > cursor]
+        start = int(offset.group(1)) if offset else 0
+        return start, cursor, rows[start:start + limit]
+
+    def handle(self, handler, query: str):
+        with self._lock:
+            number = len(self.requests) + 1
+            start, cursor, rows = self.answer(query)
+            self.requests.append((start, cursor, [r["quotation"]["value"] for r in rows]))
+        if self.block_after is not None and number > self.block_after:
+            self.release.wait()
+        if self.fail_after is not None and number > self.fail_after:
+            handler.send_response(500)
+            handler.end_headers()
+            return
+        payload = json.dumps({"head": {"vars": []}, "results": {"bindings": rows}}).encode("utf-8")
+        try:
+            handler.send_response(200)
+            handler.send_header("Content-Type", "application/sparql-results+json")
+            handler.send_header("Content-Length", str(len(payload)))
+            handler.end_headers()
+            handler.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client tué pendant l'attente
+
+
+def read_quotes(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def expected_emotions(rows):
+    out = {}
+    for row in rows:
+        out.setdefault(row["quotation"]["value"], set()).add(qkg.parse_emotion_category(row["emotionCategory"]["value"]))
+    return out
+
+
+def wait_for_checkpoint(path, pages, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        state = qkg.load_checkpoint(path, json.load(open(path))["params"]) if os.path.exists(path) else None
+        if state and len(state["done"]) >= pages:
+            return state
+        time.sleep(0.05)
+    pytest.fail(f"checkpoint de {pages} pages jamais écrit")
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(qkg, "RETRY_DELAY", 0)
+
+
+def test_offset_killed_mid_run_resumes_without_loss_or_duplicates(tmp_path):
+    rows = make_rows()
+    output = str(tmp_path / "quotes.ndjson")
+    checkpoint_path = f"{output}.checkpoint.json"
+    script = (
+        "import sys; sys.path.insert(0, sys.argv[1]); import extract_quotekg_final as q; "
+        "q.fetch_french_quotes(sys.argv[2], page_size=10, concurrency=4, endpoint=sys.argv[3], checkpoint_every=2)"
+    )
+
+    # 6 pages servies, puis le stub bloque: le processus est tué avec des pages en vol
+    with SparqlStub(rows, block_after=6) as stub:
+        proc = subprocess.Popen([sys.executable, "-c", script, str(ROOT / "RAG"), output, stub.endpoint],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            state = wait_for_checkpoint(checkpoint_path, pages=6)
+        finally:
+            proc.send_signal(signal.SIGKILL)
+            proc.wait()
+        assert len(state["done"]) == 6
+        # Écriture interrompue après le checkpoint: tronquée à la reprise
+        with open(output, "ab") as f:
+            f.write(b'{"uri": "https://quotekg.test/resource/q9')
+
+        stub.block_after = None
+        stub.release.set()
+        served_before = len(stub.requests)
+        stats = qkg.fetch_french_quotes(output, page_size=10, concurrency=4, endpoint=stub.endpoint, checkpoint_every=2)
+
+    # Seules les pages absentes du checkpoint sont redemandées
+    resumed = {offset for offset, _, _ in stub.requests[served_before:]}
+    assert not resumed & set(state["done"])
+    assert resumed | set(state["done"]) >= set(range(0, len(rows), 10))
+
+    quotes = read_quotes(output)
+    uris = [q["uri"] for q in quotes]
+    assert len(uris) == len(set(uris))
+    assert set(uris) == set(expected_emotions(rows))
+    assert stats["rows"] == len(rows)
+    # Lignes d'une même URI dans une seule page: fusionnées en une citation avec toutes ses émotions
+    by_uri = {q["uri"]: {e["category"] for e in q["emotions"]} for q in quotes}
+    expected = expected_emotions(rows)
+    pages_of = {}
+    for index, row in enumerate(rows):
+        pages_of.setdefault(row["quotation"]["value"], set()).add(index // 10)
+    merged = [uri for uri, pages in pages_of.items() if len(pages) == 1 and len(expected[uri]) > 1]
+    assert merged and all(by_uri[uri] == expected[uri] for uri in merged)
+
+
+def test_keyset_resume_and_cursor_progression(tmp_path, monkeypatch):
+    monkeypatch.setattr(qkg, "MAX_RETRIES", 1)
+    rows = make_rows()
+    output = str(tmp_path / "quotes.ndjson")
+    checkpoint_path = f"{output}.checkpoint.json"
+
+    # Échec de l'endpoint à la 5e page: l'extraction s'interrompt après 2 checkpoints
+    with SparqlStub(rows, fail_after=4) as stub:
+        with pytest.raises(RuntimeError):
+            qkg.fetch_french_quotes(output, page_size=7, endpoint=stub.endpoint, checkpoint_every=2,
+                                    pagination="keyset")
+        state = json.load(open(checkpoint_path))
+        assert len(state["done"]) == 4
+        first_run = list(stub.requests)
+
+        stub.fail_after = None
+        stats = qkg.fetch_french_quotes(output, page_size=7, endpoint=stub.endpoint, checkpoint_every=2,
+                                        pagination="keyset")
+        second_run = stub.requests[len(first_run):]
+
+    # La reprise part du curseur enregistré
+    assert second_run[0][1] == state["cursor"]
+    for run in (first_run[:4], second_run):
+        for (_, cursor, uris), (_, next_cursor, _) in zip(run, run[1:]):
+            # Page pleine: la dernière URI (peut-être incomplète) est redemandée à la page suivante
+            assert len(uris) == 7
+            assert next_cursor == [u for u in uris if u != uris[-1]][-1]
+            assert cursor is None or next_cursor > cursor
+
+    quotes = read_quotes(output)
+    uris = [q["uri"] for q in quotes]
+    assert uris == sorted(set(uris))
+    expected = expected_emotions(rows)
+    assert set(uris) == set(expected)
+    # Keyset: aucune URI coupée entre deux pages, toutes les lignes sont fusionnées
+    assert {q["uri"]: {e["category"] for e in q["emotions"]} for q in quotes} == expected
+    assert stats["late_duplicates"] == 0
@@ -0,0 +1,42 @@
+"""
+Index vectoriel persistant (RAG/vector_store.py): statistiques de sync() après un restore() périmé.
+"""
+
+import numpy as np
+import pytest
+
+from corpus import compile_quotes
+from vector_store import IvfStore, NumpyStore
+
+
+def make_corpus(ids, suffix=""):
+    return compile_quotes([{"id": qid, "text": f"Citation {qid}{suffix if qid == ids[0] else ''}", "author": "a"}
+                           for qid in ids])
+
+
+def encode(texts):
+    rng = np.random.default_rng(len(texts))
+    return rng.standard_normal((len(texts), 16)).astype(np.float32)
+
+
+@pytest.mark.parametrize("cls", [NumpyStore, IvfStore])
+def test_sync_after_stale_restore_counts_removed_rows(tmp_path, cls):
+    def open_store():
+        return cls(matrix_dir=tmp_path, index_dir=tmp_path / "ivf") if cls is IvfStore else cls(matrix_dir=tmp_path)
+
+    ids = [f"q{i}" for i in range(40)]
+    open_store().sync(make_corpus(ids), encode, "h1")
+
+    # Corpus modifié entre deux démarrages: 5 citations supprimées, 3 ajoutées, 1 modifiée
+    current = ids[5:] + ["n1", "n2", "n3"]
+    corpus = make_corpus(current, suffix=" (modifiée)")
+    store = open_store()
+    assert store.restore(corpus, "h2") is False
+    assert len(store) == 35
+
+    stats = store.sync(corpus, encode, "h2")
+    assert stats == {"added": 3, "updated": 1, "removed": 5, "unchanged": 34}
+    assert store.ids == set(current)
+
+    # Le diff suivant part de l'index reconstruit
+    assert store.sync(corpus, encode, "h2")["removed"] == 0